@@ -0,0 +1,129 @@
+"""Throughput of many concurrent async summaries against a request quota.
+
+Runs ``--jobs`` summaries at once with ``GeminiProcessor.generate_article_async``
+on ``FakeGenerativeModel``. A ``FakeQuota`` answers requests beyond
+``--quota-rpm`` (and ``--error-rate`` of the rest, at random) with a 429, and
+the client-side rate limiter is set to ``--client-rpm`` (the quota by default).
+Reports the sustained request rate as a fraction of the quota, the 429s
+that were retried and the jobs that failed; the goal is a rate close to the
+quota with no failed jobs.
+
+    python -m benchmarks.async_quota --jobs 200 --quota-rpm 600 --error-rate 0.05
+"""
+from typing import Dict, List, Optional
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+from utils.cache import SQLiteCache
+from utils.gemini_processor import GeminiProcessor
+from utils.rate_limiter import DEFAULT_TOKENS_PER_MINUTE, RateLimiter, RetryPolicy
+from utils.summary_cache import SummaryCache
+from .fakes import FakeGenerativeModel, FakeQuota, Fixtures, Latency
+
+
+def build_jobs(fixtures: Fixtures, jobs: int, language: str) -> List[List[Dict]]:
+    """Return ``video_data`` for ``jobs`` distinct single-video jobs."""
+    transcript = " ".join(segment['text'] for segment in fixtures.transcripts[language])
+    return [
+        [{'video_id': f"q{index:06d}", 'url': f"https://www.youtube.com/watch?v=q{index:06d}",
+          'title': f"Video {index}", 'transcript': f"[{index}] {transcript}"}]
+        for index in range(jobs)
+    ]
+
+
+async def run_jobs(processor: GeminiProcessor, jobs: List[List[Dict]], language: str) -> List:
+    return await asyncio.gather(
+        *(processor.generate_article_async(video_data, language=language) for video_data in jobs),
+        return_exceptions=True
+    )
+
+
+def run(config: Dict) -> Dict:
+    fixtures = Fixtures()
+    latency = Latency(scale=config['latency_scale'], seed=config['seed'])
+    quota = FakeQuota(config['quota_rpm'], window=config['window'],
+                      error_rate=config['error_rate'], seed=config['seed'])
+    model = FakeGenerativeModel(fixtures, latency, config['language'], quota=quota)
+    jobs = build_jobs(fixtures, config['jobs'], config['language'])
+
+    with tempfile.TemporaryDirectory(prefix='yts-quota-') as workdir:
+        processor = GeminiProcessor(
+            api_key='benchmark',
+            summary_cache=SummaryCache(local=SQLiteCache(os.path.join(workdir, 'summaries.sqlite3'))),
+            chunk_cache=SQLiteCache(os.path.join(workdir, 'chunks.sqlite3')),
+            rate_limiter=RateLimiter(requests_per_minute=config['client_rpm'],
+                                     tokens_per_minute=config['client_tpm']),
+            retry_policy=RetryPolicy(),
+            max_concurrency=config['concurrency'],
+            model=model
+        )
+        started = time.perf_counter()
+        results = asyncio.run(run_jobs(processor, jobs, config['language']))
+        elapsed = time.perf_counter() - started
+
+    failures = [str(result) for result in results if isinstance(result, Exception)]
+    requests_per_minute = model.calls['gemini_generate'] * 60 / elapsed
+    return {
+        'jobs': config['jobs'],
+        'failed': len(failures),
+        'failures': failures[:5],
+        'elapsed_seconds': round(elapsed, 2),
+        'requests_per_minute': round(requests_per_minute, 1),
+        'quota_rpm': config['quota_rpm'],
+        'quota_utilisation': round(requests_per_minute / config['quota_rpm'], 3),
+        'calls': dict(sorted(model.calls.items())),
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog='python -m benchmarks.async_quota',
+        description='Run concurrent async summaries against a quota that answers with 429s.'
+    )
+    parser.add_argument('--jobs', type=int, default=200, help='summaries generated at once')
+    parser.add_argument('--quota-rpm', type=float, default=600, help='server-side requests per minute')
+    parser.add_argument('--client-rpm', type=float,
+                        help='client rate limiter requests per minute (default: the quota)')
+    parser.add_argument('--client-tpm', type=float, default=DEFAULT_TOKENS_PER_MINUTE,
+                        help='client rate limiter tokens per minute')
+    parser.add_argument('--window', type=float, default=10.0,
+                        help='seconds over which the quota is counted')
+    parser.add_argument('--error-rate', type=float, default=0.05,
+                        help='fraction of in-quota requests that still get a 429')
+    parser.add_argument('--concurrency', type=int, default=8, help='GeminiProcessor.max_concurrency')
+    parser.add_argument('--latency-scale', type=float, default=0.1,
+                        help='multiplier for the injected Gemini latency')
+    parser.add_argument('--language', choices=['ja', 'en', 'zh'], default='ja')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='also write the results to this JSON file')
+    args = parser.parse_args(argv)
+
+    result = run({
+        'jobs': args.jobs,
+        'quota_rpm': args.quota_rpm,
+        'client_rpm': args.client_rpm or args.quota_rpm,
+        'client_tpm': args.client_tpm,
+        'window': args.window,
+        'error_rate': args.error_rate,
+        'concurrency': args.concurrency,
+        'latency_scale': args.latency_scale,
+        'language': args.language,
+        'seed': args.seed,
+    })
+    print(f"jobs={result['jobs']} failed={result['failed']} elapsed={result['elapsed_seconds']}s "
+          f"rpm={result['requests_per_minute']} ({result['quota_utilisation']:.0%} of quota) "
+          f"429s={result['calls'].get('gemini_429', 0)}", file=sys.stderr)
+    for failure in result['failures']:
+        print(f"  {failure}", file=sys.stderr)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(result, f, indent=2)
+    return 0 if result['failed'] == 0 else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
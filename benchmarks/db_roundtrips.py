@@ -0,0 +1,114 @@
+"""Database round trips of saving summaries one by one and in bulk.
+
+Saves ``--count`` summaries (each with ``--videos`` source videos) into a
+fresh LocalClient database three ways and reports the requests each
+needed, plus the wall time with ``--db-latency`` seconds added per request
+to stand in for a remote PostgREST:
+
+- ``probe``: a connection probe before every ``save_summary``, as saves used to do (2N)
+- ``single``: ``save_summary`` per summary (N)
+- ``bulk``: ``save_summaries`` in chunks of ``--chunk-size`` (about N / chunk_size)
+
+Every mode also writes the source videos: three requests per save call.
+
+    python -m benchmarks.db_roundtrips --count 200 --chunk-size 100
+"""
+from typing import Dict, List, Optional
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from utils.db_handler import DatabaseHandler
+from utils.search_index import SearchIndex
+from utils.transcript import Transcript
+from utils.vector_index import HashingEmbedder, VectorIndex
+from .fakes import Fixtures, Latency, SlowLocalClient
+
+
+def build_summaries(fixtures: Fixtures, count: int, videos: int, language: str) -> List[Dict]:
+    """Return ``save_summary`` keyword arguments for ``count`` distinct video sets."""
+    transcript = Transcript.from_entries(fixtures.transcripts[language])
+    summaries = []
+    for index in range(count):
+        video_ids = [f"r{index:05d}{position:03d}" for position in range(videos)]
+        summaries.append({
+            'video_id': video_ids[0],
+            'title': f"Summary {index}",
+            'summary': f"Summary body {index}. " * 50,
+            'language': language,
+            'source_urls': ','.join(f"https://www.youtube.com/watch?v={video_id}"
+                                    for video_id in video_ids),
+            'source_key': f"{language}:{','.join(video_ids)}",
+            'videos': [
+                {'video_id': video_id, 'title': f"Video {video_id}", 'channel_id': 'bench',
+                 'channel_title': 'Benchmark', 'timed_transcript': transcript,
+                 'transcript_track': language}
+                for video_id in video_ids
+            ],
+        })
+    return summaries
+
+
+def run_mode(mode: str, summaries: List[Dict], chunk_size: int, db_latency: float) -> Dict:
+    with tempfile.TemporaryDirectory(prefix='yts-db-') as workdir:
+        client = SlowLocalClient(os.path.join(workdir, 'local.sqlite3'),
+                                 Latency({'db': db_latency}, jitter=0.0))
+        handler = DatabaseHandler(
+            client=client, search_index=SearchIndex(os.path.join(workdir, 'search.sqlite3')),
+            vector_index=VectorIndex(os.path.join(workdir, 'vectors'), HashingEmbedder())
+        )
+        client.request_count = 0
+
+        started = time.perf_counter()
+        if mode == 'bulk':
+            results = handler.save_summaries(summaries, chunk_size=chunk_size)
+            failed = sum(1 for saved, _ in results if not saved)
+        else:
+            failed = 0
+            for summary in summaries:
+                if mode == 'probe':
+                    handler.verify_connection(force=True)
+                try:
+                    handler.save_summary(**summary)
+                except Exception:
+                    failed += 1
+        elapsed = time.perf_counter() - started
+
+        return {
+            'requests': client.request_count,
+            'seconds': round(elapsed, 3),
+            'failed': failed,
+        }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog='python -m benchmarks.db_roundtrips',
+        description='Count database round trips of single and bulk summary saves.'
+    )
+    parser.add_argument('--count', type=int, default=200, help='summaries to save')
+    parser.add_argument('--videos', type=int, default=1, help='source videos per summary')
+    parser.add_argument('--chunk-size', type=int, default=100, help='rows per save_summaries request')
+    parser.add_argument('--db-latency', type=float, default=0.0,
+                        help='seconds added to each database request')
+    parser.add_argument('--language', choices=['ja', 'en', 'zh'], default='ja')
+    parser.add_argument('--output', help='also write the results to this JSON file')
+    args = parser.parse_args(argv)
+
+    summaries = build_summaries(Fixtures(), args.count, args.videos, args.language)
+    results = {mode: run_mode(mode, summaries, args.chunk_size, args.db_latency)
+               for mode in ('probe', 'single', 'bulk')}
+    for mode, result in results.items():
+        print(f"{mode:<7} {result['requests']:>6} requests  {result['seconds']:>8.3f} s  "
+              f"failed={result['failed']}", file=sys.stderr)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'count': args.count, 'videos': args.videos,
+                       'chunk_size': args.chunk_size, 'results': results}, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,345 @@
+"""Offline stand-ins for the YouTube, transcript, Gemini and database APIs.
+
+Each fake replays the recorded responses in ``benchmarks/fixtures`` and
+sleeps for an injected latency before answering, so the real handlers can
+be benchmarked without network access or API keys. Calls are counted per
+operation in ``calls``.
+"""
+from collections import Counter
+from typing import Dict, Iterator, List, Optional
+import asyncio
+import copy
+import json
+import os
+import random
+import threading
+import time
+import zlib
+from google.api_core.exceptions import ResourceExhausted
+from googleapiclient.errors import HttpError
+import httplib2
+from utils.gemini_processor import MAP_PROMPTS
+from utils.local_db import LocalClient
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+# 各APIの応答時間（秒）の既定値。実測値をもとにした目安
+DEFAULT_LATENCY = {
+    'videos_list': 0.08,        # videos.list 1リクエスト
+    'playlist_items': 0.1,      # playlistItems.list 1リクエスト
+    'transcript_list': 0.15,    # 字幕一覧の取得
+    'transcript': 0.3,          # 字幕1件の取得
+    'gemini_generate': 1.2,     # ストリーミングしない生成（mapフェーズ）
+    'gemini_first_chunk': 0.8,  # ストリーミングの最初のチャンクまで
+    'gemini_chunk': 0.04,       # ストリーミングの後続チャンクの間隔
+    'db': 0.03,                 # データベースへの1リクエスト
+}
+
+# ストリーミング応答の1チャンクあたりの文字数
+STREAM_CHUNK_CHARS = 60
+
+
+class Fixtures:
+    """Recorded API responses loaded from a fixtures directory."""
+
+    def __init__(self, directory: str = FIXTURES_DIR):
+        def load(name: str):
+            with open(os.path.join(directory, name), encoding='utf-8') as f:
+                return json.load(f)
+
+        self.videos = load('videos.json')['items']
+        self.playlist_items = load('playlist_items.json')
+        self.transcripts = load('transcripts.json')
+        self.gemini = load('gemini.json')
+
+    def video_item(self, video_id: str) -> Dict:
+        """Return a recorded videos.list item re-labelled as ``video_id``."""
+        item = copy.deepcopy(self.videos[zlib.crc32(video_id.encode()) % len(self.videos)])
+        item['id'] = video_id
+        return item
+
+
+class Latency:
+    """Injected delays: a mean per operation, scaled and jittered reproducibly."""
+
+    def __init__(self, overrides: Optional[Dict[str, float]] = None, scale: float = 1.0,
+                 jitter: float = 0.2, seed: int = 0):
+        self.means = dict(DEFAULT_LATENCY, **(overrides or {}))
+        self.scale = scale
+        self.jitter = jitter
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def delay(self, operation: str) -> float:
+        mean = self.means[operation] * self.scale
+        if mean <= 0:
+            return 0.0
+        with self._lock:
+            factor = self._random.uniform(1 - self.jitter, 1 + self.jitter)
+        return mean * factor
+
+    def sleep(self, operation: str) -> None:
+        seconds = self.delay(operation)
+        if seconds > 0:
+            time.sleep(seconds)
+
+    async def sleep_async(self, operation: str) -> None:
+        seconds = self.delay(operation)
+        if seconds > 0:
+            await asyncio.sleep(seconds)
+
+
+class CallCounter:
+    """Thread-safe count of calls per operation."""
+
+    def __init__(self):
+        self.calls: Counter = Counter()
+        self._calls_lock = threading.Lock()
+
+    def _count(self, operation: str) -> None:
+        with self._calls_lock:
+            self.calls[operation] += 1
+
+
+class _Request:
+    """Mimics googleapiclient's HttpRequest: the call happens on ``execute``."""
+
+    def __init__(self, handler, params: Dict):
+        self._handler = handler
+        self._params = params
+        self.headers: Dict[str, str] = {}
+
+    def execute(self, http=None, num_retries: int = 0) -> Dict:
+        return self._handler(headers=self.headers, **self._params)
+
+
+class _Collection:
+    def __init__(self, handler):
+        self._handler = handler
+
+    def list(self, **params) -> _Request:
+        return _Request(self._handler, params)
+
+
+class FakeYouTube(CallCounter):
+    """Replacement for the ``build('youtube', 'v3')`` resource."""
+
+    def __init__(self, fixtures: Fixtures, latency: Latency):
+        super().__init__()
+        self.fixtures = fixtures
+        self.latency = latency
+
+    def videos(self) -> _Collection:
+        return _Collection(self._videos_list)
+
+    def playlistItems(self) -> _Collection:
+        return _Collection(self._playlist_items_list)
+
+    def _videos_list(self, part: str, id: str, **params) -> Dict:
+        self._count('videos_list')
+        self.latency.sleep('videos_list')
+        return {
+            'kind': 'youtube#videoListResponse',
+            'items': [self.fixtures.video_item(video_id) for video_id in id.split(',') if video_id]
+        }
+
+    def _playlist_items_list(self, part: str, playlistId: str, maxResults: int = 5,
+                             headers: Optional[Dict] = None, **params) -> Dict:
+        self._count('playlist_items')
+        self.latency.sleep('playlist_items')
+        response = copy.deepcopy(self.fixtures.playlist_items)
+        if (headers or {}).get('If-None-Match') == response['etag']:
+            # 実際のAPIと同様、変更がなければ 304 を返す（HttpError になる）
+            raise HttpError(httplib2.Response({'status': 304}), b'')
+        response['items'] = response['items'][:maxResults]
+        return response
+
+
+class _FakeTranscript:
+    """One caption track of a video, as returned by ``list_transcripts``."""
+
+    def __init__(self, api: 'FakeTranscriptApi', video_id: str, language_code: str,
+                 is_generated: bool, translation_languages: List[Dict]):
+        self._api = api
+        self.video_id = video_id
+        self.language_code = language_code
+        self.is_generated = is_generated
+        self.translation_languages = translation_languages
+
+    def translate(self, language_code: str) -> '_FakeTranscript':
+        if not any(language['language_code'] == language_code
+                   for language in self.translation_languages):
+            raise Exception(f"Translation to {language_code} is not available")
+        return _FakeTranscript(self._api, self.video_id, language_code, self.is_generated, [])
+
+    def fetch(self) -> List[Dict]:
+        return self._api._fetch(self.video_id, self.language_code.split('-')[0])
+
+
+class _FakeTranscriptList:
+    def __init__(self, transcripts: List[_FakeTranscript]):
+        self._transcripts = transcripts
+
+    def __iter__(self):
+        return iter(self._transcripts)
+
+    def _find(self, language_codes: List[str], generated: bool) -> _FakeTranscript:
+        for code in language_codes:
+            for transcript in self._transcripts:
+                if transcript.language_code == code and transcript.is_generated == generated:
+                    return transcript
+        raise Exception(f"No transcript found for {language_codes}")
+
+    def find_manually_created_transcript(self, language_codes: List[str]) -> _FakeTranscript:
+        return self._find(language_codes, False)
+
+    def find_generated_transcript(self, language_codes: List[str]) -> _FakeTranscript:
+        return self._find(language_codes, True)
+
+
+class FakeTranscriptApi(CallCounter):
+    """Replacement for ``YouTubeTranscriptApi``.
+
+    Every video has one manual caption track in ``language`` that YouTube
+    can translate into the other fixture languages (a translation replays
+    the recorded transcript of the target language). The recorded segments
+    are cycled to ``segments`` entries; the video ID and cycle number are
+    added to the first segment of each cycle so no two transcript chunks
+    are identical (the chunk cache would otherwise turn repeats into hits).
+    """
+
+    def __init__(self, fixtures: Fixtures, latency: Latency, language: str,
+                 segments: int = 300):
+        super().__init__()
+        self.fixtures = fixtures
+        self.latency = latency
+        self.language = language
+        self.segments = segments
+
+    def list_transcripts(self, video_id: str) -> _FakeTranscriptList:
+        self._count('transcript_list')
+        self.latency.sleep('transcript_list')
+        translations = [
+            {'language': code, 'language_code': 'zh-Hans' if code == 'zh' else code}
+            for code in self.fixtures.transcripts if code != self.language
+        ]
+        language_code = 'zh-Hans' if self.language == 'zh' else self.language
+        return _FakeTranscriptList([
+            _FakeTranscript(self, video_id, language_code, False, translations)
+        ])
+
+    def _fetch(self, video_id: str, language: str) -> List[Dict]:
+        self._count('transcript')
+        self.latency.sleep('transcript')
+        recorded = self.fixtures.transcripts[language]
+        cycle_length = recorded[-1]['start'] + recorded[-1]['duration']
+        entries = []
+        for index in range(self.segments):
+            cycle, position = divmod(index, len(recorded))
+            entry = dict(recorded[position])
+            entry['start'] = round(entry['start'] + cycle * cycle_length, 2)
+            if position == 0:
+                entry['text'] = f"[{video_id} {cycle}] {entry['text']}"
+            entries.append(entry)
+        return entries
+
+
+class _Response:
+    def __init__(self, text: str):
+        self.text = text
+
+
+class FakeQuota:
+    """Server-side request quota that answers excess requests with a 429.
+
+    At most ``requests_per_minute * window / 60`` requests are accepted in
+    any ``window`` seconds; on top of that ``error_rate`` of the requests
+    fail at random, like the occasional 429 a shared project sees.
+    """
+
+    def __init__(self, requests_per_minute: float, window: float = 10.0,
+                 error_rate: float = 0.0, seed: int = 0):
+        self.limit = max(1, int(requests_per_minute * window / 60))
+        self.window = window
+        self.error_rate = error_rate
+        self._accepted: List[float] = []
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def check(self) -> None:
+        """Raise ``ResourceExhausted`` if this request is over quota."""
+        with self._lock:
+            now = time.monotonic()
+            self._accepted = [at for at in self._accepted if at > now - self.window]
+            if len(self._accepted) >= self.limit:
+                raise ResourceExhausted("Quota exceeded: requests per minute")
+            if self._random.random() < self.error_rate:
+                raise ResourceExhausted("Resource has been exhausted (injected)")
+            self._accepted.append(now)
+
+
+class FakeGenerativeModel(CallCounter):
+    """Replacement for ``genai.GenerativeModel``.
+
+    Map-phase prompts get the recorded notes, everything else the recorded
+    summary for ``language``. Streamed responses are split into
+    ``STREAM_CHUNK_CHARS`` chunks. With a ``quota``, requests it rejects
+    fail with ``ResourceExhausted`` (counted as ``gemini_429``).
+    """
+
+    def __init__(self, fixtures: Fixtures, latency: Latency, language: str,
+                 quota: Optional[FakeQuota] = None):
+        super().__init__()
+        self.latency = latency
+        self.responses = fixtures.gemini[language]
+        self.quota = quota
+
+    def _check_quota(self) -> None:
+        if self.quota is None:
+            return
+        try:
+            self.quota.check()
+        except ResourceExhausted:
+            self._count('gemini_429')
+            raise
+
+    def _text(self, prompt: str) -> str:
+        if any(prompt.startswith(map_prompt) for map_prompt in MAP_PROMPTS.values()):
+            return self.responses['notes']
+        return self.responses['summary']
+
+    def generate_content(self, prompt: str, generation_config=None, stream: bool = False):
+        self._check_quota()
+        text = self._text(prompt)
+        if stream:
+            self._count('gemini_stream')
+            self.latency.sleep('gemini_first_chunk')
+            return self._stream(text)
+        self._count('gemini_generate')
+        self.latency.sleep('gemini_generate')
+        return _Response(text)
+
+    def _stream(self, text: str) -> Iterator[_Response]:
+        for start in range(0, len(text), STREAM_CHUNK_CHARS):
+            if start:
+                self.latency.sleep('gemini_chunk')
+            yield _Response(text[start:start + STREAM_CHUNK_CHARS])
+
+    async def generate_content_async(self, prompt: str, generation_config=None) -> _Response:
+        self._check_quota()
+        self._count('gemini_generate')
+        await self.latency.sleep_async('gemini_generate')
+        return _Response(self._text(prompt))
+
+
+class SlowLocalClient(LocalClient):
+    """LocalClient that waits ``db`` latency per request, like a remote PostgREST."""
+
+    def __init__(self, path: str, latency: Latency):
+        super().__init__(path)
+        self.latency = latency
+
+    def _execute(self, query):
+        # 待機はロックの外で行い、同時リクエストが直列化されないようにする
+        self.latency.sleep('db')
+        return super()._execute(query)
@@ -0,0 +1,102 @@
+"""Wall time of ``YouTubeHandler.process_videos`` with one slow video.
+
+Fetches ``--urls`` videos through ``FakeYouTube`` and ``FakeTranscriptApi``
+with empty caches, once with ``max_workers=1`` (one request at a time, as
+before the fetches ran in parallel) and once with the default pool. The
+transcript of the first video takes ``--slow-factor`` times the usual
+latency. With the parallel pool the wall time should stay close to that
+slowest video rather than the sum of all of them.
+
+    python -m benchmarks.process_videos --urls 10 --slow-factor 5
+"""
+from typing import Dict, List, Optional
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from utils.cache import SQLiteCache
+from utils.youtube_handler import YouTubeHandler
+from .fakes import DEFAULT_LATENCY, FakeTranscriptApi, FakeYouTube, Fixtures, Latency
+
+
+class SlowVideoTranscriptApi(FakeTranscriptApi):
+    """FakeTranscriptApi whose transcript of ``slow_video_id`` takes longer."""
+
+    def __init__(self, fixtures: Fixtures, latency: Latency, language: str,
+                 slow_video_id: str, extra_seconds: float):
+        super().__init__(fixtures, latency, language)
+        self.slow_video_id = slow_video_id
+        self.extra_seconds = extra_seconds
+
+    def _fetch(self, video_id: str, language: str) -> List[Dict]:
+        if video_id == self.slow_video_id:
+            time.sleep(self.extra_seconds)
+        return super()._fetch(video_id, language)
+
+
+def run_mode(max_workers: Optional[int], video_ids: List[str], config: Dict) -> Dict:
+    fixtures = Fixtures()
+    latency = Latency(scale=config['latency_scale'], jitter=0.0)
+    transcript_api = SlowVideoTranscriptApi(
+        fixtures, latency, config['language'], video_ids[0],
+        latency.delay('transcript') * (config['slow_factor'] - 1)
+    )
+    urls = [f"https://www.youtube.com/watch?v={video_id}" for video_id in video_ids]
+
+    with tempfile.TemporaryDirectory(prefix='yts-videos-') as workdir:
+        handler = YouTubeHandler(
+            api_key='benchmark',
+            transcript_cache=SQLiteCache(os.path.join(workdir, 'transcripts.sqlite3')),
+            channel_cache=SQLiteCache(os.path.join(workdir, 'channel_feeds.sqlite3')),
+            youtube=FakeYouTube(fixtures, latency),
+            transcript_api=transcript_api
+        )
+        started = time.perf_counter()
+        results = handler.process_videos(urls, max_workers=max_workers, language=config['language'])
+        elapsed = time.perf_counter() - started
+
+    return {
+        'seconds': round(elapsed, 3),
+        'failed': sum(1 for result in results if 'error' in result),
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog='python -m benchmarks.process_videos',
+        description='Time process_videos sequentially and in parallel with one slow video.'
+    )
+    parser.add_argument('--urls', type=int, default=10, help='videos per call')
+    parser.add_argument('--slow-factor', type=float, default=5.0,
+                        help='transcript latency of the first video, as a multiple of the usual one')
+    parser.add_argument('--latency-scale', type=float, default=1.0,
+                        help='multiplier for the injected API latency')
+    parser.add_argument('--language', choices=['ja', 'en', 'zh'], default='ja')
+    parser.add_argument('--output', help='also write the results to this JSON file')
+    args = parser.parse_args(argv)
+
+    config = {'slow_factor': args.slow_factor, 'latency_scale': args.latency_scale,
+              'language': args.language}
+    video_ids = [f"p{index:010d}" for index in range(args.urls)]
+    # 最も遅い動画1本を取得する時間（字幕一覧 + 遅い字幕）
+    slowest = args.latency_scale * (DEFAULT_LATENCY['transcript_list']
+                                    + DEFAULT_LATENCY['transcript'] * args.slow_factor)
+    results = {
+        'sequential': run_mode(1, video_ids, config),
+        'parallel': run_mode(None, video_ids, config),
+    }
+    for mode, result in results.items():
+        print(f"{mode:<10} {result['seconds']:>8.3f} s  ({result['seconds'] / slowest:.2f}x slowest video)  "
+              f"failed={result['failed']}", file=sys.stderr)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'urls': args.urls, 'slow_factor': args.slow_factor,
+                       'latency_scale': args.latency_scale,
+                       'slowest_video_seconds': round(slowest, 3), 'results': results}, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,331 @@
+"""Offline end-to-end benchmark of the summary pipeline.
+
+Runs ``run_summary`` through the real YouTubeHandler, GeminiProcessor and
+DatabaseHandler, with the APIs replaced by the replaying fakes in
+``benchmarks.fakes`` and the database by a SQLite LocalClient. Every
+scenario (number of URLs x language) runs in a fresh process with empty
+caches and reports latency percentiles, throughput, API call counts and
+peak RSS. Results are written as JSON so runs on different commits can be
+compared.
+
+    python -m benchmarks.run --urls 1 10 100 --languages ja en zh --iterations 3
+    python -m benchmarks.run --latency-scale 0 --compare benchmarks/results/abc1234.json
+"""
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Dict, List, Optional
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+
+# 比較時に表示する指標（値が大きいほど悪いものは True）
+COMPARED_METRICS = [
+    ('latency_seconds.p50', True),
+    ('latency_seconds.p95', True),
+    ('latency_seconds.p99', True),
+    ('throughput.videos_per_second', False),
+    ('peak_rss_mb', True),
+]
+
+
+def percentile(values: List[float], q: float) -> float:
+    """Linearly interpolated percentile (``q`` in 0-100) of ``values``."""
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    position = (len(ordered) - 1) * q / 100
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+def latency_summary(values: List[float]) -> Dict[str, float]:
+    if not values:
+        return {}
+    return {
+        'p50': round(percentile(values, 50), 4),
+        'p95': round(percentile(values, 95), 4),
+        'p99': round(percentile(values, 99), 4),
+        'mean': round(sum(values) / len(values), 4),
+        'min': round(min(values), 4),
+        'max': round(max(values), 4),
+    }
+
+
+def peak_rss_mb() -> Optional[float]:
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux は KB、macOS はバイト単位
+    divisor = 1024 * 1024 if sys.platform == 'darwin' else 1024
+    return round(peak / divisor, 1)
+
+
+def scenario_name(urls: int, language: str) -> str:
+    return f"{urls}-{language}"
+
+
+def run_scenario(config: Dict) -> Dict:
+    """Run one scenario and return its results (meant for a fresh process)."""
+    from utils.cache import SQLiteCache
+    from utils.db_handler import DatabaseHandler
+    from utils.gemini_processor import CHUNK_CACHE_MAX_BYTES, CHUNK_CACHE_TTL, GeminiProcessor
+    from utils.pipeline import run_summary
+    from utils.rate_limiter import RateLimiter
+    from utils.search_index import SearchIndex
+    from utils.summary_cache import SUMMARY_CACHE_MAX_BYTES, SUMMARY_CACHE_TTL, SummaryCache
+    from utils.vector_index import HashingEmbedder, VectorIndex
+    from utils.youtube_handler import TRANSCRIPT_CACHE_MAX_BYTES, TRANSCRIPT_CACHE_TTL, YouTubeHandler
+    from .fakes import (FakeGenerativeModel, FakeTranscriptApi, FakeYouTube, Fixtures,
+                        Latency, SlowLocalClient)
+
+    language = config['language']
+    fixtures = Fixtures()
+    latency = Latency(config['latency'], scale=config['latency_scale'], seed=config['seed'])
+
+    with tempfile.TemporaryDirectory(prefix='yts-bench-') as workdir:
+        def path(name: str) -> str:
+            return os.path.join(workdir, f"{name}.sqlite3")
+
+        youtube = FakeYouTube(fixtures, latency)
+        transcript_api = FakeTranscriptApi(fixtures, latency, config['caption_language'] or language,
+                                           config['segments'])
+        model = FakeGenerativeModel(fixtures, latency, language)
+        client = SlowLocalClient(path('local'), latency)
+
+        db_handler = DatabaseHandler(
+            client=client, search_index=SearchIndex(path('search')),
+            vector_index=VectorIndex(os.path.join(workdir, 'vectors'), HashingEmbedder())
+        )
+        youtube_handler = YouTubeHandler(
+            api_key='benchmark',
+            transcript_cache=SQLiteCache(path('transcripts'), ttl=TRANSCRIPT_CACHE_TTL,
+                                         max_bytes=TRANSCRIPT_CACHE_MAX_BYTES),
+            youtube=youtube,
+            transcript_api=transcript_api,
+            transcript_store=db_handler
+        )
+        gemini_processor = GeminiProcessor(
+            api_key='benchmark',
+            summary_cache=SummaryCache(
+                local=SQLiteCache(path('summaries'), ttl=SUMMARY_CACHE_TTL,
+                                  max_bytes=SUMMARY_CACHE_MAX_BYTES),
+                db_handler=db_handler
+            ),
+            chunk_cache=SQLiteCache(path('chunk_summaries'), ttl=CHUNK_CACHE_TTL,
+                                    max_bytes=CHUNK_CACHE_MAX_BYTES),
+            # クォータ待ちは計測対象外
+            rate_limiter=RateLimiter(requests_per_minute=10 ** 6, tokens_per_minute=10 ** 9),
+            model=model
+        )
+
+        def request(iteration: int) -> Dict:
+            # 既定では毎回別の動画にしてキャッシュを効かせない（--warm で同じ動画を再利用）
+            batch = 0 if config['warm'] else iteration
+            urls = [f"https://www.youtube.com/watch?v=b{batch:04d}{index:06d}"
+                    for index in range(config['urls'])]
+            started = time.perf_counter()
+            try:
+                result = run_summary(youtube_handler, gemini_processor, db_handler, urls, language)
+                error = result['save_error'] or (None if result['article'] else 'no article')
+            except Exception as e:
+                result, error = None, str(e)
+            return {'seconds': time.perf_counter() - started, 'result': result, 'error': error}
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=config['concurrency']) as executor:
+            runs = list(executor.map(request, range(config['iterations'])))
+        elapsed = time.perf_counter() - started
+
+        stage_seconds: Dict[str, List[float]] = {}
+        for run in runs:
+            for timing in (run['result'] or {}).get('timings', []):
+                stage_seconds.setdefault(timing['stage'], []).append(timing['seconds'])
+
+        calls = {}
+        for fake in (youtube, transcript_api, model):
+            calls.update(fake.calls)
+        calls['db'] = client.request_count
+
+    completed = [run for run in runs if run['error'] is None]
+    return {
+        'name': scenario_name(config['urls'], language),
+        'urls': config['urls'],
+        'language': language,
+        'iterations': config['iterations'],
+        'concurrency': config['concurrency'],
+        'errors': [run['error'] for run in runs if run['error'] is not None],
+        'latency_seconds': latency_summary([run['seconds'] for run in completed]),
+        'throughput': {
+            'requests_per_second': round(len(completed) / elapsed, 4),
+            'videos_per_second': round(len(completed) * config['urls'] / elapsed, 4),
+        },
+        'stages_p50_seconds': {
+            stage: round(percentile(values, 50), 4) for stage, values in stage_seconds.items()
+        },
+        'calls': dict(sorted(calls.items())),
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+
+def git_revision() -> Dict:
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=root,
+                                capture_output=True, text=True, check=True).stdout.strip()
+        dirty = bool(subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'],
+                                    cwd=root, capture_output=True, text=True).stdout.strip())
+    except (OSError, subprocess.CalledProcessError):
+        return {'commit': None, 'dirty': None}
+    return {'commit': commit, 'dirty': dirty}
+
+
+def lookup(result: Dict, dotted: str) -> Optional[float]:
+    value = result
+    for part in dotted.split('.'):
+        if not isinstance(value, dict) or part not in value:
+            return None
+        value = value[part]
+    return value
+
+
+def compare(baseline: Dict, current: Dict) -> List[str]:
+    """Describe the change of each compared metric per scenario."""
+    previous = {scenario['name']: scenario for scenario in baseline['scenarios']}
+    lines = [f"baseline {baseline['revision'].get('commit')} -> "
+             f"current {current['revision'].get('commit')}"]
+    for scenario in current['scenarios']:
+        old = previous.get(scenario['name'])
+        if old is None:
+            lines.append(f"{scenario['name']}: not in baseline")
+            continue
+        for metric, lower_is_better in COMPARED_METRICS:
+            before, after = lookup(old, metric), lookup(scenario, metric)
+            if not before or after is None:
+                continue
+            change = (after - before) / before * 100
+            worse = change > 0 if lower_is_better else change < 0
+            flag = '  (regression)' if worse and abs(change) >= 10 else ''
+            lines.append(f"{scenario['name']:>8} {metric:<30} {before:>10.4f} -> "
+                         f"{after:>10.4f} {change:+7.1f}%{flag}")
+    return lines
+
+
+def parse_latency(values: List[str]) -> Dict[str, float]:
+    from .fakes import DEFAULT_LATENCY
+
+    latency = {}
+    for value in values:
+        name, _, seconds = value.partition('=')
+        if name not in DEFAULT_LATENCY or not seconds:
+            raise argparse.ArgumentTypeError(
+                f"--latency expects NAME=SECONDS with NAME in {', '.join(DEFAULT_LATENCY)}"
+            )
+        latency[name] = float(seconds)
+    return latency
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog='python -m benchmarks.run',
+        description='Benchmark the summary pipeline offline against recorded API responses.'
+    )
+    parser.add_argument('--urls', type=int, nargs='+', default=[1, 10, 100],
+                        help='number of URLs per request, one scenario each')
+    parser.add_argument('--languages', nargs='+', choices=['ja', 'en', 'zh'], default=['ja', 'en', 'zh'])
+    parser.add_argument('--iterations', type=int, default=3, help='requests per scenario')
+    parser.add_argument('--concurrency', type=int, default=1, help='requests run at the same time')
+    parser.add_argument('--segments', type=int, default=300, help='transcript segments per video')
+    parser.add_argument('--caption-language', choices=['ja', 'en', 'zh'],
+                        help='language of the videos\' captions (default: the summary language)')
+    parser.add_argument('--latency', nargs='*', default=[], metavar='NAME=SECONDS',
+                        help='override a mean injected latency, e.g. gemini_generate=2.0')
+    parser.add_argument('--latency-scale', type=float, default=1.0,
+                        help='multiply all injected latencies (0 measures CPU time only)')
+    parser.add_argument('--seed', type=int, default=0, help='seed for latency jitter')
+    parser.add_argument('--warm', action='store_true',
+                        help='reuse the same videos in every iteration so the caches are hit')
+    parser.add_argument('--in-process', action='store_true',
+                        help='run scenarios in this process (peak RSS is then cumulative)')
+    parser.add_argument('--output', help='result file (default: benchmarks/results/<commit>.json)')
+    parser.add_argument('--compare', metavar='BASELINE', help='print changes against a previous result file')
+    args = parser.parse_args(argv)
+
+    try:
+        latency = parse_latency(args.latency)
+    except argparse.ArgumentTypeError as e:
+        parser.error(str(e))
+
+    configs = [
+        {'urls': urls, 'language': language, 'iterations': args.iterations,
+         'concurrency': args.concurrency, 'segments': args.segments,
+         'caption_language': args.caption_language, 'latency': latency,
+         'latency_scale': args.latency_scale, 'seed': args.seed, 'warm': args.warm}
+        for urls in args.urls for language in args.languages
+    ]
+
+    scenarios = []
+    for config in configs:
+        name = scenario_name(config['urls'], config['language'])
+        print(f"running {name} ...", file=sys.stderr)
+        if args.in_process:
+            scenario = run_scenario(config)
+        else:
+            # シナリオごとに新しいプロセスで実行し、ピークRSSを個別に測る
+            context = multiprocessing.get_context('spawn')
+            with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                scenario = executor.submit(run_scenario, config).result()
+        latency_seconds = scenario['latency_seconds']
+        print(f"  p50={latency_seconds.get('p50')}s p95={latency_seconds.get('p95')}s "
+              f"videos/s={scenario['throughput']['videos_per_second']} "
+              f"rss={scenario['peak_rss_mb']}MB errors={len(scenario['errors'])}",
+              file=sys.stderr)
+        scenarios.append(scenario)
+
+    from .fakes import DEFAULT_LATENCY
+    revision = git_revision()
+    results = {
+        'revision': revision,
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'config': {
+            'iterations': args.iterations,
+            'concurrency': args.concurrency,
+            'segments': args.segments,
+            'caption_language': args.caption_language,
+            'latency': dict(DEFAULT_LATENCY, **latency),
+            'latency_scale': args.latency_scale,
+            'seed': args.seed,
+            'warm': args.warm,
+        },
+        'scenarios': scenarios,
+    }
+
+    output = args.output
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        suffix = '-dirty' if revision['dirty'] else ''
+        output = os.path.join(RESULTS_DIR, f"{revision['commit'] or 'unknown'}{suffix}.json")
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+    print(f"results written to {output}", file=sys.stderr)
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+        print('\n'.join(compare(baseline, results)))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,168 @@
+"""Microbenchmark of transcript preprocessing on large transcripts.
+
+Compares the previous implementations (kept here as the baseline) with
+``utils.transcript_normalizer`` and the offset-based chunker in
+``utils.text_chunker``, on transcripts of about ``--size`` bytes built from
+the recorded fixtures.
+
+    python -m benchmarks.text_preprocessing --size 1000000 --repeat 5
+"""
+from typing import Callable, Dict, List, Optional
+import argparse
+import json
+import re
+import sys
+import time
+from utils.prompt_packer import truncate_to_tokens
+from utils.text_chunker import CJK_SENTENCE_ENDINGS, chunk_text, estimate_tokens
+from utils.transcript_normalizer import normalize_transcript, to_ascii_punctuation
+from .fakes import Fixtures
+
+CHUNK_TOKENS = 1500
+TRUNCATE_TOKENS = 2000
+
+
+# --- 変更前の実装（比較用） ---
+
+def legacy_preprocess_chinese_text(text: str) -> str:
+    text = re.sub(r'([^\x00-\xff])\s+([^\x00-\xff])', r'\1\2', text)
+    text = re.sub(f'([{CJK_SENTENCE_ENDINGS}])\\s*', r'\1\n', text)
+    text = text.replace('：', ':').replace('，', ',').replace('"', '"').replace('"', '"')
+    return text
+
+
+_LEGACY_SENTENCE_END = re.compile(r'(?<=[.!?])\s+|(?<=[' + CJK_SENTENCE_ENDINGS + r'])\s*')
+_LEGACY_CJK_CHAR = re.compile('[\u3000-\u303f\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uff00-\uffef]')
+
+
+def _legacy_join(parts: List[str]) -> str:
+    text = ''
+    for part in parts:
+        if text and not _LEGACY_CJK_CHAR.match(text[-1]):
+            text += ' '
+        text += part
+    return text
+
+
+def _legacy_split_oversized(sentence: str, max_tokens: int) -> List[str]:
+    pieces = []
+    while estimate_tokens(sentence) > max_tokens:
+        cut = min(len(sentence), max_tokens * 4)
+        while cut > 1 and estimate_tokens(sentence[:cut]) > max_tokens:
+            cut = cut * 3 // 4
+        space = sentence.rfind(' ', 0, cut)
+        if space > cut // 2:
+            cut = space
+        pieces.append(sentence[:cut].strip())
+        sentence = sentence[cut:].strip()
+    if sentence:
+        pieces.append(sentence)
+    return pieces
+
+
+def legacy_chunk_text(text: str, max_tokens: int) -> List[str]:
+    chunks = []
+    current: List[str] = []
+    current_tokens = 0
+    for sentence in [s for s in _LEGACY_SENTENCE_END.split(text) if s.strip()]:
+        tokens = estimate_tokens(sentence)
+        pieces = _legacy_split_oversized(sentence, max_tokens) if tokens > max_tokens else [sentence]
+        for piece in pieces:
+            piece_tokens = estimate_tokens(piece) if len(pieces) > 1 else tokens
+            if current and current_tokens + piece_tokens > max_tokens:
+                chunks.append(_legacy_join(current))
+                current = []
+                current_tokens = 0
+            current.append(piece)
+            current_tokens += piece_tokens
+    if current:
+        chunks.append(_legacy_join(current))
+    return chunks
+
+
+def legacy_truncate_to_tokens(text: str, max_tokens: int) -> str:
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    chunks = legacy_chunk_text(text, max_tokens)
+    return chunks[0] if chunks else ''
+
+
+# --- 計測 ---
+
+def build_transcript(fixtures: Fixtures, language: str, size: int) -> str:
+    """Join recorded segments (as get_transcript does) until ``size`` UTF-8 bytes."""
+    segments = fixtures.transcripts[language]
+    parts = []
+    total = 0
+    cycle = 0
+    while total < size:
+        for segment in segments:
+            text = segment['text'] if cycle == 0 else f"{segment['text']} {cycle}"
+            parts.append(text)
+            total += len(text.encode('utf-8')) + 1
+        cycle += 1
+    return " ".join(parts)
+
+
+def best_of(fn: Callable[[], object], repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+def run(size: int, repeat: int, languages: List[str]) -> Dict:
+    fixtures = Fixtures()
+    results = {}
+    for language in languages:
+        raw = build_transcript(fixtures, language, size)
+        normalized = normalize_transcript(raw)
+        cases = {
+            # 変更前は中国語の要約のときだけ前処理していた（句読点の置き換えも中国語のみ）
+            'normalize': (lambda: legacy_preprocess_chinese_text(raw),
+                          (lambda: to_ascii_punctuation(normalize_transcript(raw))) if language == 'zh'
+                          else (lambda: normalize_transcript(raw))),
+            'chunk': (lambda: legacy_chunk_text(normalized, CHUNK_TOKENS),
+                      lambda: chunk_text(normalized, CHUNK_TOKENS)),
+            'truncate': (lambda: legacy_truncate_to_tokens(normalized, TRUNCATE_TOKENS),
+                         lambda: truncate_to_tokens(normalized, TRUNCATE_TOKENS)),
+        }
+        results[language] = {'bytes': len(raw.encode('utf-8'))}
+        for name, (legacy, current) in cases.items():
+            before = best_of(legacy, repeat)
+            after = best_of(current, repeat)
+            results[language][name] = {
+                'legacy_ms': round(before * 1000, 2),
+                'current_ms': round(after * 1000, 2),
+                'speedup': round(before / after, 2) if after else None,
+            }
+    return results
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog='python -m benchmarks.text_preprocessing',
+        description='Compare transcript preprocessing before and after the normaliser.'
+    )
+    parser.add_argument('--size', type=int, default=1_000_000, help='transcript size in bytes')
+    parser.add_argument('--repeat', type=int, default=5, help='runs per case (best is reported)')
+    parser.add_argument('--languages', nargs='+', choices=['ja', 'en', 'zh'], default=['ja', 'en', 'zh'])
+    parser.add_argument('--output', help='also write the results to this JSON file')
+    args = parser.parse_args(argv)
+
+    results = run(args.size, args.repeat, args.languages)
+    for language, cases in results.items():
+        for name in ('normalize', 'chunk', 'truncate'):
+            case = cases[name]
+            print(f"{language} {name:<9} {case['legacy_ms']:>9.2f} ms -> "
+                  f"{case['current_ms']:>9.2f} ms  x{case['speedup']}", file=sys.stderr)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'size': args.size, 'repeat': args.repeat, 'results': results}, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,12 +1,13 @@
 import streamlit as st
-import os
-from utils import YouTubeHandler, GeminiProcessor
-from utils.db_handler import DatabaseHandler
+from utils.clients import get_db_handler, get_job_queue, get_youtube_handler
+from utils.jobs import JOB_FAILED, JOB_QUEUED, Job
+from utils import metrics
 from datetime import datetime
 import traceback
 from dotenv import load_dotenv
 
 load_dotenv()  # .envファイルから環境変数を読み込む
+metrics.configure_from_env()
 
 # Page configuration must be the first Streamlit command
 st.set_page_config(
@@ -18,6 +19,9 @@ st.set_page_config(
 # Enable detailed error messages
 st.set_option('client.showErrorDetails', True)
 
+# ジョブの進捗を確認する間隔（秒）
+JOB_POLL_INTERVAL = 0.5
+
 # Translations dictionary
 TRANSLATIONS = {
     'ja': {
@@ -44,7 +48,15 @@ TRANSLATIONS = {
         'db_connected': 'データベース接続完了',
         'db_connection_failed': 'データベース接続に失敗しました',
         'loading_channel_videos': 'チャンネルの動画を読み込み中...',
-        'view_history': '履歴を表示'
+        'related_summaries': '関連する過去の要約',
+        'view_history': '履歴を表示',
+        'force_regenerate': 'キャッシュを使わずに再生成',
+        'summary_from_cache': '保存済みの要約を表示しています',
+        'token_usage': '動画ごとのトークン使用量',
+        'joined_running_job': '同じ動画の要約を生成中のため、その結果を待っています...',
+        'job_queued': '順番待ちです...',
+        'stage_timings': '処理段階ごとの所要時間（秒）',
+        'debug_trace': 'デバッグ：処理のタイムライン'
     },
     'en': {
         'page_title': 'Summary Generator',
@@ -70,7 +82,15 @@ TRANSLATIONS = {
         'db_connected': 'Database connected successfully',
         'db_connection_failed': 'Database connection failed',
         'loading_channel_videos': 'Loading channel videos...',
-        'view_history': 'View History'
+        'related_summaries': 'Related Past Summaries',
+        'view_history': 'View History',
+        'force_regenerate': 'Regenerate (ignore cache)',
+        'summary_from_cache': 'Showing a previously generated summary',
+        'token_usage': 'Token usage per video',
+        'joined_running_job': 'A summary of the same videos is already being generated; waiting for it...',
+        'job_queued': 'Waiting in queue...',
+        'stage_timings': 'Time per stage (seconds)',
+        'debug_trace': 'Debug: timing waterfall'
     },
     'zh': {
         'page_title': '摘要生成器',
@@ -96,7 +116,15 @@ TRANSLATIONS = {
         'db_connected': '数据库连接成功',
         'db_connection_failed': '数据库连接失败',
         'loading_channel_videos': '正在加载频道视频...',
-        'view_history': '查看历史'
+        'related_summaries': '相关的历史摘要',
+        'view_history': '查看历史',
+        'force_regenerate': '重新生成（忽略缓存）',
+        'summary_from_cache': '显示已保存的摘要',
+        'token_usage': '每个视频的令牌用量',
+        'joined_running_job': '相同视频的摘要正在生成中，正在等待结果...',
+        'job_queued': '排队中...',
+        'stage_timings': '各阶段耗时（秒）',
+        'debug_trace': '调试：处理时间线'
     }
 }
 
@@ -104,18 +132,30 @@ def initialize_session_state():
     """Initialize session state variables."""
     if 'generated_article' not in st.session_state:
         st.session_state.generated_article = None
-    if 'processing' not in st.session_state:
-        st.session_state.processing = False
+    if 'job_id' not in st.session_state:
+        # URLの ?job= から復元し、再接続やリロード後も結果を表示できるようにする
+        st.session_state.job_id = st.query_params.get('job')
+        st.session_state.applied_job_id = None
+    if 'source_urls' not in st.session_state:
+        st.session_state.source_urls = []
     if 'language' not in st.session_state:
         st.session_state.language = 'ja'  # Default to Japanese
     if 'channel_videos' not in st.session_state:
         st.session_state.channel_videos = []
+    if 'related_summaries' not in st.session_state:
+        st.session_state.related_summaries = []
+    if 'token_usage' not in st.session_state:
+        st.session_state.token_usage = []
+    if 'stage_timings' not in st.session_state:
+        st.session_state.stage_timings = []
+    if 'trace' not in st.session_state:
+        st.session_state.trace = []
     
-    # Initialize database connection
+    # Initialize database connection (shared by all sessions; only a reference is kept here)
     if 'db_handler' not in st.session_state:
         try:
             with st.spinner(get_text('db_connecting')):
-                st.session_state.db_handler = DatabaseHandler()
+                st.session_state.db_handler = get_db_handler()
                 
                 # Test database connection
                 if not st.session_state.db_handler.verify_connection():
@@ -139,6 +179,81 @@ def get_text(key: str) -> str:
     """Get translated text based on current language."""
     return TRANSLATIONS[st.session_state.language].get(key, key)
 
+@st.fragment(run_every=JOB_POLL_INTERVAL)
+def show_job_progress(job_id: str):
+    """Show a running job's progress, re-rendered every ``JOB_POLL_INTERVAL`` seconds.
+
+    Only this fragment reruns while the job is in progress, so the page
+    stays responsive; once the job has finished (or expired) the whole app
+    is rerun and ``main`` applies the result.
+    """
+    job = get_job_queue().get(job_id)
+    if job is None or job.finished:
+        st.rerun()
+
+    if job.partial:
+        # 生成中の要約を逐次表示する
+        st.markdown(f"### {get_text('generated_article')}")
+        st.caption(get_text('generating_article'))
+        st.markdown(job.partial)
+    elif job.status == JOB_QUEUED:
+        st.info(get_text('job_queued'))
+    else:
+        st.info(get_text('processing_videos'))
+
+def apply_job_result(job: Job):
+    """Report a finished job and keep its summary in the session."""
+    if job.status == JOB_FAILED:
+        st.error(f"{get_text('error_occurred')}{job.error}")
+        return
+
+    result = job.result
+    for video in result['videos']:
+        if video['error']:
+            st.error(f"{get_text('error_processing')}{video['url']}: {video['error']}")
+    if result['article'] is None:
+        return
+
+    if result['from_cache']:
+        st.info(get_text('summary_from_cache'))
+    elif result['save_error']:
+        st.error(f"{get_text('db_error')}{result['save_error']}")
+    else:
+        st.success(get_text('summary_saved'))
+    if result['channel_error']:
+        st.warning(f"{get_text('no_channel_videos')}: {result['channel_error']}")
+
+    st.session_state.generated_article = result['article']
+    st.session_state.token_usage = result['token_usage']
+    st.session_state.stage_timings = result.get('timings', [])
+    st.session_state.trace = result.get('trace', [])
+    st.session_state.channel_videos = result['channel_videos']
+    st.session_state.related_summaries = result.get('related', [])
+    st.session_state.source_urls = job.params['urls']
+    # 履歴ページの一覧を次回表示時に読み直させる
+    st.session_state.history_language = None
+
+def render_waterfall(spans: list):
+    """Draw the spans of a job trace as a timing waterfall."""
+    total = max(span['start'] + span['seconds'] for span in spans) or 1.0
+    rows = []
+    for span in spans:
+        label = span['name']
+        for key in ('operation', 'stage'):
+            if key in span:
+                label += f" ({span[key]})"
+        left = span['start'] / total * 100
+        width = max(span['seconds'] / total * 100, 0.5)
+        css_class = 'trace-bar error' if 'error' in span else 'trace-bar'
+        rows.append(
+            f'<div class="trace-row"><span class="trace-label" title="{label}">{label}</span>'
+            f'<div class="trace-track"><div class="{css_class}" '
+            f'style="margin-left:{left:.2f}%;width:{width:.2f}%"></div></div>'
+            f'<span class="trace-duration">{span["seconds"] * 1000:.0f} ms</span></div>'
+        )
+    st.markdown(''.join(rows), unsafe_allow_html=True)
+    st.dataframe(spans, use_container_width=True)
+
 def main():
     try:
         # Load custom CSS
@@ -171,9 +286,14 @@ def main():
         )
 
         col1, col2 = st.columns([2, 1])
+        force_regenerate = col2.checkbox(get_text('force_regenerate'))
+
+        # 実行中のジョブがある間は新しいジョブを投入しない
+        current_job = get_job_queue().get(st.session_state.job_id) if st.session_state.job_id else None
+        job_running = current_job is not None and not current_job.finished
 
         # Process button
-        if col1.button(get_text('generate_button'), disabled=st.session_state.processing):
+        if col1.button(get_text('generate_button'), disabled=job_running):
             if st.session_state.db_handler is None:
                 st.error(get_text('db_error'))
                 return
@@ -186,71 +306,69 @@ def main():
                 return
 
             try:
-                st.session_state.processing = True
-
-                # Initialize handlers with environment variables
-                youtube_handler = YouTubeHandler(api_key=os.environ['YOUTUBE_API_KEY'])
-                gemini_processor = GeminiProcessor(api_key=os.environ['GEMINI_API_KEY'])
-
-                # Process videos
-                with st.spinner(get_text('processing_videos')):
-                    video_data = youtube_handler.process_videos(valid_urls)
-
-                # Check for errors
-                errors = [data for data in video_data if 'error' in data]
-                if errors:
-                    for error in errors:
-                        st.error(f"{get_text('error_processing')}{error['url']}: {error['error']}")
-                    if len(errors) == len(video_data):
-                        return
-
-                # Generate article
-                with st.spinner(get_text('generating_article')):
-                    article = gemini_processor.generate_article(
-                        video_data, 
-                        language=st.session_state.language
-                    )
-                    st.session_state.generated_article = article
-
-                    # Save to database
-                    with st.spinner(get_text('saving_summary')):
-                        if len(video_data) > 0 and 'error' not in video_data[0]:
-                            st.session_state.db_handler.save_summary(
-                                video_id=youtube_handler.extract_video_id(valid_urls[0]),
-                                title=video_data[0]['title'],
-                                summary=article,
-                                language=st.session_state.language,
-                                source_urls=','.join(valid_urls),
-                                thumbnail_url=video_data[0].get('thumbnail')  # サムネイル情報を保存
-                            )
-                            st.success(get_text('summary_saved'))
-
-                    # Get channel videos
-                    with st.spinner(get_text('loading_channel_videos')):
-                        try:
-                            channel_videos = youtube_handler.get_channel_latest_videos(valid_urls[0])
-                            st.session_state.channel_videos = channel_videos
-                        except Exception as e:
-                            st.warning(f"{get_text('no_channel_videos')}: {str(e)}")
-                            st.session_state.channel_videos = []
+                language = st.session_state.language
+                source_key = get_youtube_handler().source_key(valid_urls, language)
+
+                # 同じ動画セット・言語のジョブが実行中なら、そのジョブの結果を待つ
+                job_id, joined = get_job_queue().submit(
+                    f"{source_key}:force" if force_regenerate else source_key,
+                    {'urls': valid_urls, 'language': language, 'force': force_regenerate}
+                )
+                st.session_state.job_id = job_id
+                st.query_params['job'] = job_id
+                if joined:
+                    st.info(get_text('joined_running_job'))
 
             except Exception as e:
                 st.error(f"{get_text('error_occurred')}{str(e)}")
                 traceback.print_exc()
-            finally:
-                st.session_state.processing = False
+
+        # Wait for the current job and show its result once it has finished
+        job_id = st.session_state.job_id
+        if job_id and st.session_state.applied_job_id != job_id:
+            job = get_job_queue().get(job_id)
+            if job is None:
+                # 期限切れなどで削除されたジョブ
+                st.session_state.job_id = None
+                st.query_params.pop('job', None)
+            elif job.finished:
+                apply_job_result(job)
+                st.session_state.applied_job_id = job_id
+            else:
+                show_job_progress(job_id)
 
         # Display generated article
         if st.session_state.generated_article:
             st.markdown(f"### {get_text('generated_article')}")
             st.markdown(st.session_state.generated_article)
 
+            # Prompt token usage per video
+            if st.session_state.token_usage:
+                with st.expander(get_text('token_usage')):
+                    st.table(st.session_state.token_usage)
+
+            # パイプラインの各段階の開始・終了時刻（ジョブ開始からの秒数）
+            if st.session_state.stage_timings:
+                with st.expander(get_text('stage_timings')):
+                    st.table(st.session_state.stage_timings)
+
+            # デバッグパネル（METRICS_ENABLED のときのみ記録される）
+            if st.session_state.trace:
+                with st.expander(get_text('debug_trace')):
+                    render_waterfall(st.session_state.trace)
+
             # Source attribution
             st.markdown(f"### {get_text('sources')}")
-            for url in validate_urls(urls_input.split('\n')):
+            for url in st.session_state.source_urls:
                 st.markdown(f'<a href="{url}" class="source-link" target="_blank">{url}</a>', 
                            unsafe_allow_html=True)
             
+            # 内容の近い過去の要約（ローカルのベクトル索引から）
+            if st.session_state.related_summaries:
+                st.markdown(f"### {get_text('related_summaries')}")
+                for summary in st.session_state.related_summaries:
+                    st.markdown(f"- [{summary['title']}](https://youtube.com/watch?v={summary['video_id']})")
+
             # Display channel videos
             if st.session_state.channel_videos:
                 st.markdown(f"### {get_text('channel_videos')}")
@@ -0,0 +1,14 @@
+-- Baseline schema for the video_summaries table used by utils/db_handler.py
+create table if not exists video_summaries (
+    id bigint generated by default as identity primary key,
+    video_id text not null,
+    title text not null,
+    summary text not null,
+    language text not null,
+    source_urls text not null,
+    thumbnail_url text,
+    timestamp timestamptz not null default now()
+);
+
+create index if not exists video_summaries_language_timestamp_idx
+    on video_summaries (language, timestamp desc);
@@ -0,0 +1,6 @@
+-- Hash of the prompt, language and generation config a summary was built from.
+-- Lets the summary cache reuse stored summaries instead of calling Gemini again.
+alter table video_summaries add column if not exists prompt_hash text;
+
+create index if not exists video_summaries_prompt_hash_idx
+    on video_summaries (prompt_hash);
@@ -0,0 +1,8 @@
+-- Short excerpt for list views, so the history page does not fetch full summaries,
+-- and an index matching its keyset pagination order.
+alter table video_summaries add column if not exists excerpt text;
+
+update video_summaries set excerpt = left(summary, 200) where excerpt is null;
+
+create index if not exists video_summaries_language_timestamp_id_idx
+    on video_summaries (language, timestamp desc, id desc);
@@ -0,0 +1,7 @@
+-- Normalised identity of a summary: language plus the sorted set of video IDs.
+-- The unique index lets save_summary upsert on it, so the same URL set and
+-- language can never be stored twice. Existing rows keep a null key.
+alter table video_summaries add column if not exists source_key text;
+
+create unique index if not exists video_summaries_source_key_idx
+    on video_summaries (source_key);
@@ -0,0 +1,41 @@
+-- Per-video metadata and the videos each summary was built from.
+-- video_summaries keeps only the first video of a summary and a comma-joined
+-- source_urls string; summary_sources links a summary to every video, and
+-- videos stores the transcript used last, so regenerating does not need to
+-- download it again. transcript is a zlib-compressed Transcript.to_bytes()
+-- record of the caption track named by transcript_track.
+create table if not exists videos (
+    id text primary key,
+    title text,
+    channel_id text,
+    channel_title text,
+    thumbnail_url text,
+    transcript_track text,
+    transcript_hash text,
+    transcript bytea,
+    updated_at timestamptz not null default now()
+);
+
+create index if not exists videos_channel_id_idx
+    on videos (channel_id);
+
+create table if not exists summary_sources (
+    summary_id bigint not null references video_summaries (id) on delete cascade,
+    video_id text not null references videos (id),
+    position integer not null default 0,
+    primary key (summary_id, video_id)
+);
+
+create index if not exists summary_sources_video_id_idx
+    on summary_sources (video_id, summary_id);
+
+-- Existing rows only know their first video.
+insert into videos (id, title, thumbnail_url)
+select distinct on (video_id) video_id, title, thumbnail_url
+from video_summaries
+order by video_id, timestamp desc
+on conflict (id) do nothing;
+
+insert into summary_sources (summary_id, video_id, position)
+select id, video_id, 0 from video_summaries
+on conflict do nothing;
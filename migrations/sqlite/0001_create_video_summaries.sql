@@ -0,0 +1,14 @@
+-- SQLite equivalent of migrations/0001_create_video_summaries.sql (local backend)
+CREATE TABLE IF NOT EXISTS video_summaries (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    video_id TEXT NOT NULL,
+    title TEXT NOT NULL,
+    summary TEXT NOT NULL,
+    language TEXT NOT NULL,
+    source_urls TEXT NOT NULL,
+    thumbnail_url TEXT,
+    timestamp TEXT NOT NULL DEFAULT (strftime('%Y-%m-%dT%H:%M:%f', 'now'))
+);
+
+CREATE INDEX IF NOT EXISTS video_summaries_language_timestamp_idx
+    ON video_summaries (language, timestamp DESC);
@@ -0,0 +1,5 @@
+-- SQLite equivalent of migrations/0002_add_prompt_hash.sql
+ALTER TABLE video_summaries ADD COLUMN prompt_hash TEXT;
+
+CREATE INDEX IF NOT EXISTS video_summaries_prompt_hash_idx
+    ON video_summaries (prompt_hash);
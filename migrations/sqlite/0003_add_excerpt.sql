@@ -0,0 +1,7 @@
+-- SQLite equivalent of migrations/0003_add_excerpt.sql
+ALTER TABLE video_summaries ADD COLUMN excerpt TEXT;
+
+UPDATE video_summaries SET excerpt = substr(summary, 1, 200) WHERE excerpt IS NULL;
+
+CREATE INDEX IF NOT EXISTS video_summaries_language_timestamp_id_idx
+    ON video_summaries (language, timestamp DESC, id DESC);
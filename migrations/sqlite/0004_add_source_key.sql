@@ -0,0 +1,5 @@
+-- SQLite equivalent of migrations/0004_add_source_key.sql
+ALTER TABLE video_summaries ADD COLUMN source_key TEXT;
+
+CREATE UNIQUE INDEX IF NOT EXISTS video_summaries_source_key_idx
+    ON video_summaries (source_key);
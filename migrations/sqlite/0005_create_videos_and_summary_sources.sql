@@ -0,0 +1,34 @@
+-- SQLite equivalent of migrations/0005_create_videos_and_summary_sources.sql
+-- transcript holds the same hex-encoded (\x...) text PostgREST uses for bytea.
+CREATE TABLE IF NOT EXISTS videos (
+    id TEXT PRIMARY KEY,
+    title TEXT,
+    channel_id TEXT,
+    channel_title TEXT,
+    thumbnail_url TEXT,
+    transcript_track TEXT,
+    transcript_hash TEXT,
+    transcript BLOB,
+    updated_at TEXT NOT NULL DEFAULT (strftime('%Y-%m-%dT%H:%M:%f', 'now'))
+);
+
+CREATE INDEX IF NOT EXISTS videos_channel_id_idx
+    ON videos (channel_id);
+
+CREATE TABLE IF NOT EXISTS summary_sources (
+    summary_id INTEGER NOT NULL REFERENCES video_summaries (id) ON DELETE CASCADE,
+    video_id TEXT NOT NULL REFERENCES videos (id),
+    position INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (summary_id, video_id)
+);
+
+CREATE INDEX IF NOT EXISTS summary_sources_video_id_idx
+    ON summary_sources (video_id, summary_id);
+
+INSERT OR IGNORE INTO videos (id, title, thumbnail_url)
+SELECT video_id, title, thumbnail_url FROM (
+    SELECT video_id, title, thumbnail_url, MAX(timestamp) FROM video_summaries GROUP BY video_id
+);
+
+INSERT OR IGNORE INTO summary_sources (summary_id, video_id, position)
+SELECT id, video_id, 0 FROM video_summaries;
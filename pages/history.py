@@ -1,11 +1,16 @@
 import streamlit as st
 import os
-from utils.db_handler import DatabaseHandler
+from utils.clients import get_db_handler, get_summary_cache
+from utils.db_handler import EXCERPT_LENGTH
 from datetime import datetime
 from dotenv import load_dotenv
 
 load_dotenv()
 
+# 1ページあたりの表示件数と検索結果の最大件数
+PAGE_SIZE = 10
+SEARCH_LIMIT = 20
+
 # Translations dictionary
 TRANSLATIONS = {
     'ja': {
@@ -21,7 +26,14 @@ TRANSLATIONS = {
         'db_error': 'データベースエラーが発生しました：',
         'loading': '読み込み中...',
         'view_video': '動画を見る',
-        'summary_label': '要約：'
+        'summary_label': '要約：',
+        'show_full_summary': '全文を表示',
+        'load_more': 'さらに読み込む',
+        'search_placeholder': '要約を検索',
+        'no_results': '該当する要約はありません',
+        'search_results': '検索結果',
+        'show_related': '関連する要約',
+        'no_related': '関連する要約はありません'
     },
     'en': {
         'page_title': 'Summary History',
@@ -36,7 +48,14 @@ TRANSLATIONS = {
         'db_error': 'Database error occurred: ',
         'loading': 'Loading...',
         'view_video': 'Watch Video',
-        'summary_label': 'Summary:'
+        'summary_label': 'Summary:',
+        'show_full_summary': 'Show full summary',
+        'load_more': 'Load more',
+        'search_placeholder': 'Search summaries',
+        'no_results': 'No matching summaries',
+        'search_results': 'Search results',
+        'show_related': 'Related summaries',
+        'no_related': 'No related summaries'
     },
     'zh': {
         'page_title': '摘要历史',
@@ -51,7 +70,14 @@ TRANSLATIONS = {
         'db_error': '数据库错误：',
         'loading': '加载中...',
         'view_video': '观看视频',
-        'summary_label': '摘要：'
+        'summary_label': '摘要：',
+        'show_full_summary': '显示全文',
+        'load_more': '加载更多',
+        'search_placeholder': '搜索摘要',
+        'no_results': '没有匹配的摘要',
+        'search_results': '搜索结果',
+        'show_related': '相关摘要',
+        'no_related': '没有相关的摘要'
     }
 }
 
@@ -59,7 +85,7 @@ def get_text(key: str) -> str:
     """Get translated text based on current language."""
     return TRANSLATIONS[st.session_state.language].get(key, key)
 
-def delete_summary(summary_id: int):
+def delete_summary(summary_id: int, prompt_hash: str = None):
     """Delete a summary and handle the confirmation dialog."""
     if summary_id not in st.session_state.delete_confirmation:
         st.session_state.delete_confirmation[summary_id] = False
@@ -73,15 +99,75 @@ def delete_summary(summary_id: int):
             if st.button(get_text('delete_confirm'), key=f"confirm_{summary_id}"):
                 success, message = st.session_state.db_handler.delete_summary(summary_id)
                 if success:
+                    # 削除した要約がキャッシュから再表示されないようにする
+                    if prompt_hash:
+                        try:
+                            get_summary_cache().invalidate(prompt_hash)
+                        except Exception as e:
+                            st.warning(f"Could not clear the summary cache: {str(e)}")
+                    st.session_state.history_summaries = [
+                        summary for summary in st.session_state.history_summaries
+                        if summary.id != summary_id
+                    ]
                     st.success(get_text('delete_success'))
                     st.session_state.delete_confirmation[summary_id] = False
-                    st.experimental_rerun()
+                    st.rerun()
                 else:
                     st.error(f"{get_text('delete_error')}{message}")
         with col2:
             if st.button(get_text('cancel_button'), key=f"cancel_{summary_id}"):
                 st.session_state.delete_confirmation[summary_id] = False
-                st.experimental_rerun()
+                st.rerun()
+
+def load_next_page():
+    """Append the next page of summaries for the current language."""
+    summaries, cursor = st.session_state.db_handler.get_summaries_page(
+        st.session_state.language,
+        limit=PAGE_SIZE,
+        cursor=st.session_state.history_cursor
+    )
+    st.session_state.history_summaries.extend(summaries)
+    st.session_state.history_cursor = cursor
+
+def get_full_summary(summary_id: int) -> str:
+    """Load the full text of a summary on first use."""
+    if summary_id not in st.session_state.summary_texts:
+        st.session_state.summary_texts[summary_id] = \
+            st.session_state.db_handler.get_summary_text(summary_id) or ''
+    return st.session_state.summary_texts[summary_id]
+
+def show_related_summaries(summary_id: int):
+    """List saved summaries on similar topics (loaded on first use)."""
+    if summary_id not in st.session_state.history_related:
+        st.session_state.history_related[summary_id] = \
+            st.session_state.db_handler.related_summaries(
+                summary_id, language=st.session_state.language
+            )
+    related = st.session_state.history_related[summary_id]
+    if not related:
+        st.caption(get_text('no_related'))
+    for summary, _ in related:
+        st.markdown(f"- [{summary.title}](https://youtube.com/watch?v={summary.video_id})")
+
+def show_search_results(query: str):
+    """Show ranked full-text search results for the current language."""
+    with st.spinner(get_text('loading')):
+        results = st.session_state.db_handler.search_summaries(
+            query, language=st.session_state.language, limit=SEARCH_LIMIT
+        )
+
+    if not results:
+        st.info(get_text('no_results'))
+        return
+
+    st.markdown(f"**{get_text('search_results')}** ({len(results)})")
+    date_format = get_text('summary_date_format')
+    for summary, snippet in results:
+        video_url = f"https://youtube.com/watch?v={summary.video_id}"
+        st.markdown(f"### [{summary.title}]({video_url})")
+        st.markdown(f"*{summary.timestamp.strftime(date_format)}*")
+        st.markdown(snippet)
+        st.markdown("---")
 
 def initialize_session_state():
     """Initialize session state variables."""
@@ -89,11 +175,19 @@ def initialize_session_state():
         st.session_state.language = 'ja'
     if 'delete_confirmation' not in st.session_state:
         st.session_state.delete_confirmation = {}
+    if 'history_summaries' not in st.session_state:
+        st.session_state.history_summaries = []
+        st.session_state.history_cursor = None
+        st.session_state.history_language = None
+    if 'summary_texts' not in st.session_state:
+        st.session_state.summary_texts = {}
+    if 'history_related' not in st.session_state:
+        st.session_state.history_related = {}
     
-    # Initialize database connection
+    # Initialize database connection (shared by all sessions)
     if 'db_handler' not in st.session_state:
         try:
-            st.session_state.db_handler = DatabaseHandler()
+            st.session_state.db_handler = get_db_handler()
         except Exception as e:
             st.error(f"{get_text('db_error')} {str(e)}")
             st.session_state.db_handler = None
@@ -125,45 +219,72 @@ def main():
         st.error(get_text('db_error'))
         return
 
-    with st.spinner(get_text('loading')):
-        summaries = st.session_state.db_handler.get_summaries_by_language(
-            st.session_state.language
-        )
+    # 全文検索（入力があるときは一覧の代わりに検索結果を表示）
+    query = st.text_input(get_text('search_placeholder'), key='search_query')
+    if query.strip():
+        show_search_results(query.strip())
+        return
+
+    # 言語が変わったら1ページ目から読み直す
+    # （要約が新しく保存された場合は main.py が history_language をリセットする）
+    if st.session_state.get('history_language') != st.session_state.language:
+        st.session_state.history_summaries = []
+        st.session_state.history_cursor = None
+        st.session_state.history_language = st.session_state.language
+        with st.spinner(get_text('loading')):
+            load_next_page()
+
+    summaries = st.session_state.history_summaries
+
+    if not summaries:
+        st.info(get_text('no_summaries'))
+        return
+
+    # Display summaries in a grid layout
+    cols = st.columns(2)  # 2列のグリッドレイアウト
+    for idx, summary in enumerate(summaries):
+        with cols[idx % 2]:
+            with st.container():
+                # サムネイル画像とタイトルを表示
+                if summary.thumbnail_url:
+                    st.image(summary.thumbnail_url, use_column_width=True)
+                
+                # タイトルと日時
+                date_format = get_text('summary_date_format')
+                formatted_date = summary.timestamp.strftime(date_format)
+                st.markdown(f"### {summary.title}")
+                st.markdown(f"*{formatted_date}*")
+                
+                # 要約内容（抜粋を表示し、全文は開いたときだけ読み込む）
+                st.markdown(f"**{get_text('summary_label')}**")
+                if st.toggle(get_text('show_full_summary'), key=f"full_{summary.id}"):
+                    st.markdown(get_full_summary(summary.id))
+                else:
+                    excerpt = summary.excerpt or ''
+                    st.markdown(excerpt + ('...' if len(excerpt) >= EXCERPT_LENGTH else ''))
+
+                # 内容の近い要約（ベクトル索引から、開いたときだけ検索する）
+                if st.toggle(get_text('show_related'), key=f"related_{summary.id}"):
+                    show_related_summaries(summary.id)
+                
+                # 動画リンクと削除ボタン
+                col1, col2 = st.columns([3, 1])
+                with col1:
+                    video_url = f"https://youtube.com/watch?v={summary.video_id}"
+                    st.markdown(f'<a href="{video_url}" target="_blank" class="video-link">'
+                              f'{get_text("view_video")}</a>', unsafe_allow_html=True)
+                with col2:
+                    delete_summary(summary.id, summary.prompt_hash)
+                
+                # 区切り線
+                st.markdown("---")
 
-        if not summaries:
-            st.info(get_text('no_summaries'))
-            return
-
-        # Display summaries in a grid layout
-        cols = st.columns(2)  # 2列のグリッドレイアウト
-        for idx, summary in enumerate(summaries):
-            with cols[idx % 2]:
-                with st.container():
-                    # サムネイル画像とタイトルを表示
-                    if summary.thumbnail_url:
-                        st.image(summary.thumbnail_url, use_column_width=True)
-                    
-                    # タイトルと日時
-                    date_format = get_text('summary_date_format')
-                    formatted_date = summary.timestamp.strftime(date_format)
-                    st.markdown(f"### {summary.title}")
-                    st.markdown(f"*{formatted_date}*")
-                    
-                    # 要約内容
-                    st.markdown(f"**{get_text('summary_label')}**")
-                    st.markdown(summary.summary)
-                    
-                    # 動画リンクと削除ボタン
-                    col1, col2 = st.columns([3, 1])
-                    with col1:
-                        video_url = f"https://youtube.com/watch?v={summary.video_id}"
-                        st.markdown(f'<a href="{video_url}" target="_blank" class="video-link">'
-                                  f'{get_text("view_video")}</a>', unsafe_allow_html=True)
-                    with col2:
-                        delete_summary(summary.id)
-                    
-                    # 区切り線
-                    st.markdown("---")
+    # 次のページ（キーセットページネーション）
+    if st.session_state.history_cursor is not None:
+        if st.button(get_text('load_more')):
+            with st.spinner(get_text('loading')):
+                load_next_page()
+            st.rerun()
 
 if __name__ == "__main__":
     main()
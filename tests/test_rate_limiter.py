@@ -0,0 +1,20 @@
+import pytest
+from utils.rate_limiter import TokenBucket
+
+
+def test_request_larger_than_capacity_waits_for_refill():
+    bucket = TokenBucket(32000)
+    assert bucket.capacity < 24000
+
+    first = bucket.reserve(24000)
+    second = bucket.reserve(24000)
+
+    # 容量を超えた分はリフィル速度（毎秒 32000/60 トークン）で返済される
+    assert first == pytest.approx((24000 - bucket.capacity) / bucket.rate, rel=0.01)
+    assert second == pytest.approx(first + 24000 / bucket.rate, rel=0.01)
+
+
+def test_requests_within_capacity_do_not_wait():
+    bucket = TokenBucket(600)
+    assert bucket.reserve(1) == 0.0
+    assert bucket.reserve(1) == 0.0
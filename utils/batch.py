@@ -0,0 +1,320 @@
+"""Headless batch summarisation.
+
+Reads one job per line from a file (or stdin); a line holds one or more
+YouTube URLs separated by whitespace or commas, which are summarised
+together. Results go to a JSONL file and/or the Supabase database, and
+finished jobs are checkpointed so an interrupted run can be resumed.
+
+    python -m utils.batch urls.txt --language ja --workers 4 --output out.jsonl
+"""
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, List, Optional, Set, Tuple
+import argparse
+import json
+import os
+import re
+import sys
+import threading
+import time
+from dotenv import load_dotenv
+from . import metrics
+from .cache import default_cache_dir
+from .single_flight import SingleFlight
+from .youtube_handler import YouTubeHandler
+from .gemini_processor import GeminiProcessor
+from .summary_cache import SummaryCache
+
+# データベースへまとめて保存する要約の件数
+SAVE_BATCH_SIZE = 20
+
+
+def read_jobs(stream) -> List[List[str]]:
+    """Parse job lines into lists of URLs, skipping blanks and # comments."""
+    jobs = []
+    for line in stream:
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        urls = [url for url in re.split(r'[\s,]+', line) if url]
+        if urls:
+            jobs.append(urls)
+    return jobs
+
+
+def job_key(urls: List[str], language: str) -> str:
+    """Identify a job in the checkpoint file."""
+    return f"{language}:{','.join(urls)}"
+
+
+def load_checkpoint(path: str) -> Set[str]:
+    """Return the keys of jobs that finished successfully in earlier runs."""
+    done = set()
+    if not os.path.exists(path):
+        return done
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                # 強制終了で途中まで書かれた行は無視する
+                continue
+            if entry.get('status') == 'done':
+                done.add(entry['key'])
+    return done
+
+
+class BatchRunner:
+    """Run summary jobs on a thread pool and record results and progress."""
+
+    def __init__(self, youtube_handler: YouTubeHandler, gemini_processor: GeminiProcessor,
+                 language: str = 'ja', workers: int = 4, output_path: Optional[str] = None,
+                 checkpoint_path: Optional[str] = None, db_handler=None, force: bool = False,
+                 save_batch_size: int = SAVE_BATCH_SIZE):
+        self.youtube_handler = youtube_handler
+        self.gemini_processor = gemini_processor
+        self.language = language
+        self.workers = workers
+        self.output_path = output_path
+        self.checkpoint_path = checkpoint_path
+        self.db_handler = db_handler
+        self.force = force
+        self.save_batch_size = save_batch_size
+        # 保存待ちの (結果レコード, save_summaries の引数)
+        self._pending_saves: List[Tuple[Dict, Dict]] = []
+        self._write_lock = threading.Lock()
+        # 同じ動画セットのジョブが同時に実行されたら1回だけ処理する
+        self._single_flight = SingleFlight()
+        self.stats = {'done': 0, 'failed': 0, 'skipped': 0, 'videos': 0}
+
+    def run(self, jobs: List[List[str]]) -> Dict:
+        """Run all jobs not already in the checkpoint; returns throughput stats.
+
+        With a database, finished summaries are saved ``save_batch_size`` at
+        a time with ``save_summaries``, and a job is only recorded (and
+        checkpointed) once its summary is saved.
+        """
+        done = load_checkpoint(self.checkpoint_path) if self.checkpoint_path else set()
+        pending = [urls for urls in jobs if job_key(urls, self.language) not in done]
+        self.stats['skipped'] = len(jobs) - len(pending)
+
+        started = time.monotonic()
+        executor = ThreadPoolExecutor(max_workers=max(1, self.workers))
+        try:
+            futures = {executor.submit(self._run_job, urls) for urls in pending}
+            try:
+                for future in as_completed(futures):
+                    futures.discard(future)
+                    self._collect(future, len(pending))
+            except BaseException:
+                # Ctrl-C などで中断されたら待機中のジョブは実行しない
+                # （実行中のジョブの終了は待たない）。終わっていたジョブの結果は記録する
+                executor.shutdown(wait=False, cancel_futures=True)
+                for future in futures:
+                    if future.done() and not future.cancelled():
+                        self._collect(future, len(pending))
+                raise
+            executor.shutdown()
+        finally:
+            # 中断されても生成済みの要約は保存する
+            self._flush_saves(len(pending))
+
+        elapsed = time.monotonic() - started
+        self.stats['elapsed_seconds'] = round(elapsed, 2)
+        self.stats['jobs_per_minute'] = round(self.stats['done'] * 60 / elapsed, 2) if elapsed else 0.0
+        self.stats['videos_per_minute'] = round(self.stats['videos'] * 60 / elapsed, 2) if elapsed else 0.0
+        return self.stats
+
+    def _collect(self, future, total: int) -> None:
+        """Record a finished job, or queue it until its summary is saved."""
+        record, save = future.result()
+        if save is None:
+            self._finish(record, total)
+            return
+        self._pending_saves.append((record, save))
+        if len(self._pending_saves) >= self.save_batch_size:
+            self._flush_saves(total)
+
+    def _run_job(self, urls: List[str]) -> Tuple[Dict, Optional[Dict]]:
+        """Summarise one job. Errors are returned in the record, not raised.
+
+        Returns the record and, when there is a database, the
+        ``save_summaries`` entry for the summary.
+        """
+        record = {'key': job_key(urls, self.language), 'urls': urls, 'language': self.language}
+        save = None
+        try:
+            source_key = self.youtube_handler.source_key(urls, self.language)
+            (video_data, summary, prompt_hash), _ = self._single_flight.do(
+                source_key, lambda: self._summarize(urls, source_key)
+            )
+
+            videos = [video for video in video_data if 'error' not in video]
+            first = videos[0]
+            record.update({
+                'status': 'done',
+                'errors': [
+                    {'url': video['url'], 'error': video['error']}
+                    for video in video_data if 'error' in video
+                ],
+                'video_ids': [video['video_id'] for video in videos],
+                'title': first['title'],
+                'thumbnail_url': first.get('thumbnail'),
+                'summary': summary,
+                'prompt_hash': prompt_hash,
+                'source_key': source_key
+            })
+            if self.db_handler is not None:
+                save = {
+                    'video_id': first['video_id'],
+                    'title': first['title'],
+                    'summary': summary,
+                    'language': self.language,
+                    'source_urls': ','.join(urls),
+                    'thumbnail_url': first.get('thumbnail'),
+                    'prompt_hash': prompt_hash,
+                    'source_key': source_key,
+                    'videos': videos
+                }
+        except Exception as e:
+            record['status'] = 'failed'
+            record['error'] = str(e)
+        return record, save
+
+    def _summarize(self, urls: List[str], source_key: str) -> Tuple[List[Dict], str, str]:
+        """Fetch the videos and generate the summary."""
+        video_data = self.youtube_handler.process_videos(urls, language=self.language)
+        videos = [video for video in video_data if 'error' not in video]
+        if not videos:
+            raise Exception("No video could be processed")
+
+        prompt_hash = self.gemini_processor.get_cache_key(video_data, self.language)
+        summary = self.gemini_processor.generate_article(
+            video_data, language=self.language, force=self.force, cache_key=prompt_hash
+        )
+        return video_data, summary, prompt_hash
+
+    def _flush_saves(self, total: int) -> None:
+        """Save the pending summaries in one batch, then record their jobs."""
+        if not self._pending_saves:
+            return
+        pending, self._pending_saves = self._pending_saves, []
+
+        # 同じ動画セットのジョブは1行だけ保存する（同じキーへの二重upsertを避ける）
+        keys: Dict[str, int] = {}
+        saves: List[Dict] = []
+        for _, save in pending:
+            if save['source_key'] not in keys:
+                keys[save['source_key']] = len(saves)
+                saves.append(save)
+        try:
+            results = self.db_handler.save_summaries(saves)
+        except Exception as e:
+            results = [(False, f"Database error: {str(e)}")] * len(saves)
+
+        for record, save in pending:
+            saved, message = results[keys[save['source_key']]]
+            if not saved:
+                record['status'] = 'failed'
+                record['error'] = message
+            self._finish(record, total)
+
+    def _finish(self, record: Dict, total: int) -> None:
+        """Record a finished job and report it on stderr."""
+        self._record(record)
+        status = 'ok' if record['status'] == 'done' else f"failed: {record['error']}"
+        print(f"[{self.stats['done'] + self.stats['failed']}/{total}] "
+              f"{' '.join(record['urls'])} {status}", file=sys.stderr)
+
+    def _record(self, record: Dict) -> None:
+        """Append the result, then mark the job in the checkpoint."""
+        with self._write_lock:
+            if record['status'] == 'done':
+                self.stats['done'] += 1
+                self.stats['videos'] += len(record['video_ids'])
+            else:
+                self.stats['failed'] += 1
+
+            if self.output_path:
+                with open(self.output_path, 'a', encoding='utf-8') as f:
+                    f.write(json.dumps(record, ensure_ascii=False) + '\n')
+
+            if self.checkpoint_path:
+                with open(self.checkpoint_path, 'a', encoding='utf-8') as f:
+                    f.write(json.dumps({'key': record['key'], 'status': record['status']},
+                                       ensure_ascii=False) + '\n')
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog='python -m utils.batch',
+        description='Summarise YouTube videos listed in a file, one job per line.'
+    )
+    parser.add_argument('input', nargs='?', default='-',
+                        help="file with one job (URLs separated by spaces or commas) per line; '-' for stdin")
+    parser.add_argument('--language', choices=['ja', 'en', 'zh'], default='ja')
+    parser.add_argument('--workers', type=int, default=4, help='jobs processed in parallel')
+    parser.add_argument('--output', help='append results to this JSONL file')
+    parser.add_argument('--db', action='store_true', help='save results with DatabaseHandler.save_summaries')
+    parser.add_argument('--checkpoint',
+                        help='progress file used to resume '
+                             '(default: <output>.checkpoint, or batch.checkpoint in the cache directory)')
+    parser.add_argument('--force', action='store_true', help='ignore the summary cache')
+    args = parser.parse_args(argv)
+
+    if not args.output and not args.db:
+        parser.error('at least one of --output or --db is required')
+
+    load_dotenv()
+    metrics.configure_from_env()
+
+    if args.input == '-':
+        jobs = read_jobs(sys.stdin)
+    else:
+        with open(args.input, encoding='utf-8') as f:
+            jobs = read_jobs(f)
+
+    db_handler = None
+    if args.db:
+        from .db_handler import DatabaseHandler
+        db_handler = DatabaseHandler()
+
+    checkpoint_path = args.checkpoint
+    if checkpoint_path is None:
+        if args.output:
+            checkpoint_path = f"{args.output}.checkpoint"
+        else:
+            os.makedirs(default_cache_dir(), exist_ok=True)
+            checkpoint_path = os.path.join(default_cache_dir(), 'batch.checkpoint')
+    runner = BatchRunner(
+        youtube_handler=YouTubeHandler(api_key=os.environ['YOUTUBE_API_KEY'],
+                                       transcript_store=db_handler),
+        gemini_processor=GeminiProcessor(
+            api_key=os.environ['GEMINI_API_KEY'],
+            summary_cache=SummaryCache(db_handler=db_handler)
+        ),
+        language=args.language,
+        workers=args.workers,
+        output_path=args.output,
+        checkpoint_path=checkpoint_path,
+        db_handler=db_handler,
+        force=args.force
+    )
+
+    try:
+        stats = runner.run(jobs)
+    except KeyboardInterrupt:
+        print("Interrupted; rerun the same command to resume from the checkpoint.", file=sys.stderr)
+        return 130
+    finally:
+        if metrics.enabled() and os.environ.get('METRICS_FILE'):
+            metrics.write_prometheus(os.environ['METRICS_FILE'])
+
+    print(f"done={stats['done']} failed={stats['failed']} skipped={stats['skipped']} "
+          f"videos={stats['videos']} elapsed={stats['elapsed_seconds']}s "
+          f"jobs/min={stats['jobs_per_minute']} videos/min={stats['videos_per_minute']}",
+          file=sys.stderr)
+    return 0 if stats['failed'] == 0 else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,220 @@
+from typing import Any, Dict, Optional
+import json
+import os
+import sqlite3
+import threading
+import time
+
+# 最終アクセス時刻の更新をまとめて書き込む件数と間隔（秒）
+ACCESS_FLUSH_SIZE = 64
+ACCESS_FLUSH_INTERVAL = 30.0
+
+# 期限切れのエントリをまとめて削除する間隔（秒）
+EXPIRE_INTERVAL = 60.0
+
+
+def default_cache_dir() -> str:
+    """Return the cache directory (``CACHE_DIR``, read on each call; default ``.cache``)."""
+    return os.environ.get('CACHE_DIR', '.cache')
+
+
+def default_cache_path(name: str) -> str:
+    """Return the on-disk path for a named cache inside the cache directory."""
+    return os.path.join(default_cache_dir(), f"{name}.sqlite3")
+
+
+class SQLiteCache:
+    """Persistent key/value cache backed by a single SQLite file.
+
+    Entries expire after ``ttl`` seconds (``None`` keeps them forever) and the
+    least recently used entries are evicted once the stored values exceed
+    ``max_bytes``. Hit and miss counters are kept per instance.
+
+    The total size is tracked in memory (and recounted before evicting, in
+    case other processes share the file), and the access times used for
+    LRU order are written in batches rather than on every hit.
+    """
+
+    def __init__(self, path: str, ttl: Optional[float] = None,
+                 max_bytes: int = 100 * 1024 * 1024):
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        # 書き込み待ちの最終アクセス時刻（キー -> 時刻）
+        self._accessed: Dict[str, float] = {}
+        self._accessed_flushed_at = time.monotonic()
+        self._expired_at = 0.0
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS cache_entries (
+                key TEXT PRIMARY KEY,
+                value BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )
+        """)
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_cache_entries_accessed_at "
+            "ON cache_entries (accessed_at)"
+        )
+        self._conn.commit()
+        self._total = self._count_bytes()
+
+    def get_bytes(self, key: str) -> Optional[bytes]:
+        """Return the raw value stored under ``key``, or None on a miss."""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, created_at FROM cache_entries WHERE key = ?", (key,)
+            ).fetchone()
+
+            if row is None:
+                self.misses += 1
+                return None
+
+            value, created_at = row
+            if self.ttl is not None and now - created_at > self.ttl:
+                self._delete(key)
+                self._conn.commit()
+                self.misses += 1
+                return None
+
+            self._accessed[key] = now
+            if (len(self._accessed) >= ACCESS_FLUSH_SIZE
+                    or time.monotonic() - self._accessed_flushed_at >= ACCESS_FLUSH_INTERVAL):
+                self._flush_accessed()
+                self._conn.commit()
+            self.hits += 1
+            return bytes(value)
+
+    def set_bytes(self, key: str, value: bytes) -> None:
+        """Store a raw value under ``key`` and evict entries over the size bound."""
+        now = time.time()
+        with self._lock:
+            self._delete(key)
+            self._conn.execute(
+                "INSERT INTO cache_entries "
+                "(key, value, size, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                (key, sqlite3.Binary(value), len(value), now, now)
+            )
+            self._total += len(value)
+            self._evict(now)
+            self._conn.commit()
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """Return the JSON value stored under ``key``."""
+        value = self.get_bytes(key)
+        if value is None:
+            return default
+        return json.loads(value.decode('utf-8'))
+
+    def set(self, key: str, value: Any) -> None:
+        """Store a JSON-serialisable value under ``key``."""
+        self.set_bytes(key, json.dumps(value, ensure_ascii=False).encode('utf-8'))
+
+    def delete(self, key: str) -> bool:
+        """Remove ``key`` from the cache. Returns True if it was present."""
+        with self._lock:
+            deleted = self._delete(key)
+            self._conn.commit()
+            return deleted
+
+    def clear(self) -> None:
+        """Remove every entry."""
+        with self._lock:
+            self._conn.execute("DELETE FROM cache_entries")
+            self._conn.commit()
+            self._accessed.clear()
+            self._total = 0
+
+    def stats(self) -> Dict[str, int]:
+        """Return hit/miss counters and the current size of the cache."""
+        with self._lock:
+            entries, size = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM cache_entries"
+            ).fetchone()
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'entries': entries,
+            'bytes': size
+        }
+
+    def _count_bytes(self) -> int:
+        return self._conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM cache_entries"
+        ).fetchone()[0]
+
+    def _delete(self, key: str) -> bool:
+        """Delete ``key`` and subtract its size from the running total."""
+        self._accessed.pop(key, None)
+        row = self._conn.execute(
+            "SELECT size FROM cache_entries WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return False
+        self._conn.execute("DELETE FROM cache_entries WHERE key = ?", (key,))
+        self._total -= row[0]
+        return True
+
+    def _flush_accessed(self) -> None:
+        """Write the pending access times (the caller commits)."""
+        if self._accessed:
+            self._conn.executemany(
+                "UPDATE cache_entries SET accessed_at = ? WHERE key = ?",
+                [(accessed_at, key) for key, accessed_at in self._accessed.items()]
+            )
+            self._accessed.clear()
+        self._accessed_flushed_at = time.monotonic()
+
+    def _evict(self, now: float) -> None:
+        """Drop expired entries, then least recently used ones over max_bytes."""
+        if self.ttl is not None and time.monotonic() - self._expired_at >= EXPIRE_INTERVAL:
+            # 期限切れは読み出し時にも確認するため、削除は一定間隔でまとめて行う
+            self._expired_at = time.monotonic()
+            cursor = self._conn.execute(
+                "DELETE FROM cache_entries WHERE created_at < ?", (now - self.ttl,)
+            )
+            if cursor.rowcount:
+                self._total = self._count_bytes()
+
+        if self._total <= self.max_bytes:
+            return
+
+        # 他のプロセスも同じファイルに書き込むため、削除の前に正確な合計を数え直す
+        total = self._count_bytes()
+        self._total = total
+        if total <= self.max_bytes:
+            return
+
+        # 最近使ったエントリを追い出さないよう、アクセス時刻を先に書き込む
+        self._flush_accessed()
+        evicted = []
+        for key, size in self._conn.execute(
+            "SELECT key, size FROM cache_entries ORDER BY accessed_at"
+        ):
+            if total <= self.max_bytes:
+                break
+            evicted.append((key,))
+            total -= size
+        self._conn.executemany("DELETE FROM cache_entries WHERE key = ?", evicted)
+        self._total = total
+
+    def __del__(self):
+        """Cleanup."""
+        try:
+            self._flush_accessed()
+            self._conn.commit()
+            self._conn.close()
+        except Exception:
+            pass
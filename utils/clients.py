@@ -0,0 +1,94 @@
+"""Process-wide API clients shared by every Streamlit session.
+
+Each factory is wrapped in ``st.cache_resource``, so the Supabase client,
+the YouTube discovery client and the Gemini model are built once per server
+process and reused across sessions and reruns. The handlers are safe to use
+from several script threads at once.
+"""
+import os
+import streamlit as st
+from .db_handler import DatabaseHandler
+from .gemini_processor import GeminiProcessor
+from .jobs import JobQueue
+from .pipeline import run_summary
+from .summary_cache import SummaryCache
+from .youtube_handler import YouTubeHandler
+
+
+@st.cache_resource(show_spinner=False)
+def get_db_handler() -> DatabaseHandler:
+    """Return the shared database handler (not cached if connecting fails).
+
+    The local search and vector indexes start syncing in the background
+    right away, so the first related-summaries lookup does not wait for it.
+    """
+    handler = DatabaseHandler()
+    handler.refresh_indexes_in_background()
+    return handler
+
+
+class _SharedDatabaseHandler:
+    """Stand-in that looks up ``get_db_handler()`` on every attribute access.
+
+    The cached resources below outlive a failed first connection, so they
+    hold this instead of a handler: once the database is reachable again
+    the next call uses it. While it is down, calls raise the connection
+    error, which the summary cache and transcript store already treat as
+    a miss.
+    """
+
+    def __getattr__(self, name):
+        return getattr(get_db_handler(), name)
+
+
+def _current_db_handler():
+    """Return the shared database handler, or None if it cannot connect right now."""
+    try:
+        return get_db_handler()
+    except Exception:
+        return None
+
+
+@st.cache_resource(show_spinner=False)
+def get_summary_cache() -> SummaryCache:
+    """Return the shared summary cache, backed by the database when available."""
+    return SummaryCache(db_handler=_SharedDatabaseHandler())
+
+
+@st.cache_resource(show_spinner=False)
+def get_youtube_handler() -> YouTubeHandler:
+    """Return the shared YouTube handler, reusing stored transcripts when the database is available."""
+    return YouTubeHandler(api_key=os.environ['YOUTUBE_API_KEY'],
+                          transcript_store=_SharedDatabaseHandler())
+
+
+@st.cache_resource(show_spinner=False)
+def get_gemini_processor() -> GeminiProcessor:
+    """Return the shared Gemini processor."""
+    return GeminiProcessor(
+        api_key=os.environ['GEMINI_API_KEY'],
+        summary_cache=get_summary_cache()
+    )
+
+
+@st.cache_resource(show_spinner=False)
+def get_job_queue() -> JobQueue:
+    """Return the background queue that runs summary jobs for every session.
+
+    Jobs for the same videos and language are merged while one is still
+    unfinished, so concurrent identical requests are processed once.
+    """
+    youtube_handler = get_youtube_handler()
+    gemini_processor = get_gemini_processor()
+
+    def handler(params, report):
+        # ジョブごとに解決して、起動時に接続できなかったデータベースも使えるようにする
+        return run_summary(
+            youtube_handler, gemini_processor, _current_db_handler(),
+            urls=params['urls'],
+            language=params['language'],
+            force=params['force'],
+            on_text=report
+        )
+
+    return JobQueue(handler, workers=int(os.environ.get('JOB_WORKERS', '2')))
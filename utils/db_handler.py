@@ -1,14 +1,64 @@
 from datetime import datetime
+import hashlib
+import httpx
 import os
 from supabase.client import create_client, Client
-from typing import List, Optional, Tuple
+from typing import Callable, Dict, List, Optional, Tuple
+import threading
+import time
 import traceback
+import zlib
 import streamlit as st
+from . import metrics
+from .cache import default_cache_dir, default_cache_path
+from .local_db import LocalClient
+from .search_index import SearchIndex
+from .transcript import Transcript
+from .vector_index import VectorIndex
+
+# 一括保存時の1リクエストあたりの行数
+SAVE_CHUNK_SIZE = 100
+
+# 接続確認結果を再利用する秒数
+HEALTH_CHECK_TTL = 60.0
+
+# 再接続して再試行する通信エラー（PostgRESTのAPIErrorなどはそのまま呼び出し元へ）
+CONNECTION_ERRORS = (httpx.TransportError, OSError)
+
+# 一覧表示用の抜粋の文字数と、一覧クエリで取得する列（要約本文は含めない）
+EXCERPT_LENGTH = 200
+LIST_COLUMNS = 'id,video_id,title,language,timestamp,thumbnail_url,excerpt,prompt_hash'
+
+# 検索インデックスへ同期する列と、1リクエストあたりの行数・同期間隔
+SEARCH_COLUMNS = 'id,video_id,title,summary,language,timestamp,thumbnail_url'
+SEARCH_SYNC_PAGE_SIZE = 1000
+SEARCH_SYNC_INTERVAL = 60.0
+# 索引とデータベースの行IDを突き合わせる間隔と、不足行を取得するときの1リクエストあたりのID数
+SEARCH_RECONCILE_INTERVAL = 600.0
+SEARCH_RECONCILE_FETCH_SIZE = 200
+
+# 関連する要約の件数と、言語で絞り込む前に近傍から取り出す倍率
+RELATED_LIMIT = 5
+RELATED_OVERSAMPLE = 4
+# これより類似度（コサイン）が低い要約は関連として表示しない
+RELATED_MIN_SCORE = 0.25
+
+def _encode_transcript(data: bytes) -> str:
+    """Compress a serialised transcript into PostgREST's bytea text form (``\\x<hex>``)."""
+    return '\\x' + zlib.compress(data).hex()
+
+
+def _decode_transcript(value) -> Transcript:
+    if isinstance(value, str):
+        value = bytes.fromhex(value[2:] if value.startswith('\\x') else value)
+    return Transcript.from_bytes(zlib.decompress(value))
+
 
 class VideoSummary:
     def __init__(self, id: int, video_id: str, title: str, summary: str, 
                  language: str, timestamp: datetime, source_urls: str,
-                 thumbnail_url: str = None):
+                 thumbnail_url: str = None, prompt_hash: str = None,
+                 excerpt: str = None):
         self.id = id
         self.video_id = video_id
         self.title = title
@@ -17,19 +67,78 @@ class VideoSummary:
         self.timestamp = timestamp
         self.source_urls = source_urls
         self.thumbnail_url = thumbnail_url
+        self.prompt_hash = prompt_hash
+        self.excerpt = excerpt
+
+    @classmethod
+    def from_row(cls, item: dict) -> 'VideoSummary':
+        """Build a VideoSummary from a video_summaries row.
+
+        Rows from list queries (``LIST_COLUMNS``) have no ``summary`` or
+        ``source_urls``; those attributes are then None.
+        """
+        return cls(
+            id=item['id'],
+            video_id=item['video_id'],
+            title=item['title'],
+            summary=item.get('summary'),
+            language=item['language'],
+            timestamp=datetime.fromisoformat(item['timestamp']),
+            source_urls=item.get('source_urls'),
+            thumbnail_url=item.get('thumbnail_url'),
+            prompt_hash=item.get('prompt_hash'),
+            excerpt=item.get('excerpt')
+        )
 
 class DatabaseHandler:
-    def __init__(self):
+    def __init__(self, client=None, health_check_ttl: float = HEALTH_CHECK_TTL,
+                 search_index: Optional[SearchIndex] = None,
+                 vector_index: Optional[VectorIndex] = None):
+        """Connect to Supabase, or use ``client`` if one is given.
+
+        Setting ``DATABASE_BACKEND=sqlite`` uses the local SQLite stand-in at
+        ``LOCAL_DB_PATH`` instead of Supabase (for offline use and benchmarks).
+        A successful query marks the connection healthy for
+        ``health_check_ttl`` seconds, during which ``verify_connection`` does
+        not hit the database.
+
+        ``search_index`` is the local full-text index used by
+        ``search_summaries`` (default: ``search.sqlite3`` in the cache
+        directory). ``vector_index`` holds the summary embeddings used by
+        ``related_summaries`` (default: ``vectors/`` in the cache directory).
+        """
+        self.health_check_ttl = health_check_ttl
+        self._healthy_until = 0.0
+        self._client_lock = threading.Lock()
+        self._client_factory: Optional[Callable] = None
+        self.search_index = search_index or SearchIndex(default_cache_path('search'))
+        self.vector_index = vector_index if vector_index is not None else \
+            VectorIndex(os.path.join(default_cache_dir(), 'vectors'))
+        self._search_lock = threading.Lock()
+        self._search_synced_at = 0.0
+        self._search_reconciled_at = 0.0
+        self._vectors_backfilled = False
+        self._refresh_lock = threading.Lock()
+        self._refresh_thread: Optional[threading.Thread] = None
+
         try:
-            supabase_url = os.environ.get('SUPABASE_URL')
-            supabase_key = os.environ.get('SUPABASE_KEY')
-            
-            if not supabase_url or not supabase_key:
-                st.error("Supabase credentials not found in environment variables")
-                raise ValueError("Supabase credentials not found in environment variables")
+            if client is not None:
+                self.client = client
+            elif os.environ.get('DATABASE_BACKEND') == 'sqlite':
+                local_db_path = os.environ.get('LOCAL_DB_PATH', '.cache/local.sqlite3')
+                self._client_factory = lambda: LocalClient(local_db_path)
+                self.client = self._client_factory()
+            else:
+                supabase_url = os.environ.get('SUPABASE_URL')
+                supabase_key = os.environ.get('SUPABASE_KEY')
+                
+                if not supabase_url or not supabase_key:
+                    st.error("Supabase credentials not found in environment variables")
+                    raise ValueError("Supabase credentials not found in environment variables")
 
-            st.info("Initializing Supabase client...")
-            self.client = create_client(supabase_url, supabase_key)
+                st.info("Initializing Supabase client...")
+                self._client_factory = lambda: create_client(supabase_url, supabase_key)
+                self.client = self._client_factory()
             
             # Test connection
             if not self.verify_connection():
@@ -43,37 +152,122 @@ class DatabaseHandler:
             st.error(f"Stack trace: {traceback.format_exc()}")
             raise Exception(f"Failed to initialize database connection: {str(e)}")
 
-    def verify_connection(self) -> bool:
-        """Verify database connection is active."""
+    def verify_connection(self, force: bool = False) -> bool:
+        """Verify database connection is active.
+
+        Returns the cached result while the last successful query is younger
+        than ``health_check_ttl``; ``force`` always probes the database.
+        """
+        if not force and self.is_healthy():
+            return True
         try:
-            # Use from_ instead of table for Supabase client
-            response = self.client.from_('video_summaries').select('id').limit(1).execute()
+            self._execute(lambda: self.client.from_('video_summaries').select('id').limit(1),
+                          operation='verify')
             return True
         except Exception as e:
             st.error(f"Connection verification failed: {str(e)}")
             st.error(f"Stack trace: {traceback.format_exc()}")
             return False
 
+    def is_healthy(self) -> bool:
+        """Return True if a query succeeded within the health-check TTL."""
+        return time.monotonic() < self._healthy_until
+
+    def _execute(self, build_query: Callable, retry: bool = True, operation: str = 'query'):
+        """Execute a query, tracking liveness and reconnecting on failure.
+
+        ``build_query`` must build the query from ``self.client`` so it can be
+        rebuilt on a fresh client. Connection errors (``CONNECTION_ERRORS``)
+        mark the connection unhealthy and trigger a reconnect; with ``retry``
+        (for reads and other idempotent statements) the query is then run
+        once more. Other errors, e.g. constraint violations reported by
+        PostgREST, are raised unchanged. ``operation`` labels the query in
+        metrics.
+        """
+        with metrics.span('db_query', operation=operation) as span:
+            try:
+                response = build_query().execute()
+            except CONNECTION_ERRORS:
+                self._healthy_until = 0.0
+                self._reconnect()
+                if not retry:
+                    raise
+                metrics.count('db_retries_total', operation=operation)
+                response = build_query().execute()
+            span.set(rows=len(response.data or []))
+        self._healthy_until = time.monotonic() + self.health_check_ttl
+        return response
+
+    def _reconnect(self) -> None:
+        """Replace the client with a new one (no-op for injected clients)."""
+        if self._client_factory is None:
+            return
+        with self._client_lock:
+            try:
+                self.client = self._client_factory()
+            except Exception:
+                # 次のクエリで再度接続を試みる
+                pass
+
+    def _summary_row(self, video_id: str, title: str, summary: str,
+                     language: str, source_urls: str, thumbnail_url: str = None,
+                     prompt_hash: str = None, source_key: str = None) -> Dict:
+        """Build a video_summaries row."""
+        data = {
+            "video_id": video_id,
+            "title": title,
+            "summary": summary,
+            "language": language,
+            "source_urls": source_urls,
+            "thumbnail_url": thumbnail_url,
+            "excerpt": summary[:EXCERPT_LENGTH],
+            "timestamp": datetime.utcnow().isoformat()
+        }
+        if prompt_hash:
+            data["prompt_hash"] = prompt_hash
+        if source_key:
+            data["source_key"] = source_key
+        return data
+
     def save_summary(self, video_id: str, title: str, summary: str, 
-                    language: str, source_urls: str, thumbnail_url: str = None) -> bool:
-        """Save a video summary to the database."""
+                    language: str, source_urls: str, thumbnail_url: str = None,
+                    prompt_hash: str = None, source_key: str = None,
+                    videos: Optional[List[Dict]] = None) -> bool:
+        """Save a video summary to the database.
+
+        With ``source_key`` (see ``YouTubeHandler.source_key``) the row is upserted, so
+        saving the same video set and language again replaces the stored
+        summary instead of adding a duplicate.
+
+        ``videos`` are the ``process_videos`` results the summary was built
+        from; their metadata and transcripts are stored in ``videos`` and
+        linked to the summary in ``summary_sources``.
+        """
         try:
-            if not self.verify_connection():
-                st.error("Database connection is not active")
-                raise Exception("Database connection is not active")
-            
-            data = {
-                "video_id": video_id,
-                "title": title,
-                "summary": summary,
-                "language": language,
-                "source_urls": source_urls,
-                "thumbnail_url": thumbnail_url,
-                "timestamp": datetime.utcnow().isoformat()
-            }
+            data = self._summary_row(video_id, title, summary, language,
+                                     source_urls, thumbnail_url, prompt_hash, source_key)
             
             # Use from_ instead of table for Supabase client
-            response = self.client.from_('video_summaries').insert(data).execute()
+            if source_key:
+                # upsertは冪等なので失敗時に再試行できる
+                response = self._execute(
+                    lambda: self.client.from_('video_summaries')
+                    .upsert(data, on_conflict='source_key'),
+                    operation='save'
+                )
+            else:
+                # 挿入は重複を避けるため再試行しない
+                response = self._execute(
+                    lambda: self.client.from_('video_summaries').insert(data), retry=False,
+                    operation='save'
+                )
+            self._index_rows(response.data)
+            if videos and response.data:
+                try:
+                    self._save_sources([(response.data[0]['id'], videos)])
+                except Exception as e:
+                    # 要約自体は保存済み（videos テーブルがない古いスキーマでも保存できる）
+                    st.warning(f"Could not save video metadata: {str(e)}")
             return True
             
         except Exception as e:
@@ -81,33 +275,129 @@ class DatabaseHandler:
             st.error(f"Stack trace: {traceback.format_exc()}")
             raise Exception(f"Database error: {str(e)}")
 
+    def save_summaries(self, summaries: List[Dict], chunk_size: int = SAVE_CHUNK_SIZE,
+                       on_conflict: Optional[str] = None) -> List[Tuple[bool, str]]:
+        """Save many summaries with one multi-row insert per chunk.
+
+        The ``videos`` of each summary are written to ``videos`` and
+        ``summary_sources`` with one set of requests per chunk. When a chunk
+        is rejected, its rows are retried one at a time to find the failing
+        ones; after a connection error a plain insert chunk is reported as
+        failed instead, since it may have been written.
+
+        Args:
+            summaries: Dicts with the keyword arguments of ``save_summary``
+            chunk_size: Rows sent per request
+            on_conflict: Comma-separated columns of a unique constraint to
+                upsert on; defaults to ``'source_key'`` when any row has one,
+                plain insert otherwise
+
+        Returns:
+            List[Tuple[bool, str]]: (Success status, Message) for each input row
+        """
+        results: List[Optional[Tuple[bool, str]]] = [None] * len(summaries)
+        # (入力の位置, 行, 動画) の組。不正な行はここで失敗として記録する
+        entries: List[Tuple[int, Dict, Optional[List[Dict]]]] = []
+        for index, summary in enumerate(summaries):
+            try:
+                summary = dict(summary)
+                videos = summary.pop('videos', None)
+                entries.append((index, self._summary_row(**summary), videos))
+            except Exception as e:
+                results[index] = (False, f"Invalid summary: {str(e)}")
+
+        # 複数行の挿入では全行のキーを揃える必要がある
+        for column in ("prompt_hash", "source_key"):
+            if any(column in row for _, row, _ in entries):
+                for _, row, _ in entries:
+                    row.setdefault(column, None)
+        if on_conflict is None and any(row.get("source_key") for _, row, _ in entries):
+            on_conflict = "source_key"
+
+        for start in range(0, len(entries), max(1, chunk_size)):
+            chunk = entries[start:start + chunk_size]
+            try:
+                response = self._write_rows([row for _, row, _ in chunk], on_conflict)
+                saved = [(entry, response.data[position] if response.data and
+                          len(response.data) == len(chunk) else None)
+                         for position, entry in enumerate(chunk)]
+            except Exception as e:
+                if isinstance(e, CONNECTION_ERRORS) and not on_conflict:
+                    # タイムアウトや切断では挿入が反映されたか分からないため、
+                    # 行ごとに挿入し直すと重複しうる。チャンク全体を失敗とする
+                    for index, _, _ in chunk:
+                        results[index] = (False, f"Database error: {str(e)}")
+                    continue
+                # サーバーが拒否したチャンク（制約違反など）か、upsert で再実行しても
+                # 重複しない場合は、行ごとに再試行して失敗行を特定する
+                saved = []
+                for entry in chunk:
+                    try:
+                        response = self._write_rows([entry[1]], on_conflict)
+                        saved.append((entry, response.data[0] if response.data else None))
+                    except Exception as e:
+                        results[entry[0]] = (False, f"Database error: {str(e)}")
+
+            message = "Summary saved successfully"
+            sources = [(row['id'], videos) for (_, _, videos), row in saved
+                       if videos and row is not None]
+            if sources:
+                try:
+                    self._save_sources(sources)
+                except Exception as e:
+                    # 要約自体は保存済み（videos テーブルがない古いスキーマでも保存できる）
+                    message = f"Summary saved; could not save video metadata: {str(e)}"
+            for (index, _, _), _ in saved:
+                results[index] = (True, message)
+
+        return results
+
+    def _write_rows(self, rows: List[Dict], on_conflict: Optional[str] = None):
+        """Insert (or upsert) rows in a single request."""
+        if on_conflict:
+            response = self._execute(
+                lambda: self.client.from_('video_summaries').upsert(rows, on_conflict=on_conflict),
+                operation='save_batch'
+            )
+        else:
+            response = self._execute(
+                lambda: self.client.from_('video_summaries').insert(rows), retry=False,
+                operation='save_batch'
+            )
+        self._index_rows(response.data)
+        return response
+
+    def _index_rows(self, rows: Optional[List[Dict]]) -> None:
+        """Add freshly written rows to the search and vector indexes."""
+        if not rows:
+            return
+        try:
+            self.search_index.add_many(rows)
+        except Exception:
+            # 索引の失敗で保存を失敗扱いにしない（次回の同期で取り込まれる）
+            pass
+        self._embed_rows(rows)
+
+    def _embed_rows(self, rows: List[Dict]) -> None:
+        try:
+            self.vector_index.add_many(rows)
+        except Exception:
+            # 埋め込みに失敗した行は次回の補完で取り込まれる
+            self._vectors_backfilled = False
+
     def get_recent_summaries(self, limit: int = 10) -> List[VideoSummary]:
         """Get recent summaries from the database."""
         try:
-            if not self.verify_connection():
-                st.error("Database connection is not active")
-                return []
-            
             # Use from_ instead of table for Supabase client
-            response = self.client.from_('video_summaries')\
-                .select('*')\
-                .order('timestamp', desc=True)\
-                .limit(limit)\
-                .execute()
+            response = self._execute(
+                lambda: self.client.from_('video_summaries')
+                .select('*')
+                .order('timestamp', desc=True)
+                .limit(limit),
+                operation='recent'
+            )
             
-            return [
-                VideoSummary(
-                    id=item['id'],
-                    video_id=item['video_id'],
-                    title=item['title'],
-                    summary=item['summary'],
-                    language=item['language'],
-                    timestamp=datetime.fromisoformat(item['timestamp']),
-                    source_urls=item['source_urls'],
-                    thumbnail_url=item.get('thumbnail_url')
-                )
-                for item in response.data
-            ] if response.data else []
+            return [VideoSummary.from_row(item) for item in response.data] if response.data else []
             
         except Exception as e:
             st.error(f"Error in get_recent_summaries: {str(e)}")
@@ -117,36 +407,488 @@ class DatabaseHandler:
                                 limit: int = 10) -> List[VideoSummary]:
         """Get summaries filtered by language."""
         try:
-            if not self.verify_connection():
-                st.error("Database connection is not active")
-                return []
-            
             # Use from_ instead of table for Supabase client
-            response = self.client.from_('video_summaries')\
-                .select('*')\
-                .eq('language', language)\
-                .order('timestamp', desc=True)\
-                .limit(limit)\
-                .execute()
+            response = self._execute(
+                lambda: self.client.from_('video_summaries')
+                .select('*')
+                .eq('language', language)
+                .order('timestamp', desc=True)
+                .limit(limit),
+                operation='by_language'
+            )
             
-            return [
-                VideoSummary(
-                    id=item['id'],
-                    video_id=item['video_id'],
-                    title=item['title'],
-                    summary=item['summary'],
-                    language=item['language'],
-                    timestamp=datetime.fromisoformat(item['timestamp']),
-                    source_urls=item['source_urls'],
-                    thumbnail_url=item.get('thumbnail_url')
-                )
-                for item in response.data
-            ] if response.data else []
+            return [VideoSummary.from_row(item) for item in response.data] if response.data else []
             
         except Exception as e:
             st.error(f"Error in get_summaries_by_language: {str(e)}")
             return []
 
+    def get_summaries_page(self, language: str, limit: int = 10,
+                           cursor: Optional[Tuple[str, int]] = None
+                           ) -> Tuple[List[VideoSummary], Optional[Tuple[str, int]]]:
+        """Get one page of summaries, newest first, using keyset pagination.
+
+        Only the light-weight ``LIST_COLUMNS`` are fetched; load the full text
+        with ``get_summary_text``. Pages are ordered by ``(timestamp, id)`` so
+        each page costs the same regardless of how deep it is.
+
+        Args:
+            language: Language to filter by
+            limit: Page size
+            cursor: ``(timestamp, id)`` of the last row of the previous page
+
+        Returns:
+            Tuple of the page and the cursor for the next page (None if this
+            is the last page)
+        """
+        def build_query():
+            query = self.client.from_('video_summaries')\
+                .select(LIST_COLUMNS)\
+                .eq('language', language)
+            if cursor is not None:
+                timestamp, last_id = cursor
+                query = query.or_(
+                    f'timestamp.lt."{timestamp}",'
+                    f'and(timestamp.eq."{timestamp}",id.lt.{last_id})'
+                )
+            # 次ページの有無を判定するため1件多く取得する
+            return query.order('timestamp', desc=True)\
+                .order('id', desc=True)\
+                .limit(limit + 1)
+
+        try:
+            response = self._execute(build_query, operation='page')
+            rows = response.data or []
+
+            next_cursor = None
+            if len(rows) > limit:
+                rows = rows[:limit]
+                next_cursor = (rows[-1]['timestamp'], rows[-1]['id'])
+
+            return [VideoSummary.from_row(item) for item in rows], next_cursor
+
+        except Exception as e:
+            st.error(f"Error in get_summaries_page: {str(e)}")
+            return [], None
+
+    def get_summary_text(self, summary_id: int) -> Optional[str]:
+        """Get the full text of one summary."""
+        try:
+            response = self._execute(
+                lambda: self.client.from_('video_summaries')
+                .select('summary')
+                .eq('id', summary_id)
+                .limit(1),
+                operation='summary_text'
+            )
+            return response.data[0]['summary'] if response.data else None
+
+        except Exception as e:
+            st.error(f"Error in get_summary_text: {str(e)}")
+            return None
+
+    def get_summary_by_prompt_hash(self, prompt_hash: str) -> Optional[VideoSummary]:
+        """Get the most recent summary generated from the given prompt hash.
+
+        Used as the remote tier of the summary cache, so errors are raised to
+        the caller instead of being reported in the UI.
+        """
+        response = self._execute(
+            lambda: self.client.from_('video_summaries')
+            .select('*')
+            .eq('prompt_hash', prompt_hash)
+            .order('timestamp', desc=True)
+            .limit(1),
+            operation='prompt_hash'
+        )
+
+        return VideoSummary.from_row(response.data[0]) if response.data else None
+
+    def forget_prompt_hash(self, prompt_hash: str) -> int:
+        """Clear ``prompt_hash`` on stored summaries so the cache no longer finds them.
+
+        The summaries themselves are kept. Errors are raised to the caller.
+        Returns the number of rows changed.
+        """
+        response = self._execute(
+            lambda: self.client.from_('video_summaries')
+            .update({'prompt_hash': None})
+            .eq('prompt_hash', prompt_hash),
+            operation='forget_prompt_hash'
+        )
+        return len(response.data or [])
+
+    def _save_sources(self, sources: List[Tuple[int, List[Dict]]]) -> None:
+        """Upsert the videos of summaries and link them in summary_sources.
+
+        ``sources`` pairs each summary ID with the videos it was built from.
+        A video listed more than once keeps its first position, and a
+        transcript is only sent when it differs (by hash of track and
+        content) from the one already stored for the video.
+        """
+        # 同じ動画が複数回指定された場合は最初の位置だけを残す
+        # （1回のupsertに同じキーが2回あるとPostgreSQLはエラーにする）
+        videos: Dict[str, Dict] = {}
+        links: Dict[Tuple[int, str], Dict] = {}
+        for summary_id, summary_videos in sources:
+            positions: Dict[str, int] = {}
+            for video in summary_videos:
+                video_id = video['video_id']
+                videos.setdefault(video_id, video)
+                if video_id not in positions:
+                    positions[video_id] = len(positions)
+                    links[(summary_id, video_id)] = {
+                        'summary_id': summary_id, 'video_id': video_id,
+                        'position': positions[video_id]
+                    }
+        if not links:
+            return
+
+        video_ids = list(videos)
+        stored = self._execute(
+            lambda: self.client.from_('videos').select('id,transcript_hash').in_('id', video_ids),
+            operation='video_hashes'
+        ).data or []
+        stored_hashes = {row['id']: row['transcript_hash'] for row in stored}
+
+        now = datetime.utcnow().isoformat()
+        # 一括upsertは全行で同じ列が必要なため、字幕を送る行と送らない行を分ける
+        with_transcript: List[Dict] = []
+        without_transcript: List[Dict] = []
+        for video in videos.values():
+            row = {
+                'id': video['video_id'],
+                'title': video.get('title'),
+                'channel_id': video.get('channel_id'),
+                'channel_title': video.get('channel_title'),
+                'thumbnail_url': video.get('thumbnail'),
+                'updated_at': now
+            }
+            transcript = video.get('timed_transcript')
+            if transcript is not None:
+                track = video.get('transcript_track') or ''
+                data = transcript.to_bytes()
+                transcript_hash = hashlib.sha256(track.encode('utf-8') + b'\0' + data).hexdigest()
+                if stored_hashes.get(row['id']) != transcript_hash:
+                    row.update(transcript_track=track, transcript_hash=transcript_hash,
+                               transcript=_encode_transcript(data))
+                    with_transcript.append(row)
+                    continue
+            without_transcript.append(row)
+
+        for rows in (with_transcript, without_transcript):
+            if rows:
+                self._execute(
+                    lambda rows=rows: self.client.from_('videos').upsert(rows, on_conflict='id'),
+                    operation='save_videos'
+                )
+
+        link_rows = list(links.values())
+        self._execute(
+            lambda: self.client.from_('summary_sources')
+            .upsert(link_rows, on_conflict='summary_id,video_id'),
+            operation='save_sources'
+        )
+
+    def get_stored_transcript(self, video_id: str, track: str) -> Optional[Transcript]:
+        """Return the transcript stored for a video if it is of caption ``track``.
+
+        Used as a fallback tier of the transcript cache, so errors are
+        raised to the caller instead of being reported in the UI.
+        """
+        response = self._execute(
+            lambda: self.client.from_('videos')
+            .select('transcript_track,transcript')
+            .eq('id', video_id)
+            .limit(1),
+            operation='stored_transcript'
+        )
+        row = response.data[0] if response.data else None
+        if row is None or row['transcript_track'] != track or not row['transcript']:
+            return None
+        return _decode_transcript(row['transcript'])
+
+    def _summaries_by_ids(self, summary_ids: List[int], limit: int) -> List[VideoSummary]:
+        """Fetch list rows for the given summary IDs, newest first."""
+        if not summary_ids:
+            return []
+        response = self._execute(
+            lambda: self.client.from_('video_summaries')
+            .select(LIST_COLUMNS)
+            .in_('id', summary_ids)
+            .order('timestamp', desc=True)
+            .order('id', desc=True)
+            .limit(limit),
+            operation='by_ids'
+        )
+        return [VideoSummary.from_row(item) for item in response.data or []]
+
+    def get_summaries_by_video(self, video_id: str, limit: int = 20) -> List[VideoSummary]:
+        """Get the summaries built from a video (as any of their sources), newest first."""
+        try:
+            links = self._execute(
+                lambda: self.client.from_('summary_sources')
+                .select('summary_id')
+                .eq('video_id', video_id),
+                operation='sources_by_video'
+            ).data or []
+            return self._summaries_by_ids([link['summary_id'] for link in links], limit)
+
+        except Exception as e:
+            st.error(f"Error in get_summaries_by_video: {str(e)}")
+            return []
+
+    def get_summaries_by_channel(self, channel_id: str, limit: int = 20) -> List[VideoSummary]:
+        """Get the summaries built from any video of a channel, newest first."""
+        try:
+            videos = self._execute(
+                lambda: self.client.from_('videos')
+                .select('id')
+                .eq('channel_id', channel_id),
+                operation='videos_by_channel'
+            ).data or []
+            if not videos:
+                return []
+            links = self._execute(
+                lambda: self.client.from_('summary_sources')
+                .select('summary_id')
+                .in_('video_id', [video['id'] for video in videos]),
+                operation='sources_by_video'
+            ).data or []
+            summary_ids = sorted({link['summary_id'] for link in links})
+            return self._summaries_by_ids(summary_ids, limit)
+
+        except Exception as e:
+            st.error(f"Error in get_summaries_by_channel: {str(e)}")
+            return []
+
+    def sync_search_index(self) -> int:
+        """Pull rows added since the previous sync into the search index.
+
+        Rows are fetched in order of their server-assigned ``id`` from where
+        the previous sync left off, so a sync only transfers rows added since
+        then. Rows it cannot see (deleted elsewhere, or committed after a
+        higher ID was synced) are handled by ``reconcile_search_index``.
+
+        Returns:
+            int: Number of rows added
+        """
+        added = 0
+        with self._search_lock:
+            while True:
+                last_id = self.search_index.sync_cursor()
+
+                def build_query():
+                    query = self.client.from_('video_summaries').select(SEARCH_COLUMNS)
+                    if last_id is not None:
+                        query = query.gt('id', last_id)
+                    return query.order('id').limit(SEARCH_SYNC_PAGE_SIZE)
+
+                rows = self._execute(build_query, operation='search_sync').data or []
+                if rows:
+                    self.search_index.add_many(rows)
+                    self.search_index.set_sync_cursor(rows[-1]['id'])
+                    self._embed_rows(rows)
+                added += len(rows)
+                if len(rows) < SEARCH_SYNC_PAGE_SIZE:
+                    break
+            self._search_synced_at = time.monotonic()
+        return added
+
+    def reconcile_search_index(self) -> Tuple[int, int]:
+        """Make the local indexes hold exactly the rows in video_summaries.
+
+        Lists every ID in the table (IDs only, one page at a time), removes
+        indexed rows that no longer exist and fetches rows the incremental
+        sync missed.
+
+        Returns:
+            Tuple[int, int]: Number of rows added and removed
+        """
+        with self._search_lock:
+            # 一覧より先に取得する（この後に索引へ追加された行を削除しないように）
+            local_ids = self.search_index.ids()
+            remote_ids = set()
+            last_id = None
+            while True:
+                def build_query():
+                    query = self.client.from_('video_summaries').select('id')
+                    if last_id is not None:
+                        query = query.gt('id', last_id)
+                    return query.order('id').limit(SEARCH_SYNC_PAGE_SIZE)
+
+                rows = self._execute(build_query, operation='search_reconcile').data or []
+                remote_ids.update(row['id'] for row in rows)
+                if len(rows) < SEARCH_SYNC_PAGE_SIZE:
+                    break
+                last_id = rows[-1]['id']
+
+            removed = local_ids - remote_ids
+            if removed:
+                self.search_index.remove_many(removed)
+                for summary_id in removed:
+                    self.vector_index.remove(summary_id)
+
+            missing = sorted(remote_ids - local_ids)
+            for start in range(0, len(missing), SEARCH_RECONCILE_FETCH_SIZE):
+                ids = missing[start:start + SEARCH_RECONCILE_FETCH_SIZE]
+                rows = self._execute(
+                    lambda: self.client.from_('video_summaries').select(SEARCH_COLUMNS).in_('id', ids),
+                    operation='search_reconcile'
+                ).data or []
+                if rows:
+                    self.search_index.add_many(rows)
+                    self._embed_rows(rows)
+            self._search_reconciled_at = time.monotonic()
+        return len(missing), len(removed)
+
+    def _sync_due(self) -> bool:
+        now = time.monotonic()
+        return (now - self._search_synced_at > SEARCH_SYNC_INTERVAL
+                or now - self._search_reconciled_at > SEARCH_RECONCILE_INTERVAL)
+
+    def _sync_indexes(self) -> None:
+        """Sync the local indexes if the last sync is older than SEARCH_SYNC_INTERVAL.
+
+        Every ``SEARCH_RECONCILE_INTERVAL`` seconds the indexes are also
+        reconciled with the table.
+        """
+        if time.monotonic() - self._search_synced_at > SEARCH_SYNC_INTERVAL:
+            self.sync_search_index()
+        if time.monotonic() - self._search_reconciled_at > SEARCH_RECONCILE_INTERVAL:
+            self.reconcile_search_index()
+
+    def _sync_if_stale(self) -> None:
+        try:
+            self._sync_indexes()
+        except Exception as e:
+            # 同期できなくても索引済みの要約は検索できる
+            st.error(f"Error syncing search index: {str(e)}")
+
+    def refresh_indexes_in_background(self) -> None:
+        """Sync the search index and backfill the vector index on a background thread.
+
+        Does nothing if neither is due or a refresh is already running, so it
+        is cheap to call before every lookup.
+        """
+        if not self._sync_due() and self._vectors_backfilled:
+            return
+        with self._refresh_lock:
+            if self._refresh_thread is not None and self._refresh_thread.is_alive():
+                return
+            self._refresh_thread = threading.Thread(
+                target=self._refresh_indexes, name='index-refresh', daemon=True
+            )
+            self._refresh_thread.start()
+
+    def _refresh_indexes(self) -> None:
+        try:
+            self._sync_indexes()
+            if not self._vectors_backfilled:
+                self.backfill_vector_index()
+        except Exception:
+            # 次回の呼び出しで再試行する（スクリプトのスレッド外なので画面には出さない）
+            traceback.print_exc()
+
+    def backfill_vector_index(self) -> int:
+        """Embed summaries that are in the search index but not the vector index.
+
+        Covers rows indexed before the vector index existed, rows whose
+        embedding failed, and a rebuild after the embedder changed.
+
+        Returns:
+            int: Number of rows embedded
+        """
+        added = 0
+        with self._search_lock:
+            for rows in self.search_index.iter_rows():
+                missing = [row for row in rows if row['id'] not in self.vector_index]
+                if missing:
+                    self.vector_index.add_many(missing)
+                    added += len(missing)
+            self._vectors_backfilled = True
+        return added
+
+    def search_summaries(self, query: str, language: Optional[str] = None,
+                         limit: int = 20) -> List[Tuple[VideoSummary, str]]:
+        """Full-text search over summary titles and text, best match first.
+
+        Searches the local index, syncing it first if the last sync is older
+        than ``SEARCH_SYNC_INTERVAL`` seconds. Japanese and Chinese are
+        matched by character bigrams, so no word segmentation is needed.
+
+        Args:
+            query: Search words
+            language: Only return summaries in this language
+            limit: Maximum number of results
+
+        Returns:
+            List[Tuple[VideoSummary, str]]: Summary and highlighted snippet
+        """
+        self._sync_if_stale()
+
+        try:
+            return [
+                (VideoSummary.from_row(row), row['snippet'])
+                for row in self.search_index.search(query, language=language, limit=limit)
+            ]
+        except Exception as e:
+            st.error(f"Error in search_summaries: {str(e)}")
+            return []
+
+    def related_summaries(self, summary_id: Optional[int] = None, text: Optional[str] = None,
+                          language: Optional[str] = None, limit: int = RELATED_LIMIT,
+                          exclude_videos: Optional[List[str]] = None,
+                          min_score: float = RELATED_MIN_SCORE) -> List[Tuple[VideoSummary, float]]:
+        """Find saved summaries on similar topics, most similar first.
+
+        Looks up the neighbours of a saved summary (``summary_id``) or of any
+        text, e.g. a summary that was just generated (``text``), in the local
+        vector index. Syncing and backfilling the indexes run in the
+        background (``refresh_indexes_in_background``), so results reflect
+        the indexes as they are when the call is made.
+
+        Args:
+            summary_id: Saved summary to find neighbours of
+            text: Text to find neighbours of (used if ``summary_id`` is None)
+            language: Only return summaries in this language
+            limit: Maximum number of results
+            exclude_videos: Leave out summaries of these video IDs
+            min_score: Leave out summaries less similar than this
+
+        Returns:
+            List[Tuple[VideoSummary, float]]: Summary and cosine similarity
+        """
+        self.refresh_indexes_in_background()
+        try:
+            wanted = limit * RELATED_OVERSAMPLE
+            if summary_id is not None:
+                neighbours = self.vector_index.similar(summary_id, k=wanted)
+            elif text:
+                neighbours = self.vector_index.search_text(text, k=wanted)
+            else:
+                return []
+
+            excluded = set(exclude_videos or [])
+            rows = self.search_index.get_many([neighbour for neighbour, _ in neighbours])
+            results = []
+            for neighbour, score in neighbours:
+                # 近傍は類似度の高い順なので、下回ったら残りも対象外
+                if score < min_score:
+                    break
+                row = rows.get(neighbour)
+                if row is None or row['video_id'] in excluded:
+                    continue
+                if language and row['language'] != language:
+                    continue
+                results.append((VideoSummary.from_row(row), score))
+                if len(results) == limit:
+                    break
+            return results
+        except Exception as e:
+            st.error(f"Error in related_summaries: {str(e)}")
+            return []
+
     def delete_summary(self, summary_id: int) -> Tuple[bool, str]:
         """Delete a summary from the database.
         
@@ -157,24 +899,22 @@ class DatabaseHandler:
             Tuple[bool, str]: (Success status, Message)
         """
         try:
-            if not self.verify_connection():
-                return False, "Database connection is not active"
-
-            # First verify the summary exists
-            response = self.client.from_('video_summaries')\
-                .select('id')\
-                .eq('id', summary_id)\
-                .execute()
+            # 削除された行が返るため、存在確認と削除を1回のリクエストで行う
+            response = self._execute(
+                lambda: self.client.from_('video_summaries')
+                .delete()
+                .eq('id', summary_id),
+                operation='delete'
+            )
 
             if not response.data:
                 return False, "Summary not found"
 
-            # Delete the summary
-            response = self.client.from_('video_summaries')\
-                .delete()\
-                .eq('id', summary_id)\
-                .execute()
-
+            try:
+                self.search_index.remove(summary_id)
+                self.vector_index.remove(summary_id)
+            except Exception:
+                pass
             return True, "Summary deleted successfully"
 
         except Exception as e:
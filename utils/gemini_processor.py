@@ -1,66 +1,413 @@
-from typing import List, Dict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Iterator, List, Dict, Optional
+import asyncio
 import google.generativeai as genai
-import re
+import threading
+import time
+import weakref
+from . import metrics
+from .cache import SQLiteCache, default_cache_path
+from .summary_cache import SummaryCache
+from .prompt_packer import allocate_tokens, pack_contents
+from .rate_limiter import (RateLimiter, RetryPolicy, call_with_retry,
+                           call_with_retry_async, default_rate_limiter)
+from .text_chunker import chunk_text, estimate_tokens
+from .transcript_normalizer import contains_chinese, to_ascii_punctuation
+
+MODEL_NAME = 'gemini-pro'
+
+# gemini-proの入力上限（30,720トークン）から出力と見積もり誤差の余裕を引いた値
+DEFAULT_CONTEXT_BUDGET = 24000
+
+# 長い字幕を分割要約（map）する際のチャンクキャッシュ設定
+CHUNK_CACHE_TTL = 30 * 24 * 60 * 60
+CHUNK_CACHE_MAX_BYTES = 100 * 1024 * 1024
+
+# Map phase: condense one transcript chunk into notes for the final summary
+MAP_PROMPTS = {
+    'ja': "以下は動画の字幕の一部です。重要なポイント、引用、数値を漏らさず、簡潔な箇条書きのメモにまとめてください。出力は日本語で行ってください。\n\n",
+    'en': "The following is part of a video transcript. Condense it into concise bullet-point notes, keeping key points, quotes and figures. Write the notes in English.\n\n",
+    'zh': "以下是视频字幕的一部分。请将其整理为简洁的要点笔记，保留关键观点、引用和数据。必须使用简体中文。\n\n"
+}
+MAP_GENERATION_CONFIG = {
+    'temperature': 0.3,
+    'top_p': 0.8,
+    'top_k': 40,
+    'candidate_count': 1
+}
+
+# ストリーミング時、中国語出力かどうかを判定するまでにバッファする文字数
+ZH_STREAM_VALIDATION_CHARS = 200
 
 class GeminiProcessor:
-    def __init__(self, api_key: str):
+    def __init__(self, api_key: str, summary_cache: Optional[SummaryCache] = None,
+                 chunk_tokens: int = 1500, map_workers: int = 4,
+                 chunk_cache: Optional[SQLiteCache] = None,
+                 context_budget: int = DEFAULT_CONTEXT_BUDGET,
+                 rate_limiter: Optional[RateLimiter] = None,
+                 retry_policy: Optional[RetryPolicy] = None,
+                 max_concurrency: int = 8,
+                 model=None):
         genai.configure(api_key=api_key)
-        self.model = genai.GenerativeModel('gemini-pro')
+        # model はベンチマーク等で差し替えるためのもの
+        self.model = model if model is not None else genai.GenerativeModel(MODEL_NAME)
+        self.summary_cache = summary_cache if summary_cache is not None else SummaryCache()
+        self.chunk_tokens = chunk_tokens
+        self.map_workers = map_workers
+        self.context_budget = context_budget
+        # 同一クォータを共有するため、既定ではプロセス全体で1つのリミッターを使う
+        self.rate_limiter = rate_limiter if rate_limiter is not None else default_rate_limiter()
+        self.retry_policy = retry_policy if retry_policy is not None else RetryPolicy()
+        self.max_concurrency = max_concurrency
+        # イベントループごとのセマフォ（共有インスタンスを複数スレッドから使うため）
+        self._async_semaphores: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+        self._async_semaphores_lock = threading.Lock()
+
+        if chunk_cache is None:
+            chunk_cache = SQLiteCache(
+                default_cache_path('chunk_summaries'),
+                ttl=CHUNK_CACHE_TTL,
+                max_bytes=CHUNK_CACHE_MAX_BYTES
+            )
+        self.chunk_cache = chunk_cache
+
+    def _generation_config(self, language: str) -> Dict[str, Any]:
+        """Return generation parameters for the given language."""
+        if language == 'zh':
+            # Specific configuration for Chinese language generation
+            return {
+                'temperature': 0.9,  # Higher temperature for more natural Chinese
+                'top_p': 0.95,      # Higher diversity for Chinese expressions
+                'top_k': 40,
+                'candidate_count': 1,
+                'stop_sequences': ["English:", "Japanese:", "日本語:", "英語:"]
+            }
+        # Default configuration for other languages
+        return {
+            'temperature': 0.7,
+            'top_p': 0.8,
+            'top_k': 40,
+            'candidate_count': 1
+        }
 
-    def _is_chinese_text(self, text: str) -> bool:
-        """Validate if the text contains Chinese characters."""
-        return bool(re.search('[\u4e00-\u9fff]', text))
+    def get_cache_key(self, video_data: List[Dict], language: str = 'ja') -> str:
+        """Return the summary cache key for this input.
 
-    def generate_article(self, video_data: List[Dict], language: str = 'ja') -> str:
-        """Generate a summary from multiple video sources in specified language."""
+        The key covers the full, uncondensed transcripts and the chunking and
+        packing settings, so it can be computed without any map-phase requests.
+        """
         prompt = self._prepare_prompt(video_data, language)
-        
+        config = dict(self._generation_config(language),
+                      chunk_tokens=self.chunk_tokens,
+                      context_budget=self.context_budget)
+        return SummaryCache.make_key(prompt, language, MODEL_NAME, config)
+
+    def get_cached_article(self, video_data: List[Dict], language: str = 'ja') -> Optional[str]:
+        """Return a previously generated summary for identical input, if any."""
+        return self.summary_cache.get(self.get_cache_key(video_data, language))
+
+    def generate_article(self, video_data: List[Dict], language: str = 'ja',
+                         force: bool = False,
+                         on_usage: Optional[Callable[[List[Dict]], None]] = None,
+                         cache_key: Optional[str] = None) -> str:
+        """Generate a summary from multiple video sources in specified language.
+
+        Identical input (prompt, language and generation config) is served from
+        the summary cache unless ``force`` is set. ``on_usage`` receives the
+        per-video token report of the prompt when one is built. Callers that
+        already have ``get_cache_key`` for this input can pass it as
+        ``cache_key`` to skip building the prompt again.
+        """
+        cache_key = cache_key or self.get_cache_key(video_data, language)
+
+        if not force:
+            cached = self.summary_cache.get(cache_key)
+            if cached is not None:
+                return cached
+
         try:
-            if language == 'zh':
-                # Specific configuration for Chinese language generation
-                generation_config = genai.types.GenerationConfig(
-                    temperature=0.9,  # Higher temperature for more natural Chinese
-                    top_p=0.95,      # Higher diversity for Chinese expressions
-                    top_k=40,
-                    candidate_count=1,
-                    stop_sequences=["English:", "Japanese:", "日本語:", "英語:"]
-                )
-            else:
-                # Default configuration for other languages
-                generation_config = genai.types.GenerationConfig(
-                    temperature=0.7,
-                    top_p=0.8,
-                    top_k=40,
-                    candidate_count=1
-                )
+            prompt = self._build_reduce_prompt(video_data, language, on_usage)
+            generation_config = genai.types.GenerationConfig(**self._generation_config(language))
 
-            response = self.model.generate_content(prompt, generation_config=generation_config)
-            generated_text = response.text
+            generated_text = self._generate(prompt, generation_config)
 
             # Validate Chinese output if language is Chinese
-            if language == 'zh' and not self._is_chinese_text(generated_text):
+            if language == 'zh' and not contains_chinese(generated_text):
                 # Retry generation with stronger Chinese enforcement
-                prompt = f"务必使用简体中文回答。禁止使用其他语言。\n\n{prompt}"
-                response = self.model.generate_content(prompt, generation_config=generation_config)
-                generated_text = response.text
+                metrics.count('gemini_zh_retries_total', mode='sync')
+                prompt = self._enforce_chinese(prompt)
+                generated_text = self._generate(prompt, generation_config)
+
+        except Exception as e:
+            raise Exception(f"Gemini AI error: {str(e)}")
+
+        self.summary_cache.set(cache_key, generated_text)
+        return generated_text
 
-            return generated_text
+    def generate_article_stream(self, video_data: List[Dict], language: str = 'ja',
+                                force: bool = False,
+                                on_usage: Optional[Callable[[List[Dict]], None]] = None,
+                                cache_key: Optional[str] = None) -> Iterator[str]:
+        """Stream a summary as text chunks while Gemini is generating it.
+
+        For Chinese, the first ``ZH_STREAM_VALIDATION_CHARS`` characters are
+        buffered and checked before anything is yielded; if they are not
+        Chinese the stream is abandoned and retried with stronger enforcement.
+        The assembled text is stored in the summary cache once the stream ends.
+        ``cache_key`` is as for ``generate_article``.
+        """
+        cache_key = cache_key or self.get_cache_key(video_data, language)
+
+        if not force:
+            cached = self.summary_cache.get(cache_key)
+            if cached is not None:
+                yield cached
+                return
+
+        generation_config = genai.types.GenerationConfig(**self._generation_config(language))
+        parts = []
+        try:
+            prompt = self._build_reduce_prompt(video_data, language, on_usage)
+            chunks = self._stream_chunks(prompt, generation_config)
+
+            if language == 'zh':
+                # 先頭部分をバッファして中国語かどうかを早期に判定
+                buffered = []
+                buffered_chars = 0
+                for text in chunks:
+                    buffered.append(text)
+                    buffered_chars += len(text)
+                    if buffered_chars >= ZH_STREAM_VALIDATION_CHARS:
+                        break
+
+                if not contains_chinese(''.join(buffered)):
+                    metrics.count('gemini_zh_retries_total', mode='stream')
+                    chunks.close()
+                    buffered = []
+                    chunks = self._stream_chunks(self._enforce_chinese(prompt), generation_config)
+
+                for text in buffered:
+                    parts.append(text)
+                    yield text
+
+            for text in chunks:
+                parts.append(text)
+                yield text
 
         except Exception as e:
             raise Exception(f"Gemini AI error: {str(e)}")
 
-    def _preprocess_chinese_text(self, text: str) -> str:
-        """Preprocess Chinese text to handle encoding and segmentation properly."""
-        # Remove extra whitespace between Chinese characters
-        text = re.sub(r'([^\x00-\xff])\s+([^\x00-\xff])', r'\1\2', text)
-        # Ensure proper sentence breaks at Chinese punctuation
-        text = re.sub(r'([。！？；])\s*', r'\1\n', text)
-        # Convert traditional Chinese punctuation to simplified
-        text = text.replace('：', ':').replace('，', ',').replace('"', '"').replace('"', '"')
-        return text
-
-    def _prepare_prompt(self, video_data: List[Dict], language: str) -> str:
-        """Prepare prompt for Gemini AI with language specification."""
+        if parts:
+            self.summary_cache.set(cache_key, ''.join(parts))
+
+    async def generate_article_async(self, video_data: List[Dict], language: str = 'ja',
+                                     force: bool = False,
+                                     on_usage: Optional[Callable[[List[Dict]], None]] = None) -> str:
+        """Async version of ``generate_article`` for running many jobs at once.
+
+        Gemini calls go through ``generate_content_async`` behind a semaphore of
+        ``max_concurrency`` and the shared rate limiter, with retries on 429
+        and transient server errors. Cache lookups (SQLite and the database
+        tier) and prompt building run in worker threads so they never block
+        the event loop.
+        """
+        cache_key = await asyncio.to_thread(self.get_cache_key, video_data, language)
+
+        if not force:
+            cached = await asyncio.to_thread(self.summary_cache.get, cache_key)
+            if cached is not None:
+                return cached
+
+        try:
+            # map phase is thread-pooled and rate limited already
+            prompt = await asyncio.to_thread(self._build_reduce_prompt, video_data, language, on_usage)
+            generation_config = genai.types.GenerationConfig(**self._generation_config(language))
+
+            generated_text = await self._generate_async(prompt, generation_config)
+
+            # Validate Chinese output if language is Chinese
+            if language == 'zh' and not contains_chinese(generated_text):
+                # Retry generation with stronger Chinese enforcement
+                metrics.count('gemini_zh_retries_total', mode='async')
+                prompt = self._enforce_chinese(prompt)
+                generated_text = await self._generate_async(prompt, generation_config)
+
+        except Exception as e:
+            raise Exception(f"Gemini AI error: {str(e)}")
+
+        await asyncio.to_thread(self.summary_cache.set, cache_key, generated_text)
+        return generated_text
+
+    def _generate(self, prompt: str, generation_config, stage: str = 'reduce') -> str:
+        """Run one rate-limited generate_content call with retries."""
+        tokens = estimate_tokens(prompt)
+        with metrics.span('gemini_generate', stage=stage) as span:
+            response = call_with_retry(
+                lambda: self.model.generate_content(prompt, generation_config=generation_config),
+                self.retry_policy, self.rate_limiter, tokens
+            )
+            span.set(input_tokens=tokens, output_chars=len(response.text))
+        return response.text
+
+    async def _generate_async(self, prompt: str, generation_config) -> str:
+        """Run one rate-limited generate_content_async call with retries."""
+        tokens = estimate_tokens(prompt)
+        async with self._get_async_semaphore():
+            with metrics.span('gemini_generate', stage='reduce') as span:
+                response = await call_with_retry_async(
+                    lambda: self.model.generate_content_async(prompt, generation_config=generation_config),
+                    self.retry_policy, self.rate_limiter, tokens
+                )
+                span.set(input_tokens=tokens, output_chars=len(response.text))
+        return response.text
+
+    def _get_async_semaphore(self) -> asyncio.Semaphore:
+        """Return the concurrency semaphore for the running event loop."""
+        loop = asyncio.get_running_loop()
+        with self._async_semaphores_lock:
+            semaphore = self._async_semaphores.get(loop)
+            if semaphore is None:
+                semaphore = asyncio.Semaphore(self.max_concurrency)
+                self._async_semaphores[loop] = semaphore
+            return semaphore
+
+    def _stream_chunks(self, prompt: str, generation_config) -> Iterator[str]:
+        """Yield the text of each streamed response chunk."""
+        tokens = estimate_tokens(prompt)
+        with metrics.span('gemini_stream') as span:
+            started = time.perf_counter()
+            response = call_with_retry(
+                lambda: self.model.generate_content(
+                    prompt, generation_config=generation_config, stream=True
+                ),
+                self.retry_policy, self.rate_limiter, tokens
+            )
+            span.set(input_tokens=tokens)
+            output_chars = 0
+            for chunk in response:
+                try:
+                    text = chunk.text
+                except ValueError:
+                    # Chunks without text parts (e.g. only safety metadata)
+                    continue
+                if text:
+                    if output_chars == 0:
+                        metrics.observe('gemini_stream_first_chunk_seconds',
+                                        time.perf_counter() - started)
+                    output_chars += len(text)
+                    span.set(output_chars=output_chars)
+                    yield text
+
+    def _build_reduce_prompt(self, video_data: List[Dict], language: str,
+                             on_usage: Optional[Callable[[List[Dict]], None]] = None) -> str:
+        """Build the final (reduce) prompt within the context budget.
+
+        The budget left after the instructions and titles is divided across
+        videos by transcript length and optional ``relevance`` weight. Only
+        videos that do not fit their share are condensed by the map phase,
+        and anything still over its share is cut on a sentence boundary.
+        """
+        with metrics.span('gemini_prompt_build', language=language) as span:
+            empty = [None if 'error' in video else '' for video in video_data]
+            overhead = estimate_tokens(self._prepare_prompt(video_data, language, empty))
+            budget = max(0, self.context_budget - overhead)
+            weights = [float(video.get('relevance', 1.0)) for video in video_data]
+
+            demands = [
+                0 if 'error' in video else estimate_tokens(video['transcript'])
+                for video in video_data
+            ]
+            allocations = allocate_tokens(demands, weights, budget)
+            contents = self._condense_transcripts(video_data, language, allocations, demands)
+            packed, usage = pack_contents(contents, budget, weights)
+            span.set(transcript_tokens=sum(demands),
+                     prompt_tokens=overhead + sum(entry['tokens'] for entry in usage))
+
+        if on_usage is not None:
+            report = []
+            for video, demand, content, entry in zip(video_data, demands, contents, usage):
+                if 'error' in video:
+                    continue
+                report.append(dict(
+                    entry,
+                    title=video['title'],
+                    transcript_tokens=demand,
+                    condensed=content is not video['transcript']
+                ))
+            on_usage(report)
+
+        return self._prepare_prompt(video_data, language, packed)
+
+    def _condense_transcripts(self, video_data: List[Dict], language: str,
+                              allocations: List[int],
+                              demands: Optional[List[int]] = None) -> List[Optional[str]]:
+        """Map phase of the hierarchical summary.
+
+        Transcripts within their token allocation are returned unchanged.
+        Longer ones are split on sentence boundaries into chunks of
+        ``chunk_tokens`` and every chunk of every such video is summarised in
+        parallel; the notes of each video are joined in order and replace its
+        transcript in the final prompt. ``demands`` are the transcripts' token
+        estimates, if already known.
+        """
+        contents: List[Optional[str]] = [None] * len(video_data)
+        chunk_notes: Dict[int, List[Optional[str]]] = {}
+        jobs = []
+
+        for index, video in enumerate(video_data):
+            if 'error' in video:
+                continue
+            demand = demands[index] if demands is not None else estimate_tokens(video['transcript'])
+            if demand <= allocations[index]:
+                contents[index] = video['transcript']
+                continue
+            chunks = chunk_text(video['transcript'], self.chunk_tokens)
+            if len(chunks) <= 1:
+                contents[index] = video['transcript']
+                continue
+            chunk_notes[index] = [None] * len(chunks)
+            jobs.extend((index, position, chunk) for position, chunk in enumerate(chunks))
+
+        if jobs:
+            with ThreadPoolExecutor(max_workers=min(self.map_workers, len(jobs))) as executor:
+                summarize = metrics.wrap(lambda job: self._summarize_chunk(job[2], language))
+                notes = executor.map(summarize, jobs)
+                for (index, position, _), note in zip(jobs, notes):
+                    chunk_notes[index][position] = note
+
+            for index, notes in chunk_notes.items():
+                contents[index] = "\n".join(notes)
+
+        return contents
+
+    def _summarize_chunk(self, chunk: str, language: str) -> str:
+        """Summarise one transcript chunk, reusing cached notes when possible."""
+        prompt = MAP_PROMPTS.get(language, MAP_PROMPTS['en']) + chunk
+        cache_key = SummaryCache.make_key(prompt, language, MODEL_NAME, MAP_GENERATION_CONFIG)
+
+        notes = self.chunk_cache.get(cache_key)
+        if notes is not None:
+            metrics.count('cache_requests_total', cache='chunk_summaries', result='hit')
+            return notes
+        metrics.count('cache_requests_total', cache='chunk_summaries', result='miss')
+
+        notes = self._generate(prompt, genai.types.GenerationConfig(**MAP_GENERATION_CONFIG),
+                               stage='map')
+        self.chunk_cache.set(cache_key, notes)
+        return notes
+
+    def _enforce_chinese(self, prompt: str) -> str:
+        """Prefix the prompt with a stronger Simplified Chinese instruction."""
+        return f"务必使用简体中文回答。禁止使用其他语言。\n\n{prompt}"
+
+    def _prepare_prompt(self, video_data: List[Dict], language: str,
+                        contents: Optional[List[Optional[str]]] = None) -> str:
+        """Prepare prompt for Gemini AI with language specification.
+
+        ``contents`` optionally replaces each video's transcript (e.g. with the
+        condensed notes from the map phase); by default the full transcript
+        is used.
+        """
         language_prompt = {
             'ja': """以下のYouTube動画に基づいて簡潔な要約を生成してください：
 
@@ -126,7 +473,7 @@ Generate all output in English.""",
             prompt += language_prompt[language] + "\n\n"
 
         # Process video data
-        for video in video_data:
+        for index, video in enumerate(video_data):
             if 'error' not in video:
                 if language == 'zh':
                     title_label = "【视频标题】"
@@ -137,23 +484,10 @@ Generate all output in English.""",
                 
                 prompt += f"{title_label}{video['title']}\n"
                 
-                # Preprocess transcript
-                transcript = video['transcript']
+                # Transcripts are normalised when fetched (see transcript_normalizer)
+                transcript = contents[index] if contents is not None else video['transcript']
                 if language == 'zh':
-                    if len(transcript) > 2000:
-                        # Find last complete Chinese sentence
-                        transcript = transcript[:2000]
-                        last_period = max(
-                            transcript.rfind('。'), 
-                            transcript.rfind('！'), 
-                            transcript.rfind('？'),
-                            transcript.rfind('；')
-                        )
-                        if last_period > 0:
-                            transcript = transcript[:last_period + 1]
-                    transcript = self._preprocess_chinese_text(transcript)
-                else:
-                    transcript = transcript[:2000].rsplit('.', 1)[0] + '...'
+                    transcript = to_ascii_punctuation(transcript)
                 
                 prompt += f"{content_label}{transcript}\n\n"
 
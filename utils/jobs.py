@@ -0,0 +1,271 @@
+"""Background job queue for summary generation.
+
+Jobs are persisted in a SQLite file so their state (queued, running, done,
+failed), the text generated so far and the final result survive Streamlit
+reruns, reconnects and server restarts. A small pool of worker threads in
+the server process runs them; no external broker is needed.
+"""
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+import traceback
+import uuid
+from . import metrics
+from .cache import default_cache_path
+
+JOB_QUEUED = 'queued'
+JOB_RUNNING = 'running'
+JOB_DONE = 'done'
+JOB_FAILED = 'failed'
+UNFINISHED_STATUSES = (JOB_QUEUED, JOB_RUNNING)
+
+# 完了したジョブを保持する秒数と、期限切れのジョブを削除する間隔
+JOB_TTL = 24 * 60 * 60
+JOB_PURGE_INTERVAL = 60 * 60
+
+# 生成途中のテキストを保存する間隔（秒）
+PARTIAL_FLUSH_INTERVAL = 0.5
+
+
+class Job:
+    def __init__(self, id: str, key: str, status: str, params: Dict,
+                 partial: str = '', result: Optional[Dict] = None,
+                 error: Optional[str] = None, created_at: float = 0.0,
+                 updated_at: float = 0.0):
+        self.id = id
+        self.key = key
+        self.status = status
+        self.params = params
+        self.partial = partial
+        self.result = result
+        self.error = error
+        self.created_at = created_at
+        self.updated_at = updated_at
+
+    @classmethod
+    def from_row(cls, row: sqlite3.Row) -> 'Job':
+        return cls(
+            id=row['id'],
+            key=row['key'],
+            status=row['status'],
+            params=json.loads(row['params']),
+            partial=row['partial'] or '',
+            result=json.loads(row['result']) if row['result'] else None,
+            error=row['error'],
+            created_at=row['created_at'],
+            updated_at=row['updated_at']
+        )
+
+    @property
+    def finished(self) -> bool:
+        return self.status not in UNFINISHED_STATUSES
+
+
+class JobStore:
+    """SQLite persistence for jobs."""
+
+    def __init__(self, path: str):
+        directory = os.path.dirname(path)
+        if path != ':memory:' and directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                key TEXT NOT NULL,
+                status TEXT NOT NULL,
+                params TEXT NOT NULL,
+                partial TEXT,
+                result TEXT,
+                error TEXT,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS jobs_key_status_idx ON jobs (key, status);
+            CREATE INDEX IF NOT EXISTS jobs_updated_at_idx ON jobs (updated_at);
+        """)
+        self._conn.commit()
+
+    def create(self, key: str, params: Dict) -> Tuple[Job, bool]:
+        """Queue a job, or return the unfinished job that already has ``key``.
+
+        Returns:
+            Tuple[Job, bool]: The job, and whether it was created by this call
+        """
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT * FROM jobs WHERE key = ? AND status IN (?, ?) "
+                "ORDER BY created_at LIMIT 1",
+                (key, *UNFINISHED_STATUSES)
+            ).fetchone()
+            if row is not None:
+                return Job.from_row(row), False
+
+            job = Job(uuid.uuid4().hex, key, JOB_QUEUED, params,
+                      created_at=now, updated_at=now)
+            self._conn.execute(
+                "INSERT INTO jobs (id, key, status, params, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (job.id, key, JOB_QUEUED, json.dumps(params, ensure_ascii=False), now, now)
+            )
+            self._conn.commit()
+            return job, True
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return Job.from_row(row) if row else None
+
+    def unfinished(self) -> List[Job]:
+        """Return queued and running jobs, oldest first."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT * FROM jobs WHERE status IN (?, ?) ORDER BY created_at",
+                UNFINISHED_STATUSES
+            ).fetchall()
+        return [Job.from_row(row) for row in rows]
+
+    def _update(self, job_id: str, **fields: Any) -> None:
+        fields['updated_at'] = time.time()
+        assignments = ', '.join(f"{name} = ?" for name in fields)
+        with self._lock:
+            self._conn.execute(
+                f"UPDATE jobs SET {assignments} WHERE id = ?", (*fields.values(), job_id)
+            )
+            self._conn.commit()
+
+    def mark_running(self, job_id: str) -> None:
+        self._update(job_id, status=JOB_RUNNING)
+
+    def set_partial(self, job_id: str, text: str) -> None:
+        self._update(job_id, partial=text)
+
+    def finish(self, job_id: str, result: Dict) -> None:
+        self._update(job_id, status=JOB_DONE, partial=None,
+                     result=json.dumps(result, ensure_ascii=False))
+
+    def fail(self, job_id: str, error: str) -> None:
+        self._update(job_id, status=JOB_FAILED, error=error)
+
+    def purge(self, ttl: float = JOB_TTL) -> int:
+        """Delete finished jobs last updated more than ``ttl`` seconds ago."""
+        with self._lock:
+            cursor = self._conn.execute(
+                "DELETE FROM jobs WHERE status NOT IN (?, ?) AND updated_at < ?",
+                (*UNFINISHED_STATUSES, time.time() - ttl)
+            )
+            self._conn.commit()
+        return cursor.rowcount
+
+
+class JobQueue:
+    """Run jobs on a pool of worker threads, persisting their state.
+
+    ``handler(params, report)`` does the work and returns a JSON-serialisable
+    result; it may call ``report(text)`` with the output produced so far
+    (saved at most every ``PARTIAL_FLUSH_INTERVAL`` seconds) and
+    ``report(text, final=True)`` once the output is complete.
+    Jobs left unfinished by a previous process are queued again on start.
+    Finished jobs older than ``JOB_TTL`` are deleted on start and then on
+    submit, at most every ``JOB_PURGE_INTERVAL`` seconds.
+    """
+
+    def __init__(self, handler: Callable[[Dict, Callable[..., None]], Dict],
+                 store: Optional[JobStore] = None, workers: int = 2):
+        self.handler = handler
+        self.store = store or JobStore(default_cache_path('jobs'))
+        self._queue: queue.Queue = queue.Queue()
+        self._purge_lock = threading.Lock()
+        self._purged_at = 0.0
+
+        self._purge_if_due()
+        for job in self.store.unfinished():
+            self._queue.put(job.id)
+
+        self._workers = [
+            threading.Thread(target=self._work, name=f"job-worker-{i}", daemon=True)
+            for i in range(max(1, workers))
+        ]
+        for worker in self._workers:
+            worker.start()
+
+    def submit(self, key: str, params: Dict) -> Tuple[str, bool]:
+        """Queue a job unless one with the same key is still unfinished.
+
+        Returns:
+            Tuple[str, bool]: The job ID, and whether an existing job was joined
+        """
+        self._purge_if_due()
+        job, created = self.store.create(key, params)
+        if created:
+            self._queue.put(job.id)
+        return job.id, not created
+
+    def _purge_if_due(self) -> None:
+        """Delete expired jobs if the last purge is older than JOB_PURGE_INTERVAL."""
+        with self._purge_lock:
+            now = time.monotonic()
+            if self._purged_at and now - self._purged_at < JOB_PURGE_INTERVAL:
+                return
+            self._purged_at = now
+        try:
+            self.store.purge()
+        except sqlite3.Error:
+            # 削除できなくてもジョブの投入は続ける（次の間隔で再試行する）
+            traceback.print_exc()
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self.store.get(job_id)
+
+    def wait(self, job_id: str, timeout: Optional[float] = None,
+             poll_interval: float = PARTIAL_FLUSH_INTERVAL) -> Optional[Job]:
+        """Block until the job finishes (or ``timeout`` passes) and return it."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            job = self.get(job_id)
+            if job is None or job.finished:
+                return job
+            if deadline is not None and time.monotonic() >= deadline:
+                return job
+            time.sleep(poll_interval)
+
+    def _work(self) -> None:
+        while True:
+            job_id = self._queue.get()
+            try:
+                self._run(job_id)
+            finally:
+                self._queue.task_done()
+
+    def _run(self, job_id: str) -> None:
+        job = self.store.get(job_id)
+        if job is None or job.finished:
+            return
+        self.store.mark_running(job_id)
+        metrics.observe('job_queue_wait_seconds', time.time() - job.created_at)
+
+        last_flush = [0.0]
+
+        def report(text: str, final: bool = False) -> None:
+            # 書き込み回数を抑えるため一定間隔で保存する（完成したテキストは即時）
+            now = time.monotonic()
+            if final or now - last_flush[0] >= PARTIAL_FLUSH_INTERVAL:
+                last_flush[0] = now
+                self.store.set_partial(job_id, text)
+
+        try:
+            result = self.handler(job.params, report)
+            self.store.finish(job_id, result)
+            metrics.count('jobs_total', status=JOB_DONE)
+        except Exception as e:
+            traceback.print_exc()
+            self.store.fail(job_id, str(e))
+            metrics.count('jobs_total', status=JOB_FAILED)
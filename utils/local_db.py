@@ -0,0 +1,245 @@
+from typing import Any, Dict, List, Optional, Tuple, Union
+import glob
+import os
+import sqlite3
+import threading
+
+# PostgRESTのフィルタ演算子とSQLの対応
+FILTER_OPERATORS = {'eq': '=', 'neq': '!=', 'lt': '<', 'lte': '<=', 'gt': '>', 'gte': '>='}
+
+# SQLite用マイグレーション（migrations/sqlite/*.sql を番号順に適用）
+SQLITE_MIGRATIONS_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'migrations', 'sqlite'
+)
+
+
+def _split_top_level(text: str) -> List[str]:
+    """Split on commas outside parentheses and double quotes."""
+    parts, depth, quoted, current = [], 0, False, ''
+    for char in text:
+        if char == '"':
+            quoted = not quoted
+        elif not quoted and char == '(':
+            depth += 1
+        elif not quoted and char == ')':
+            depth -= 1
+        elif not quoted and depth == 0 and char == ',':
+            parts.append(current)
+            current = ''
+            continue
+        current += char
+    if current:
+        parts.append(current)
+    return parts
+
+
+def _parse_condition(expression: str) -> Tuple[str, List[Any]]:
+    """Translate one PostgREST filter expression into SQL."""
+    for keyword in ('and', 'or'):
+        if expression.startswith(f'{keyword}(') and expression.endswith(')'):
+            return _parse_logical(keyword.upper(), expression[len(keyword) + 1:-1])
+
+    column, operator, value = expression.split('.', 2)
+    if len(value) >= 2 and value.startswith('"') and value.endswith('"'):
+        value = value[1:-1]
+    return f'"{column}" {FILTER_OPERATORS[operator]} ?', [value]
+
+
+def _parse_logical(keyword: str, filters: str) -> Tuple[str, List[Any]]:
+    """Combine comma-separated PostgREST filters with AND/OR."""
+    conditions = [_parse_condition(part.strip()) for part in _split_top_level(filters)]
+    clause = '(' + f' {keyword} '.join(sql for sql, _ in conditions) + ')'
+    return clause, [param for _, params in conditions for param in params]
+
+
+class LocalResponse:
+    """Mirror of the postgrest APIResponse attributes used by DatabaseHandler."""
+
+    def __init__(self, data: List[Dict], count: Optional[int] = None):
+        self.data = data
+        self.count = count
+
+
+class LocalQuery:
+    """Subset of the postgrest query builder, executed against SQLite."""
+
+    def __init__(self, client: 'LocalClient', table: str):
+        self._client = client
+        self._table = table
+        self._action = 'select'
+        self._columns = '*'
+        self._filters: List[Tuple[str, List[Any]]] = []
+        self._order: List[Tuple[str, bool]] = []
+        self._limit: Optional[int] = None
+        self._rows: List[Dict] = []
+        self._on_conflict: Optional[str] = None
+        self._values: Dict[str, Any] = {}
+
+    def select(self, columns: str = '*') -> 'LocalQuery':
+        self._action = 'select'
+        self._columns = columns
+        return self
+
+    def insert(self, data: Union[Dict, List[Dict]]) -> 'LocalQuery':
+        self._action = 'insert'
+        self._rows = data if isinstance(data, list) else [data]
+        return self
+
+    def upsert(self, data: Union[Dict, List[Dict]], on_conflict: str = '') -> 'LocalQuery':
+        self.insert(data)
+        self._on_conflict = on_conflict or 'id'
+        return self
+
+    def update(self, data: Dict) -> 'LocalQuery':
+        self._action = 'update'
+        self._values = data
+        return self
+
+    def delete(self) -> 'LocalQuery':
+        self._action = 'delete'
+        return self
+
+    def eq(self, column: str, value: Any) -> 'LocalQuery':
+        self._filters.append((f'"{column}" = ?', [value]))
+        return self
+
+    def gt(self, column: str, value: Any) -> 'LocalQuery':
+        self._filters.append((f'"{column}" > ?', [value]))
+        return self
+
+    def in_(self, column: str, values: List[Any]) -> 'LocalQuery':
+        values = list(values)
+        if not values:
+            self._filters.append(('0', []))
+        else:
+            self._filters.append((f'"{column}" IN ({", ".join("?" * len(values))})', values))
+        return self
+
+    def or_(self, filters: str) -> 'LocalQuery':
+        """PostgREST ``or=(...)`` filter, e.g. ``'a.lt.1,and(a.eq.1,b.lt.2)'``."""
+        self._filters.append(_parse_logical('OR', filters))
+        return self
+
+    def order(self, column: str, desc: bool = False) -> 'LocalQuery':
+        self._order.append((column, desc))
+        return self
+
+    def limit(self, size: int) -> 'LocalQuery':
+        self._limit = size
+        return self
+
+    def _where(self) -> Tuple[str, List[Any]]:
+        if not self._filters:
+            return '', []
+        clauses = [clause for clause, _ in self._filters]
+        params = [param for _, clause_params in self._filters for param in clause_params]
+        return ' WHERE ' + ' AND '.join(clauses), params
+
+    def _select_columns(self) -> str:
+        if self._columns.strip() == '*':
+            return '*'
+        return ', '.join(f'"{column.strip()}"' for column in self._columns.split(','))
+
+    def execute(self) -> LocalResponse:
+        return self._client._execute(self)
+
+
+class LocalClient:
+    """SQLite stand-in for the Supabase client.
+
+    Implements the ``from_``/``table`` query-builder calls DatabaseHandler
+    makes, so the handler can run offline and in benchmarks. Each
+    ``execute`` counts as one round trip in ``request_count``.
+    """
+
+    def __init__(self, path: str = ':memory:'):
+        directory = os.path.dirname(path)
+        if path != ':memory:' and directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.request_count = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        # summary_sources の削除連鎖（on delete cascade）を有効にする
+        self._conn.execute("PRAGMA foreign_keys = ON")
+        self._apply_migrations()
+
+    def from_(self, table: str) -> LocalQuery:
+        return LocalQuery(self, table)
+
+    table = from_
+
+    def _apply_migrations(self) -> None:
+        """Apply SQL files from migrations/sqlite that have not run yet."""
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS schema_migrations (name TEXT PRIMARY KEY)"
+        )
+        applied = {row[0] for row in self._conn.execute("SELECT name FROM schema_migrations")}
+        for path in sorted(glob.glob(os.path.join(SQLITE_MIGRATIONS_DIR, '*.sql'))):
+            name = os.path.basename(path)
+            if name in applied:
+                continue
+            with open(path, encoding='utf-8') as f:
+                self._conn.executescript(f.read())
+            self._conn.execute("INSERT INTO schema_migrations (name) VALUES (?)", (name,))
+        self._conn.commit()
+
+    def _execute(self, query: LocalQuery) -> LocalResponse:
+        with self._lock:
+            self.request_count += 1
+            try:
+                if query._action == 'select':
+                    data = self._select(query)
+                elif query._action == 'insert':
+                    data = self._insert(query)
+                elif query._action == 'update':
+                    data = self._update(query)
+                else:
+                    data = self._delete(query)
+                self._conn.commit()
+                return LocalResponse(data)
+            except Exception:
+                self._conn.rollback()
+                raise
+
+    def _select(self, query: LocalQuery) -> List[Dict]:
+        where, params = query._where()
+        sql = f'SELECT {query._select_columns()} FROM "{query._table}"{where}'
+        if query._order:
+            sql += ' ORDER BY ' + ', '.join(
+                f'"{column}" {"DESC" if desc else "ASC"}' for column, desc in query._order
+            )
+        if query._limit is not None:
+            sql += ' LIMIT ?'
+            params.append(query._limit)
+        return [dict(row) for row in self._conn.execute(sql, params)]
+
+    def _insert(self, query: LocalQuery) -> List[Dict]:
+        # PostgRESTと同様、複数行の挿入は1トランザクションで全件成功か全件失敗
+        inserted = []
+        for row in query._rows:
+            columns = list(row.keys())
+            column_list = ', '.join(f'"{c}"' for c in columns)
+            placeholders = ', '.join('?' for _ in columns)
+            sql = f'INSERT INTO "{query._table}" ({column_list}) VALUES ({placeholders})'
+            if query._on_conflict:
+                conflict = [c.strip() for c in query._on_conflict.split(',')]
+                updates = [c for c in columns if c not in conflict]
+                sql += f' ON CONFLICT ({", ".join(conflict)}) DO '
+                sql += ('UPDATE SET ' + ', '.join(f'"{c}" = excluded."{c}"' for c in updates)
+                        if updates else 'NOTHING')
+            sql += ' RETURNING *'
+            inserted.extend(dict(r) for r in self._conn.execute(sql, [row[c] for c in columns]))
+        return inserted
+
+    def _update(self, query: LocalQuery) -> List[Dict]:
+        where, params = query._where()
+        assignments = ', '.join(f'"{c}" = ?' for c in query._values)
+        sql = f'UPDATE "{query._table}" SET {assignments}{where} RETURNING *'
+        return [dict(row) for row in self._conn.execute(sql, list(query._values.values()) + params)]
+
+    def _delete(self, query: LocalQuery) -> List[Dict]:
+        where, params = query._where()
+        sql = f'DELETE FROM "{query._table}"{where} RETURNING *'
+        return [dict(row) for row in self._conn.execute(sql, params)]
@@ -0,0 +1,336 @@
+"""Lightweight tracing and metrics.
+
+Instrumented code wraps work in ``span(name, **labels)`` and bumps counters
+with ``count(name, value, **labels)``. When enabled, every span
+
+* adds an observation to the ``<name>_seconds`` histogram,
+* adds its numeric attributes (bytes, tokens, ...) to ``<name>_<attr>_total``,
+* is logged as one JSON line on the ``youtube_summarize.metrics`` logger, and
+* is appended to the trace being collected by ``collect_trace`` (if any).
+
+Metrics can be exported in the Prometheus text format to a file
+(``METRICS_FILE``) and/or an HTTP endpoint (``METRICS_PORT``). Everything is
+off unless ``METRICS_ENABLED`` is set; disabled calls return a shared no-op
+object and cost a single flag check.
+"""
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+
+# Prometheusの既定のバケットに、LLM呼び出し向けの長い区間を追加
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# METRICS_FILE への書き出し間隔（秒）
+EXPORT_INTERVAL = 15.0
+
+logger = logging.getLogger('youtube_summarize.metrics')
+
+_enabled = os.environ.get('METRICS_ENABLED', '').lower() in ('1', 'true', 'yes')
+_configured = False
+_configure_lock = threading.Lock()
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _label_key(labels: Dict[str, Any]) -> LabelKey:
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+def _format_labels(key: LabelKey, extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(key) + ([extra] if extra else [])
+    if not pairs:
+        return ''
+    escaped = (value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+               for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+class Registry:
+    """Counters and histograms, rendered in the Prometheus text format."""
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._counters: Dict[str, Dict[LabelKey, float]] = {}
+        # name -> labels -> [bucket counts..., sum, count]
+        self._histograms: Dict[str, Dict[LabelKey, List[float]]] = {}
+
+    def inc(self, name: str, value: float = 1, labels: Optional[Dict[str, Any]] = None) -> None:
+        key = _label_key(labels or {})
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0.0) + value
+
+    def observe(self, name: str, value: float, labels: Optional[Dict[str, Any]] = None) -> None:
+        key = _label_key(labels or {})
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            state = series.get(key)
+            if state is None:
+                state = series[key] = [0.0] * (len(self.buckets) + 2)
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[index] += 1
+            state[-2] += value
+            state[-1] += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+    def render(self) -> str:
+        """Return all metrics in the Prometheus text exposition format."""
+        lines = []
+        with self._lock:
+            for name in sorted(self._counters):
+                lines.append(f"# TYPE {name} counter")
+                for key, value in sorted(self._counters[name].items()):
+                    lines.append(f"{name}{_format_labels(key)} {value:g}")
+            for name in sorted(self._histograms):
+                lines.append(f"# TYPE {name} histogram")
+                for key, state in sorted(self._histograms[name].items()):
+                    for bound, bucket_count in zip(self.buckets, state):
+                        lines.append(f"{name}_bucket{_format_labels(key, ('le', f'{bound:g}'))} "
+                                     f"{bucket_count:g}")
+                    lines.append(f"{name}_bucket{_format_labels(key, ('le', '+Inf'))} {state[-1]:g}")
+                    lines.append(f"{name}_sum{_format_labels(key)} {state[-2]:.6f}")
+                    lines.append(f"{name}_count{_format_labels(key)} {state[-1]:g}")
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+
+class Trace:
+    """Spans recorded for one unit of work (e.g. a summary job)."""
+
+    def __init__(self):
+        self.origin = time.perf_counter()
+        self._lock = threading.Lock()
+        self.spans: List[Dict] = []
+
+    def add(self, name: str, start: float, end: float, labels: Dict, attrs: Dict,
+            error: Optional[str]) -> None:
+        entry = {'name': name, 'start': round(start - self.origin, 4),
+                 'seconds': round(end - start, 4)}
+        entry.update(labels)
+        entry.update(attrs)
+        if error:
+            entry['error'] = error
+        with self._lock:
+            self.spans.append(entry)
+
+    def to_list(self) -> List[Dict]:
+        """Return the spans ordered by start time."""
+        with self._lock:
+            return sorted(self.spans, key=lambda entry: entry['start'])
+
+
+_current_trace: contextvars.ContextVar = contextvars.ContextVar('metrics_trace', default=None)
+
+
+class _NoopSpan:
+    def set(self, **attrs: Any) -> None:
+        pass
+
+    def __enter__(self) -> '_NoopSpan':
+        return self
+
+    def __exit__(self, *exc_info) -> bool:
+        return False
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+class Span:
+    """A timed operation; numeric attributes set on it become counters."""
+
+    __slots__ = ('name', 'labels', 'attrs', 'start')
+
+    def __init__(self, name: str, labels: Dict[str, Any]):
+        self.name = name
+        self.labels = labels
+        self.attrs: Dict[str, Any] = {}
+        self.start = 0.0
+
+    def set(self, **attrs: Any) -> None:
+        self.attrs.update(attrs)
+
+    def __enter__(self) -> 'Span':
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        end = time.perf_counter()
+        duration = end - self.start
+        # ジェネレーターの途中終了（GeneratorExit）はエラーとして扱わない
+        failed = exc_type is not None and not issubclass(exc_type, GeneratorExit)
+        error = f"{exc_type.__name__}: {exc}" if failed else None
+
+        registry.observe(f"{self.name}_seconds", duration, self.labels)
+        if error:
+            registry.inc(f"{self.name}_errors_total", 1, self.labels)
+        for attr, value in self.attrs.items():
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                registry.inc(f"{self.name}_{attr}_total", value, self.labels)
+
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.add(self.name, self.start, end, self.labels, self.attrs, error)
+
+        if logger.isEnabledFor(logging.INFO):
+            record = {'ts': time.time(), 'span': self.name, 'seconds': round(duration, 6)}
+            record.update(self.labels)
+            record.update(self.attrs)
+            if error:
+                record['error'] = error
+            logger.info(json.dumps(record, ensure_ascii=False, default=str))
+        return False
+
+
+def enabled() -> bool:
+    return _enabled
+
+
+def enable(value: bool = True) -> None:
+    """Turn instrumentation on or off at runtime (e.g. for benchmarks)."""
+    global _enabled
+    _enabled = value
+
+
+def span(name: str, **labels: Any):
+    """Time a block: ``with span('youtube_transcript') as s: ...; s.set(bytes=n)``."""
+    if not _enabled:
+        return _NOOP_SPAN
+    return Span(name, labels)
+
+
+def count(name: str, value: float = 1, **labels: Any) -> None:
+    """Add ``value`` to the counter ``name`` (e.g. retries, cache hits)."""
+    if _enabled:
+        registry.inc(name, value, labels)
+
+
+def observe(name: str, value: float, **labels: Any) -> None:
+    """Record a value in the histogram ``name``."""
+    if _enabled:
+        registry.observe(name, value, labels)
+
+
+@contextmanager
+def collect_trace() -> Iterator[Optional[Trace]]:
+    """Collect the spans of the enclosed work (None when disabled)."""
+    if not _enabled:
+        yield None
+        return
+    trace = Trace()
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _current_trace.reset(token)
+
+
+def wrap(fn: Callable) -> Callable:
+    """Bind ``fn`` to the current trace so spans in pool threads are collected.
+
+    Thread pools do not inherit context variables; submit ``wrap(fn)``
+    instead of ``fn``. Returns ``fn`` itself when disabled.
+    """
+    if not _enabled or _current_trace.get() is None:
+        return fn
+    context = contextvars.copy_context()
+
+    def run(*args, **kwargs):
+        return context.copy().run(fn, *args, **kwargs)
+    return run
+
+
+def write_prometheus(path: str) -> None:
+    """Write the current metrics to ``path`` atomically."""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    temp_path = f"{path}.tmp"
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        f.write(registry.render())
+    os.replace(temp_path, path)
+
+
+class _MetricsRequestHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = registry.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_http_server(port: int, host: str = '0.0.0.0') -> ThreadingHTTPServer:
+    """Serve ``/metrics`` on a daemon thread."""
+    server = ThreadingHTTPServer((host, port), _MetricsRequestHandler)
+    threading.Thread(target=server.serve_forever, name='metrics-http', daemon=True).start()
+    return server
+
+
+def start_file_exporter(path: str, interval: float = EXPORT_INTERVAL) -> threading.Thread:
+    """Rewrite ``path`` with the current metrics every ``interval`` seconds."""
+    def export():
+        while True:
+            time.sleep(interval)
+            try:
+                write_prometheus(path)
+            except OSError:
+                logger.exception("Failed to write metrics to %s", path)
+
+    thread = threading.Thread(target=export, name='metrics-file', daemon=True)
+    thread.start()
+    return thread
+
+
+def configure_from_env() -> None:
+    """Set up logging and exporters from the environment (once per process).
+
+    ``METRICS_ENABLED``: turn instrumentation on
+    ``METRICS_LOG``: JSON log destination, a file path or ``-`` for stderr
+    (default ``-``)
+    ``METRICS_FILE``: Prometheus text file rewritten every 15 seconds
+    ``METRICS_PORT``: port for an HTTP ``/metrics`` endpoint
+    """
+    global _configured, _enabled
+    with _configure_lock:
+        # .env は import 後に読み込まれるため、ここで改めて確認する
+        if os.environ.get('METRICS_ENABLED', '').lower() in ('1', 'true', 'yes'):
+            _enabled = True
+        if _configured or not _enabled:
+            return
+        _configured = True
+
+        if not logger.handlers:
+            destination = os.environ.get('METRICS_LOG', '-')
+            handler = (logging.StreamHandler() if destination == '-'
+                       else logging.FileHandler(destination, encoding='utf-8'))
+            handler.setFormatter(logging.Formatter('%(message)s'))
+            logger.addHandler(handler)
+            logger.setLevel(logging.INFO)
+            logger.propagate = False
+
+        if os.environ.get('METRICS_FILE'):
+            start_file_exporter(os.environ['METRICS_FILE'])
+        if os.environ.get('METRICS_PORT'):
+            start_http_server(int(os.environ['METRICS_PORT']))
@@ -0,0 +1,191 @@
+"""Summary pipeline shared by the UI job queue.
+
+``run_summary`` does everything a click on "Generate" used to do inside the
+Streamlit script: fetch the videos, generate (or reuse) the summary, save it
+and look up more videos from the channel. It has no UI code, so it can run
+on a background worker; progress is reported through ``on_text``.
+
+Stages start as soon as their inputs are ready rather than one after the
+other::
+
+    video details ──> channel videos ───────────────────────┐
+    transcripts ────> generate ──> text shown ─┬─> save ────┼──> result
+                                               └─> related ─┘
+
+so end-to-end latency stays close to the critical path of transcripts plus
+generation. Per-stage timings are returned with the result, along with the
+detailed span trace when metrics are enabled.
+"""
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+import threading
+import time
+from . import metrics
+from .gemini_processor import GeminiProcessor
+from .youtube_handler import YouTubeHandler
+
+
+class StageTimer:
+    """Record when each pipeline stage started and ended."""
+
+    def __init__(self):
+        self._origin = time.monotonic()
+        self._lock = threading.Lock()
+        self._stages: Dict[str, List[Optional[float]]] = {}
+
+    def start(self, stage: str) -> None:
+        with self._lock:
+            self._stages[stage] = [time.monotonic() - self._origin, None]
+
+    def end(self, stage: str) -> None:
+        with self._lock:
+            if stage not in self._stages or self._stages[stage][1] is not None:
+                return
+            self._stages[stage][1] = time.monotonic() - self._origin
+            duration = self._stages[stage][1] - self._stages[stage][0]
+        metrics.observe('pipeline_stage_seconds', duration, stage=stage)
+
+    def run(self, stage: str, fn: Callable, *args, **kwargs) -> Any:
+        """Call ``fn`` and record it as ``stage``."""
+        self.start(stage)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            self.end(stage)
+
+    def timings(self) -> List[Dict]:
+        """Return ``{'stage', 'start', 'end', 'seconds'}`` per stage, in start order."""
+        with self._lock:
+            stages = sorted(self._stages.items(), key=lambda item: item[1][0])
+        return [
+            {'stage': stage, 'start': round(start, 3), 'end': round(end, 3),
+             'seconds': round(end - start, 3)}
+            for stage, (start, end) in stages if end is not None
+        ]
+
+
+def run_summary(youtube_handler: YouTubeHandler, gemini_processor: GeminiProcessor,
+                db_handler, urls: List[str], language: str, force: bool = False,
+                on_text: Optional[Callable[..., None]] = None) -> Dict:
+    """Summarise ``urls`` and return a JSON-serialisable result.
+
+    Args:
+        db_handler: DatabaseHandler to save the summary with, or None
+        force: Regenerate even if the summary cache has this prompt
+        on_text: Called with the text generated so far while streaming, and
+            with the whole text and ``final=True`` once it is complete
+
+    Returns:
+        Dict with ``videos`` (url, video_id, title and error per URL),
+        ``article`` (None if no video could be processed), ``from_cache``,
+        ``token_usage``, ``channel_videos``, ``related`` (similar saved
+        summaries: id, video_id, title, score), ``save_error`` /
+        ``channel_error`` messages, per-stage ``timings`` and the ``trace``
+        of instrumented calls (empty unless metrics are enabled)
+    """
+    result = {'videos': [], 'article': None, 'from_cache': False, 'token_usage': [],
+              'channel_videos': [], 'related': [], 'save_error': None, 'channel_error': None,
+              'timings': [], 'trace': []}
+    timer = StageTimer()
+    timer.start('total')
+
+    with metrics.collect_trace() as trace, ThreadPoolExecutor(max_workers=2) as executor:
+        channel_future: List[Future] = []
+
+        def start_channel_lookup(details: Dict[str, Dict]) -> None:
+            # チャンネル動画の取得は要約に依存しないため、字幕の取得と並行して始める
+            timer.end('video_details')
+            for url in urls:
+                try:
+                    video_id = youtube_handler.extract_video_id(url)
+                except ValueError:
+                    continue
+                if video_id in details:
+                    channel_future.append(executor.submit(
+                        metrics.wrap(timer.run), 'channel_videos', youtube_handler.get_channel_latest_videos,
+                        url, channel_id=details[video_id]['channelId']
+                    ))
+                    return
+
+        timer.start('video_details')
+        video_data = timer.run('transcripts', youtube_handler.process_videos, urls,
+                               on_details=start_channel_lookup, language=language)
+        # 字幕は結果に含めない（ジョブの保存サイズを抑える）
+        result['videos'] = [
+            {'url': video['url'], 'video_id': video.get('video_id'),
+             'title': video.get('title'), 'error': video.get('error')}
+            for video in video_data
+        ]
+        videos = [video for video in video_data if 'error' not in video]
+
+        if videos:
+            timer.start('generate')
+            prompt_hash = gemini_processor.get_cache_key(video_data, language)
+            article = None if force else gemini_processor.summary_cache.get(prompt_hash)
+            result['from_cache'] = article is not None
+
+            if article is None:
+                chunks = []
+                for chunk in gemini_processor.generate_article_stream(
+                    video_data,
+                    language=language,
+                    force=True,
+                    on_usage=lambda usage: result.update(token_usage=usage),
+                    cache_key=prompt_hash
+                ):
+                    chunks.append(chunk)
+                    if on_text is not None:
+                        on_text(''.join(chunks))
+                article = ''.join(chunks)
+            result['article'] = article
+            timer.end('generate')
+            if on_text is not None:
+                on_text(article, final=True)
+
+            # Save to database (cached summaries are already stored)
+            # 生成したテキストは表示済みのため、保存は関連する要約の検索・チャンネル動画の取得と並行して行う
+            save_future = None
+            if db_handler is not None and not result['from_cache']:
+                first = videos[0]
+                save_future = executor.submit(
+                    metrics.wrap(timer.run), 'save', db_handler.save_summary,
+                    video_id=first['video_id'],
+                    title=first['title'],
+                    summary=article,
+                    language=language,
+                    source_urls=','.join(urls),
+                    thumbnail_url=first.get('thumbnail'),
+                    prompt_hash=prompt_hash,
+                    source_key=youtube_handler.source_key(urls, language),
+                    videos=videos
+                )
+
+            # 過去に保存した要約のうち、内容が近いもの（今回の動画の要約は除く）
+            if db_handler is not None:
+                related = timer.run(
+                    'related', db_handler.related_summaries, text=article, language=language,
+                    exclude_videos=[video['video_id'] for video in videos]
+                )
+                result['related'] = [
+                    {'id': summary.id, 'video_id': summary.video_id, 'title': summary.title,
+                     'score': round(score, 3)}
+                    for summary, score in related
+                ]
+
+            if save_future is not None:
+                try:
+                    save_future.result()
+                except Exception as e:
+                    result['save_error'] = str(e)
+
+            if channel_future:
+                try:
+                    result['channel_videos'] = channel_future[0].result()
+                except Exception as e:
+                    result['channel_error'] = str(e)
+
+    timer.end('total')
+    result['timings'] = timer.timings()
+    if trace is not None:
+        result['trace'] = trace.to_list()
+    return result
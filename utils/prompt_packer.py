@@ -0,0 +1,80 @@
+from typing import Dict, List, Optional, Tuple
+from .text_chunker import chunk_spans, estimate_tokens
+
+# 関連度の重みがゼロでも最低限の割り当てを受けられるようにする
+MIN_WEIGHT = 0.01
+
+
+def allocate_tokens(demands: List[int], weights: List[float], budget: int) -> List[int]:
+    """Divide ``budget`` tokens across items by weight without over-allocating.
+
+    Water-filling: every item gets a share proportional to its weight, items
+    that need less than their share get exactly what they need, and the
+    leftover is redistributed among the rest.
+    """
+    allocations = [0] * len(demands)
+    active = [i for i, demand in enumerate(demands) if demand > 0]
+    remaining = max(0, budget)
+
+    while active and remaining > 0:
+        total_weight = sum(max(weights[i], MIN_WEIGHT) for i in active)
+        shares = {i: remaining * max(weights[i], MIN_WEIGHT) / total_weight for i in active}
+        satisfied = [i for i in active if demands[i] <= shares[i]]
+
+        if not satisfied:
+            for i in active:
+                allocations[i] = int(shares[i])
+            break
+
+        for i in satisfied:
+            allocations[i] = demands[i]
+            remaining -= demands[i]
+        active = [i for i in active if i not in satisfied]
+
+    return allocations
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Cut ``text`` to at most ``max_tokens`` tokens on a sentence boundary."""
+    if max_tokens <= 0:
+        return ''
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    # 先頭のチャンクだけを求める（残りは分割しない）
+    for start, end in chunk_spans(text, max_tokens):
+        return text[start:end].strip()
+    return ''
+
+
+def pack_contents(contents: List[Optional[str]], budget: int,
+                  weights: Optional[List[float]] = None) -> Tuple[List[Optional[str]], List[Dict]]:
+    """Fit per-video contents into a shared token budget.
+
+    ``None`` entries (failed videos) are passed through. Returns the packed
+    contents and, for each entry, a usage report with the tokens it
+    originally needed, the tokens it was allotted and whether it was cut.
+    """
+    if weights is None:
+        weights = [1.0] * len(contents)
+
+    demands = [estimate_tokens(content) if content else 0 for content in contents]
+    allocations = allocate_tokens(demands, weights, budget)
+
+    packed: List[Optional[str]] = []
+    usage: List[Dict] = []
+    for content, demand, allocation in zip(contents, demands, allocations):
+        if content is None:
+            packed.append(None)
+            usage.append({'input_tokens': 0, 'tokens': 0, 'truncated': False})
+            continue
+
+        truncated = demand > allocation
+        text = truncate_to_tokens(content, allocation) if truncated else content
+        packed.append(text)
+        usage.append({
+            'input_tokens': demand,
+            'tokens': estimate_tokens(text),
+            'truncated': truncated
+        })
+
+    return packed, usage
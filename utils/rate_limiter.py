@@ -0,0 +1,170 @@
+from typing import Awaitable, Callable, Optional, TypeVar
+import asyncio
+import os
+import random
+import threading
+import time
+import google.api_core.exceptions
+from . import metrics
+
+T = TypeVar('T')
+
+# Gemini APIのクォータ（環境変数で上書き可能）
+DEFAULT_REQUESTS_PER_MINUTE = int(os.environ.get('GEMINI_REQUESTS_PER_MINUTE', '60'))
+DEFAULT_TOKENS_PER_MINUTE = int(os.environ.get('GEMINI_TOKENS_PER_MINUTE', '1000000'))
+
+# 429/5xx など、時間をおけば成功する可能性があるエラー
+RETRYABLE_ERRORS = (
+    google.api_core.exceptions.ResourceExhausted,
+    google.api_core.exceptions.TooManyRequests,
+    google.api_core.exceptions.ServiceUnavailable,
+    google.api_core.exceptions.InternalServerError,
+    google.api_core.exceptions.DeadlineExceeded,
+)
+
+
+class TokenBucket:
+    """Thread-safe token bucket refilled continuously at ``rate_per_minute``.
+
+    ``reserve`` always succeeds immediately and returns how long the caller
+    must wait before using the reservation, so the same bucket serves both
+    blocking and asyncio callers.
+    """
+
+    def __init__(self, rate_per_minute: float, capacity: Optional[float] = None):
+        self.rate = rate_per_minute / 60.0
+        # 既定のバースト量は1秒分（1分間分を一度に送ると429になりやすい）
+        self.capacity = capacity if capacity is not None else max(1.0, self.rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, amount: float = 1) -> float:
+        """Take ``amount`` tokens and return the seconds to wait before using them.
+
+        ``amount`` may exceed the capacity: the bucket goes into debt and the
+        wait is how long the refill takes to cover it (about
+        ``amount / rate`` seconds from a full bucket), so large requests are
+        limited like everything else.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= amount
+            if self._tokens >= 0:
+                return 0.0
+            return -self._tokens / self.rate
+
+
+class RateLimiter:
+    """Request-per-minute and token-per-minute limits for one API quota."""
+
+    def __init__(self, requests_per_minute: int = DEFAULT_REQUESTS_PER_MINUTE,
+                 tokens_per_minute: int = DEFAULT_TOKENS_PER_MINUTE):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+
+    def _reserve(self, tokens: int) -> float:
+        return max(self.requests.reserve(1), self.tokens.reserve(tokens))
+
+    def acquire(self, tokens: int = 0) -> None:
+        """Block until a request using ``tokens`` tokens is within quota."""
+        delay = self._reserve(tokens)
+        metrics.observe('rate_limiter_wait_seconds', delay)
+        if delay > 0:
+            time.sleep(delay)
+
+    async def acquire_async(self, tokens: int = 0) -> None:
+        """Wait (without blocking the event loop) until the request is within quota."""
+        delay = self._reserve(tokens)
+        metrics.observe('rate_limiter_wait_seconds', delay)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+class RetryPolicy:
+    """Exponential backoff with full jitter that honours Retry-After hints."""
+
+    def __init__(self, max_retries: int = 5, base_delay: float = 1.0,
+                 max_delay: float = 60.0):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def is_retryable(self, error: Exception) -> bool:
+        return isinstance(error, RETRYABLE_ERRORS)
+
+    def retry_after(self, error: Exception) -> Optional[float]:
+        """Return the server-requested delay in seconds, if the error carries one."""
+        response = getattr(error, 'response', None)
+        headers = getattr(response, 'headers', None)
+        if headers:
+            value = headers.get('Retry-After') or headers.get('retry-after')
+            if value:
+                try:
+                    return float(value)
+                except ValueError:
+                    pass
+
+        # gRPCのRetryInfo（google.rpc.RetryInfo.retry_delay）
+        for detail in getattr(error, 'details', None) or []:
+            retry_delay = getattr(detail, 'retry_delay', None)
+            if retry_delay is not None:
+                return retry_delay.seconds + retry_delay.nanos / 1e9
+        return None
+
+    def delay(self, attempt: int, error: Exception) -> float:
+        """Return the wait before retry number ``attempt`` (starting at 0)."""
+        backoff = random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+        retry_after = self.retry_after(error)
+        if retry_after is not None:
+            return max(backoff, min(retry_after, self.max_delay))
+        return backoff
+
+
+def call_with_retry(func: Callable[[], T], policy: RetryPolicy,
+                    limiter: Optional[RateLimiter] = None, tokens: int = 0) -> T:
+    """Call ``func`` within the rate limit, retrying retryable errors."""
+    attempt = 0
+    while True:
+        if limiter is not None:
+            limiter.acquire(tokens)
+        try:
+            return func()
+        except Exception as e:
+            if attempt >= policy.max_retries or not policy.is_retryable(e):
+                raise
+            metrics.count('api_retries_total', error=type(e).__name__)
+            time.sleep(policy.delay(attempt, e))
+            attempt += 1
+
+
+async def call_with_retry_async(func: Callable[[], Awaitable[T]], policy: RetryPolicy,
+                                limiter: Optional[RateLimiter] = None, tokens: int = 0) -> T:
+    """Async version of ``call_with_retry``."""
+    attempt = 0
+    while True:
+        if limiter is not None:
+            await limiter.acquire_async(tokens)
+        try:
+            return await func()
+        except Exception as e:
+            if attempt >= policy.max_retries or not policy.is_retryable(e):
+                raise
+            metrics.count('api_retries_total', error=type(e).__name__)
+            await asyncio.sleep(policy.delay(attempt, e))
+            attempt += 1
+
+
+_default_limiter: Optional[RateLimiter] = None
+_default_limiter_lock = threading.Lock()
+
+
+def default_rate_limiter() -> RateLimiter:
+    """Return the process-wide limiter shared by every GeminiProcessor."""
+    global _default_limiter
+    with _default_limiter_lock:
+        if _default_limiter is None:
+            _default_limiter = RateLimiter()
+        return _default_limiter
@@ -0,0 +1,247 @@
+from typing import Dict, Iterable, Iterator, List, Optional, Set
+import os
+import re
+import sqlite3
+import threading
+from .text_chunker import CJK_LETTERS
+
+# 日本語・中国語は単語区切りがないため、連続するCJK文字をバイグラムに分割する
+_TERM = re.compile(f'(?P<cjk>[{CJK_LETTERS}]+)|(?P<word>[^\\W_{CJK_LETTERS}]+)')
+
+# 検索結果のスニペットの前後文字数
+SNIPPET_CONTEXT = 60
+
+# 索引の形式のバージョン（PRAGMA user_version）。変わった場合は索引を作り直す
+INDEX_VERSION = 3
+
+
+def tokenize_terms(text: str) -> List[List[str]]:
+    """Split text into terms, each a list of index tokens.
+
+    Latin words become a single lower-cased token; a run of CJK characters
+    becomes its overlapping bigrams (or the character itself if it is alone).
+    """
+    terms = []
+    for match in _TERM.finditer(text.lower()):
+        run = match.group()
+        if match.group('cjk') and len(run) > 1:
+            terms.append([run[i:i + 2] for i in range(len(run) - 1)])
+        else:
+            terms.append([run])
+    return terms
+
+
+def tokenize(text: str) -> str:
+    """Return the space-separated token stream stored in the FTS index.
+
+    After the bigrams of a CJK run its last character is added as well, so
+    every CJK character starts some token and a one-character query can be
+    matched as a prefix (see ``_match_query``).
+    """
+    tokens = []
+    for match in _TERM.finditer(text.lower()):
+        run = match.group()
+        if match.group('cjk') and len(run) > 1:
+            tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+            tokens.append(run[-1])
+        else:
+            tokens.append(run)
+    return ' '.join(tokens)
+
+
+def _match_query(query: str) -> Optional[str]:
+    """Build an FTS5 MATCH expression on title and body.
+
+    Every term must appear; CJK runs are matched as phrases of bigrams and a
+    single CJK character as a token prefix.
+    """
+    phrases = []
+    for term in tokenize_terms(query):
+        phrase = '"' + ' '.join(token.replace('"', '""') for token in term) + '"'
+        if len(term) == 1 and len(term[0]) == 1 and _TERM.fullmatch(term[0]).group('cjk'):
+            phrase += '*'
+        phrases.append(phrase)
+    if not phrases:
+        return None
+    # 言語の列には一致させない（「en」などの検索語で全件がヒットしないように）
+    return '{title body} : (' + ' AND '.join(phrases) + ')'
+
+
+def highlight(text: str, query: str, context: int = SNIPPET_CONTEXT) -> str:
+    """Return a snippet around the first query match with matches in bold."""
+    needles = [match.group() for match in _TERM.finditer(query)]
+    if not needles:
+        return text[:context * 2]
+
+    pattern = re.compile('|'.join(re.escape(needle) for needle in
+                                  sorted(needles, key=len, reverse=True)), re.IGNORECASE)
+    first = pattern.search(text)
+    start = max(0, first.start() - context) if first else 0
+    end = min(len(text), (first.end() if first else 0) + context)
+
+    snippet = pattern.sub(lambda m: f"**{m.group()}**", text[start:end])
+    return ('...' if start > 0 else '') + snippet + ('...' if end < len(text) else '')
+
+
+class SearchIndex:
+    """Local SQLite FTS5 mirror of video_summaries for full-text search.
+
+    Title and summary are indexed with ``tokenize`` (words plus CJK bigrams)
+    and ranked with BM25, with title matches weighted higher.
+    """
+
+    def __init__(self, path: str):
+        directory = os.path.dirname(path)
+        if path != ':memory:' and directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        if self._conn.execute("PRAGMA user_version").fetchone()[0] != INDEX_VERSION:
+            # 索引はデータベースから再同期できるため、形式が古ければ作り直す
+            self._conn.executescript("""
+                DROP TABLE IF EXISTS summaries_fts;
+                DROP TABLE IF EXISTS summaries;
+                DROP TABLE IF EXISTS sync_state;
+            """)
+            self._conn.execute(f"PRAGMA user_version = {INDEX_VERSION}")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS summaries (
+                id INTEGER PRIMARY KEY,
+                video_id TEXT,
+                title TEXT,
+                summary TEXT,
+                language TEXT,
+                timestamp TEXT,
+                thumbnail_url TEXT
+            );
+            CREATE TABLE IF NOT EXISTS sync_state (
+                name TEXT PRIMARY KEY,
+                id INTEGER
+            );
+            CREATE VIRTUAL TABLE IF NOT EXISTS summaries_fts USING fts5(
+                title, body, language UNINDEXED, tokenize = 'unicode61 remove_diacritics 2'
+            );
+        """)
+        self._conn.commit()
+
+    def add_many(self, rows: Iterable[Dict]) -> None:
+        """Insert or replace video_summaries rows in the index."""
+        with self._lock:
+            for row in rows:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO summaries "
+                    "(id, video_id, title, summary, language, timestamp, thumbnail_url) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (row['id'], row.get('video_id'), row.get('title'), row.get('summary'),
+                     row.get('language'), row.get('timestamp'), row.get('thumbnail_url'))
+                )
+                self._conn.execute("DELETE FROM summaries_fts WHERE rowid = ?", (row['id'],))
+                self._conn.execute(
+                    "INSERT INTO summaries_fts (rowid, title, body, language) VALUES (?, ?, ?, ?)",
+                    (row['id'], tokenize(row.get('title') or ''), tokenize(row.get('summary') or ''),
+                     row.get('language') or '')
+                )
+            self._conn.commit()
+
+    def add(self, row: Dict) -> None:
+        self.add_many([row])
+
+    def remove(self, summary_id: int) -> None:
+        self.remove_many([summary_id])
+
+    def remove_many(self, summary_ids: Iterable[int]) -> None:
+        with self._lock:
+            for summary_id in summary_ids:
+                self._conn.execute("DELETE FROM summaries WHERE id = ?", (summary_id,))
+                self._conn.execute("DELETE FROM summaries_fts WHERE rowid = ?", (summary_id,))
+            self._conn.commit()
+
+    def ids(self) -> Set[int]:
+        """Return the IDs of all indexed rows."""
+        with self._lock:
+            return {row[0] for row in self._conn.execute("SELECT id FROM summaries")}
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM summaries")
+            self._conn.execute("DELETE FROM summaries_fts")
+            self._conn.execute("DELETE FROM sync_state")
+            self._conn.commit()
+
+    def get_many(self, summary_ids: List[int]) -> Dict[int, Dict]:
+        """Return the indexed rows with the given IDs, keyed by ID."""
+        if not summary_ids:
+            return {}
+        placeholders = ','.join('?' * len(summary_ids))
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, video_id, title, summary, language, timestamp, thumbnail_url "
+                f"FROM summaries WHERE id IN ({placeholders})",
+                list(summary_ids)
+            ).fetchall()
+        return {row['id']: dict(row) for row in rows}
+
+    def iter_rows(self, batch_size: int = 500) -> Iterator[List[Dict]]:
+        """Yield every indexed row in ID order, ``batch_size`` rows at a time."""
+        last_id = -1
+        while True:
+            with self._lock:
+                rows = [dict(row) for row in self._conn.execute(
+                    "SELECT id, video_id, title, summary, language, timestamp, thumbnail_url "
+                    "FROM summaries WHERE id > ? ORDER BY id LIMIT ?",
+                    (last_id, batch_size)
+                )]
+            if not rows:
+                return
+            yield rows
+            last_id = rows[-1]['id']
+
+    def sync_cursor(self) -> Optional[int]:
+        """Return the ID of the last row pulled by an incremental sync.
+
+        Rows added with ``add_many`` outside a sync do not move the cursor, so
+        rows written meanwhile by other processes are still picked up.
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id FROM sync_state WHERE name = 'video_summaries'"
+            ).fetchone()
+        return row['id'] if row else None
+
+    def set_sync_cursor(self, last_id: int) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO sync_state (name, id) VALUES ('video_summaries', ?)",
+                (last_id,)
+            )
+            self._conn.commit()
+
+    def search(self, query: str, language: Optional[str] = None,
+               limit: int = 20) -> List[Dict]:
+        """Return the best matches for ``query``, each with a highlighted snippet."""
+        match = _match_query(query)
+        if match is None:
+            return []
+
+        # 言語の絞り込みもFTS側で行い、上位の行だけを本体テーブルと結合する
+        params = [match]
+        language_filter = ''
+        if language:
+            language_filter = ' AND language = ?'
+            params.append(language)
+        params.append(limit)
+        sql = (
+            "SELECT s.id, s.video_id, s.title, s.summary, s.language, s.timestamp, "
+            "s.thumbnail_url, hits.score FROM ("
+            "  SELECT rowid, bm25(summaries_fts, 2.0, 1.0, 0.0) AS score FROM summaries_fts"
+            f"  WHERE summaries_fts MATCH ?{language_filter} ORDER BY score LIMIT ?"
+            ") AS hits JOIN summaries s ON s.id = hits.rowid ORDER BY hits.score"
+        )
+
+        with self._lock:
+            rows = [dict(row) for row in self._conn.execute(sql, params)]
+
+        for row in rows:
+            row['snippet'] = highlight(row['summary'] or '', query)
+        return rows
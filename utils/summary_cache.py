@@ -0,0 +1,79 @@
+from typing import Any, Dict, Optional
+import hashlib
+import json
+from . import metrics
+from .cache import SQLiteCache, default_cache_path
+
+# 要約キャッシュの有効期限（秒）とサイズ上限
+SUMMARY_CACHE_TTL = 30 * 24 * 60 * 60
+SUMMARY_CACHE_MAX_BYTES = 50 * 1024 * 1024
+
+
+class SummaryCache:
+    """Two-tier cache of generated summaries keyed by a prompt hash.
+
+    The local tier is an on-disk SQLiteCache. When a database handler is
+    given, summaries already stored in ``video_summaries`` with the same
+    ``prompt_hash`` are used as a second tier and copied into the local one.
+    """
+
+    def __init__(self, local: Optional[SQLiteCache] = None, db_handler=None):
+        if local is None:
+            local = SQLiteCache(
+                default_cache_path('summaries'),
+                ttl=SUMMARY_CACHE_TTL,
+                max_bytes=SUMMARY_CACHE_MAX_BYTES
+            )
+        self.local = local
+        self.db_handler = db_handler
+
+    @staticmethod
+    def make_key(prompt: str, language: str, model_name: str,
+                 generation_config: Dict[str, Any]) -> str:
+        """Hash everything that influences the generated text."""
+        payload = json.dumps({
+            'model': model_name,
+            'language': language,
+            'config': generation_config,
+            'prompt': prompt
+        }, ensure_ascii=False, sort_keys=True)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        """Return the cached summary for ``key``, checking the local tier first."""
+        summary = self.local.get(key)
+        if summary is not None:
+            metrics.count('cache_requests_total', cache='summaries', result='hit')
+            return summary
+
+        if self.db_handler is not None:
+            try:
+                stored = self.db_handler.get_summary_by_prompt_hash(key)
+            except Exception:
+                stored = None
+            if stored is not None:
+                metrics.count('cache_requests_total', cache='summaries', result='db_hit')
+                self.local.set(key, stored.summary)
+                return stored.summary
+        metrics.count('cache_requests_total', cache='summaries', result='miss')
+        return None
+
+    def set(self, key: str, summary: str) -> None:
+        """Store a freshly generated summary in the local tier."""
+        self.local.set(key, summary)
+
+    def invalidate(self, key: str) -> bool:
+        """Drop ``key`` from both tiers. Returns True if it was cached.
+
+        Stored summaries keep their text but lose the prompt hash, so the
+        database tier cannot copy them back into the local one. Database
+        errors are raised after the local entry is dropped.
+        """
+        removed = self.local.delete(key)
+        if self.db_handler is not None:
+            removed = self.db_handler.forget_prompt_hash(key) > 0 or removed
+        return removed
+
+    def clear(self) -> None:
+        """Drop every locally cached summary."""
+        self.local.clear()
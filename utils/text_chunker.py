@@ -0,0 +1,103 @@
+from typing import Iterator, List, Tuple
+import re
+
+# 中国語・日本語の文末記号（字幕の正規化と共通）
+CJK_SENTENCE_ENDINGS = '。！？；'
+
+# かな・CJK統合漢字・ハングル（単語区切りのない文字）
+CJK_LETTERS = '\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af'
+
+# CJK句読点・全角記号を含むCJK文字全般
+_CJK_CHAR = re.compile('[\u3000-\u303f' + CJK_LETTERS + '\uff00-\uffef]')
+_SENTENCE_END = re.compile(r'[.!?]\s+|[' + CJK_SENTENCE_ENDINGS + r']\s*')
+
+
+def estimate_tokens(text: str) -> int:
+    """Roughly estimate the Gemini token count of ``text``.
+
+    CJK characters are counted as one token each; everything else is
+    counted at about four characters per token.
+    """
+    cjk = len(_CJK_CHAR.findall(text))
+    other = len(text) - cjk
+    return cjk + (other + 3) // 4
+
+
+def _iter_sentence_ends(text: str) -> Iterator[int]:
+    """Yield the offset after each sentence (and its trailing whitespace)."""
+    end = 0
+    for match in _SENTENCE_END.finditer(text):
+        end = match.end()
+        yield end
+    if end != len(text):
+        yield len(text)
+
+
+def _split_oversized(text: str, start: int, end: int, max_tokens: int) -> List[int]:
+    """Return cut offsets splitting ``text[start:end]`` into pieces within budget."""
+    cuts = []
+    while True:
+        # CJK is ~1 char per token, Latin ~4; shrink until the piece fits
+        cut = min(end - start, max_tokens * 4)
+        while cut > 1 and estimate_tokens(text[start:start + cut]) > max_tokens:
+            cut = cut * 3 // 4
+        if start + cut >= end:
+            return cuts
+        # 単語の途中で切らないよう、後半にある空白で区切る
+        space = text.rfind(' ', start, start + cut)
+        if space - start > cut // 2:
+            cut = space - start
+        start += max(cut, 1)
+        cuts.append(start)
+
+
+def chunk_spans(text: str, max_tokens: int) -> Iterator[Tuple[int, int]]:
+    """Yield ``(start, end)`` offsets of chunks of at most ``max_tokens`` tokens.
+
+    Chunks end on sentence boundaries; a sentence longer than the budget on
+    its own (common in unpunctuated auto-captions) is split on whitespace.
+    Chunks are produced lazily, so taking only the first one does not scan
+    the whole text.
+    """
+    chunk_start = 0
+    chunk_end = 0
+    chunk_tokens = 0
+    sentence_start = 0
+
+    for sentence_end in _iter_sentence_ends(text):
+        tokens = estimate_tokens(text[sentence_start:sentence_end])
+        if tokens > max_tokens:
+            cuts = _split_oversized(text, sentence_start, sentence_end, max_tokens)
+            bounds = [sentence_start] + cuts + [sentence_end]
+            pieces = [
+                (bounds[i], bounds[i + 1], estimate_tokens(text[bounds[i]:bounds[i + 1]]))
+                for i in range(len(bounds) - 1)
+            ]
+        else:
+            pieces = [(sentence_start, sentence_end, tokens)]
+
+        for piece_start, piece_end, piece_tokens in pieces:
+            if chunk_end > chunk_start and chunk_tokens + piece_tokens > max_tokens:
+                yield chunk_start, chunk_end
+                chunk_start = piece_start
+                chunk_tokens = 0
+            chunk_end = piece_end
+            chunk_tokens += piece_tokens
+        sentence_start = sentence_end
+
+    if chunk_end > chunk_start and text[chunk_start:chunk_end].strip():
+        yield chunk_start, chunk_end
+
+
+def chunk_text(text: str, max_tokens: int) -> List[str]:
+    """Pack sentences into chunks of at most ``max_tokens`` estimated tokens.
+
+    Chunks end on sentence boundaries; a sentence longer than the budget on
+    its own (common in unpunctuated auto-captions) is split on whitespace.
+    """
+    chunks = []
+    for start, end in chunk_spans(text, max_tokens):
+        chunk = text[start:end].strip()
+        if chunk:
+            chunks.append(chunk)
+    return chunks
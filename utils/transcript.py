@@ -0,0 +1,176 @@
+"""Compact, timestamped transcripts.
+
+``Transcript`` keeps the caption segments of a video column by column:
+start times and durations in ``array('d')``, the normalised text of all
+segments in one string and the offset of each segment in that string in
+``array('I')``. No per-segment objects are kept, so a transcript costs a
+few bytes per segment on top of its text, and slicing by time or by
+character offset only copies the selected part of each column.
+
+``to_bytes`` / ``from_bytes`` store the columns as a small binary record
+for the transcript cache.
+"""
+from array import array
+from bisect import bisect_left, bisect_right
+from typing import Dict, Iterable, Iterator, List, Tuple
+import struct
+import sys
+from .transcript_normalizer import normalize_transcript
+
+# バイナリ形式: マジック、セグメント数、テキストのバイト数（リトルエンディアン）
+_MAGIC = b'YTT1'
+_HEADER = struct.Struct('<4sII')
+
+
+def _separator(before: str, after: str) -> str:
+    """Return what joining two normalised segments with a space turns into."""
+    # 正規化は境界の前後1文字だけで決まり、文字数を変えない置換しか行わない
+    return normalize_transcript(before + ' ' + after)[1:-1]
+
+
+def _little_endian(column: array) -> bytes:
+    if sys.byteorder == 'big':
+        column = array(column.typecode, column)
+        column.byteswap()
+    return column.tobytes()
+
+
+def _from_little_endian(typecode: str, data: bytes) -> array:
+    column = array(typecode)
+    column.frombytes(data)
+    if sys.byteorder == 'big':
+        column.byteswap()
+    return column
+
+
+class Transcript:
+    """Caption segments stored as parallel arrays over one text buffer.
+
+    Segment ``i`` starts at ``starts[i]`` seconds, lasts ``durations[i]``
+    seconds and is ``text[offsets[i]:offsets[i + 1]]`` (including the
+    separator that follows it). ``offsets`` has one more entry than there
+    are segments; the last one is ``len(text)``.
+    """
+
+    __slots__ = ('starts', 'durations', 'offsets', 'text')
+
+    def __init__(self, starts: array, durations: array, offsets: array, text: str):
+        self.starts = starts
+        self.durations = durations
+        self.offsets = offsets
+        self.text = text
+
+    @classmethod
+    def from_entries(cls, entries: Iterable[Dict]) -> 'Transcript':
+        """Build a transcript from ``fetch()`` entries (text/start/duration dicts).
+
+        Each segment is normalised on its own and joined the way
+        ``normalize_transcript`` would join them; empty segments are dropped.
+        """
+        starts = array('d')
+        durations = array('d')
+        offsets = array('I')
+        parts: List[str] = []
+        length = 0
+        previous = ''
+        for entry in sorted(entries, key=lambda entry: entry['start']):
+            text = normalize_transcript(entry['text'])
+            if not text:
+                continue
+            if previous:
+                separator = _separator(previous[-1], text[0])
+                parts.append(separator)
+                length += len(separator)
+            starts.append(entry['start'])
+            durations.append(entry.get('duration', 0.0))
+            offsets.append(length)
+            parts.append(text)
+            length += len(text)
+            previous = text
+        offsets.append(length)
+        return cls(starts, durations, offsets, ''.join(parts))
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    def __str__(self) -> str:
+        return self.text
+
+    def __iter__(self) -> Iterator[Tuple[float, float, str]]:
+        """Yield ``(start, duration, text)`` for each segment."""
+        for i in range(len(self)):
+            yield self.segment(i)
+
+    def segment(self, index: int) -> Tuple[float, float, str]:
+        """Return ``(start, duration, text)`` of one segment."""
+        text = self.text[self.offsets[index]:self.offsets[index + 1]].rstrip()
+        return self.starts[index], self.durations[index], text
+
+    def segment_at(self, offset: int) -> int:
+        """Return the index of the segment containing character ``offset``."""
+        if not len(self):
+            raise IndexError("Transcript is empty")
+        index = bisect_right(self.offsets, offset, 0, len(self)) - 1
+        return min(max(index, 0), len(self) - 1)
+
+    def time_at(self, offset: int) -> float:
+        """Return the start time (seconds) of the segment at character ``offset``."""
+        return self.starts[self.segment_at(offset)]
+
+    def slice_time(self, start: float, end: float) -> 'Transcript':
+        """Return the segments overlapping ``[start, end)`` seconds."""
+        first = max(bisect_right(self.starts, start) - 1, 0)
+        if first < len(self) and self.starts[first] + self.durations[first] <= start:
+            first += 1
+        last = bisect_left(self.starts, end)
+        return self._segments(first, max(first, last))
+
+    def slice_chars(self, start: int, end: int) -> 'Transcript':
+        """Return the whole segments overlapping characters ``[start, end)``."""
+        if not len(self) or end <= start:
+            return self._segments(0, 0)
+        return self._segments(self.segment_at(start), self.segment_at(end - 1) + 1)
+
+    def _segments(self, first: int, last: int) -> 'Transcript':
+        base = self.offsets[first]
+        stop = self.offsets[last]
+        offsets = array('I', (offset - base for offset in self.offsets[first:last]))
+        # 末尾のセグメントの後ろの区切り文字は含めない
+        text = self.text[base:stop].rstrip()
+        offsets.append(len(text))
+        return Transcript(self.starts[first:last], self.durations[first:last], offsets, text)
+
+    def to_bytes(self) -> bytes:
+        """Serialise the columns into a compact binary record."""
+        text = self.text.encode('utf-8')
+        return b''.join([
+            _HEADER.pack(_MAGIC, len(self), len(text)),
+            _little_endian(self.starts),
+            _little_endian(self.durations),
+            _little_endian(self.offsets),
+            text,
+        ])
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> 'Transcript':
+        """Rebuild a transcript written by ``to_bytes``.
+
+        Raises:
+            ValueError: If ``data`` is not a serialised transcript
+        """
+        if len(data) < _HEADER.size:
+            raise ValueError("Not a serialised transcript")
+        magic, count, text_bytes = _HEADER.unpack_from(data)
+        if magic != _MAGIC:
+            raise ValueError("Not a serialised transcript")
+
+        position = _HEADER.size
+        columns = []
+        for typecode, length in (('d', count), ('d', count), ('I', count + 1)):
+            size = array(typecode).itemsize * length
+            columns.append(_from_little_endian(typecode, data[position:position + size]))
+            position += size
+        if len(data) != position + text_bytes:
+            raise ValueError("Truncated transcript record")
+        text = data[position:].decode('utf-8')
+        return cls(columns[0], columns[1], columns[2], text)
@@ -0,0 +1,59 @@
+"""Transcript text normalisation.
+
+Caption segments are joined with spaces, which leaves spaces between
+Chinese and Japanese characters in the text sent to Gemini.
+``normalize_transcript`` fixes that in a single precompiled regex pass for
+every language:
+
+* whitespace between Han/kana characters (or CJK punctuation) is removed;
+  Hangul is left alone because Korean separates words with spaces,
+* CJK sentence endings are followed by a single line break.
+
+Transcripts are normalised once when they are fetched, so prompt building
+does not have to process them again. Chinese prompts additionally map
+full-width colons and commas and curly quotes to ASCII with
+``to_ascii_punctuation`` (one ``str.translate`` pass), as the Chinese
+preprocessing always did; Japanese text keeps its punctuation.
+"""
+import re
+from .text_chunker import CJK_SENTENCE_ENDINGS
+
+# 漢字・かな・CJK句読点・全角英数記号と半角カナ（ハングルは単語間の空白が必要なので含めない）
+_HAN_KANA = '\u3000-\u303f\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uff00-\uff9f'
+
+# 漢字・かなの後に続く、文末記号の後の空白（なくてもよい）か漢字・かなの前の空白。
+# 先頭を1つの文字クラスにしておくと、英語などの字幕は正規表現エンジンが読み飛ばせる
+_WHITESPACE = re.compile(
+    '([' + _HAN_KANA + r'])(?:(?<=[' + CJK_SENTENCE_ENDINGS + r'])\s*|\s+(?=[' + _HAN_KANA + ']))'
+)
+
+# 中国語のプロンプトでのみ使う句読点の置き換え
+_ASCII_PUNCTUATION = str.maketrans({
+    '\uff1a': ':',   # ：
+    '\uff0c': ',',   # ，
+    '\u201c': '"',   # “
+    '\u201d': '"',   # ”
+})
+
+_CHINESE = re.compile('[\u4e00-\u9fff]')
+
+
+def _replace_whitespace(match: 're.Match') -> str:
+    # 文末記号の後は改行1つ、それ以外は空白を削除
+    char = match.group(1)
+    return char + '\n' if char in CJK_SENTENCE_ENDINGS else char
+
+
+def normalize_transcript(text: str) -> str:
+    """Normalise the whitespace of a joined transcript (any language)."""
+    return _WHITESPACE.sub(_replace_whitespace, text).strip()
+
+
+def to_ascii_punctuation(text: str) -> str:
+    """Map full-width colons and commas and curly quotes to ASCII (Chinese prompts)."""
+    return text.translate(_ASCII_PUNCTUATION)
+
+
+def contains_chinese(text: str) -> bool:
+    """Return True if ``text`` contains any CJK unified ideograph."""
+    return _CHINESE.search(text) is not None
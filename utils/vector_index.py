@@ -0,0 +1,310 @@
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, Optional, Tuple
+import json
+import os
+import threading
+import zlib
+import numpy as np
+from .search_index import tokenize_terms
+
+try:
+    import fcntl
+except ImportError:  # Windows ではプロセス間のロックなし
+    fcntl = None
+
+# ローカル埋め込み（特徴ハッシング）の次元数
+HASHING_DIMENSIONS = 512
+
+# Gemini の埋め込みモデル（EMBEDDING_MODEL で指定したときだけ使う）と1リクエストあたりの件数
+GEMINI_EMBEDDING_DIMENSIONS = 768
+GEMINI_EMBEDDING_BATCH_SIZE = 100
+
+# ベクトルファイルの初期容量（行数）。足りなくなったら倍に広げる
+INITIAL_CAPACITY = 1024
+
+
+def summary_text(row: Dict) -> str:
+    """Return the text embedded for a video_summaries row (title and summary)."""
+    return f"{row.get('title') or ''}\n{row.get('summary') or ''}"
+
+
+class HashingEmbedder:
+    """Deterministic local embedding: signed feature hashing of index tokens.
+
+    Texts are split like the full-text index (words plus CJK bigrams), each
+    token is hashed with CRC32 into one of ``dimensions`` buckets with a
+    sign, and the counts are L2-normalised. No model or network is needed,
+    and the same text always gets the same vector.
+    """
+
+    def __init__(self, dimensions: int = HASHING_DIMENSIONS):
+        self.dimensions = dimensions
+        self.name = f"hashing-{dimensions}"
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        vectors = np.zeros((len(texts), self.dimensions), dtype=np.float32)
+        for row, text in enumerate(texts):
+            hashes = np.fromiter(
+                (zlib.crc32(token.encode('utf-8'))
+                 for term in tokenize_terms(text) for token in term),
+                dtype=np.uint32
+            )
+            if not len(hashes):
+                continue
+            signs = np.where(hashes & 0x80000000, -1.0, 1.0)
+            vectors[row] = np.bincount(hashes % self.dimensions, weights=signs,
+                                       minlength=self.dimensions)
+        return vectors
+
+
+class GeminiEmbedder:
+    """Embeddings from the Gemini API (requires ``genai.configure``)."""
+
+    def __init__(self, model: str, dimensions: int = GEMINI_EMBEDDING_DIMENSIONS):
+        self.model = model
+        self.dimensions = dimensions
+        self.name = f"gemini-{model}"
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        import google.generativeai as genai
+
+        vectors = []
+        for start in range(0, len(texts), GEMINI_EMBEDDING_BATCH_SIZE):
+            result = genai.embed_content(
+                model=self.model,
+                content=texts[start:start + GEMINI_EMBEDDING_BATCH_SIZE],
+                task_type='semantic_similarity'
+            )
+            vectors.extend(result['embedding'])
+        return np.asarray(vectors, dtype=np.float32).reshape(len(texts), self.dimensions)
+
+
+def default_embedder():
+    """Use Gemini embeddings if ``EMBEDDING_MODEL`` is set, else the local fallback."""
+    model = os.environ.get('EMBEDDING_MODEL')
+    if model:
+        return GeminiEmbedder(model)
+    return HashingEmbedder()
+
+
+class VectorIndex:
+    """Flat nearest-neighbour index of summary embeddings, memory-mapped from disk.
+
+    ``directory`` holds three files: ``vectors.f32`` (unit-length float32
+    rows), ``ids.i64`` (the summary ID of each row, -1 for removed rows) and
+    ``index.json`` (dimensions, row count, embedder name and version). Adding a
+    summary writes one row in place and grows the files by doubling, so
+    inserts are incremental. Queries take the dot product with every row
+    and pick the top ``k`` with ``argpartition``; for the tens of thousands
+    of summaries this app keeps that is a few milliseconds.
+
+    The embedder is any object with ``name``, ``dimensions`` and
+    ``embed(texts) -> ndarray``. If it differs from the one the files were
+    built with, the index starts empty and must be rebuilt.
+
+    Several processes (e.g. app workers and batch runs) may share the
+    directory: writes hold an ``fcntl`` lock on ``index.lock`` and re-read
+    ``index.json`` first, and every write bumps its ``version`` so that
+    readers pick up rows added or removed elsewhere. Files only ever grow,
+    so another process's mapping never points past the end of a file.
+    """
+
+    def __init__(self, directory: str, embedder=None):
+        self.directory = directory
+        self.embedder = embedder or default_embedder()
+        self.dimensions = self.embedder.dimensions
+        self._lock = threading.Lock()
+        self._count = 0
+        self._version = -1
+        self._positions: Dict[int, int] = {}
+        os.makedirs(directory, exist_ok=True)
+
+        with self._file_lock():
+            meta = self._read_meta()
+            self._open(max(INITIAL_CAPACITY, meta['count'] if self._compatible(meta) else 0))
+            if not self._compatible(meta):
+                self._reset()
+            self._refresh()
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    @contextmanager
+    def _file_lock(self):
+        """Hold an exclusive lock on the index files across processes."""
+        if fcntl is None:
+            yield
+            return
+        with open(self._path('index.lock'), 'a') as f:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+    def _compatible(self, meta: Optional[Dict]) -> bool:
+        return (meta is not None and meta.get('dimensions') == self.dimensions
+                and meta.get('embedder') == self.embedder.name)
+
+    def _refresh(self) -> None:
+        """Re-read ``index.json`` and pick up changes made by other processes."""
+        meta = self._read_meta()
+        if not self._compatible(meta) or meta.get('version', 0) == self._version:
+            return
+        count = meta['count']
+        if count > self._capacity:
+            self._grow(count)
+        self._count = count
+        self._version = meta.get('version', 0)
+        self._positions = {
+            int(summary_id): position
+            for position, summary_id in enumerate(self._ids[:count].tolist())
+            if summary_id >= 0
+        }
+
+    def _reset(self) -> None:
+        """Empty the index in place (the files keep their size)."""
+        self._ids[:] = -1
+        self._ids.flush()
+        self._count = 0
+        self._positions = {}
+        self._write_meta()
+
+    def _read_meta(self) -> Optional[Dict]:
+        try:
+            with open(self._path('index.json'), encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write_meta(self) -> None:
+        # 途中で落ちても壊れないよう、書き込んでから置き換える
+        self._version = max(self._version, 0) + 1
+        temporary = self._path('index.json.tmp')
+        with open(temporary, 'w', encoding='utf-8') as f:
+            json.dump({'dimensions': self.dimensions, 'count': self._count,
+                       'embedder': self.embedder.name, 'version': self._version}, f)
+        os.replace(temporary, self._path('index.json'))
+
+    def _open(self, capacity: int) -> None:
+        """(Re)map the vector and ID files with room for ``capacity`` rows."""
+        for name, row_bytes in (('vectors.f32', 4 * self.dimensions), ('ids.i64', 8)):
+            # 他のプロセスがマップしているため、ファイルを切り詰めない
+            with open(self._path(name), 'a+b') as f:
+                if os.fstat(f.fileno()).st_size < capacity * row_bytes:
+                    f.truncate(capacity * row_bytes)
+        self._capacity = capacity
+        self._vectors = np.memmap(self._path('vectors.f32'), dtype=np.float32, mode='r+',
+                                  shape=(capacity, self.dimensions))
+        self._ids = np.memmap(self._path('ids.i64'), dtype=np.int64, mode='r+',
+                              shape=(capacity,))
+
+    def _grow(self, needed: int) -> None:
+        capacity = self._capacity
+        while capacity < needed:
+            capacity *= 2
+        self._vectors.flush()
+        self._ids.flush()
+        self._open(capacity)
+
+    def __len__(self) -> int:
+        with self._lock:
+            self._refresh()
+            return len(self._positions)
+
+    def __contains__(self, summary_id: int) -> bool:
+        with self._lock:
+            self._refresh()
+            return summary_id in self._positions
+
+    def _normalize(self, vectors: np.ndarray) -> np.ndarray:
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(-1, self.dimensions)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.where(norms > 0, norms, 1.0)
+
+    def add_many(self, rows: Iterable[Dict]) -> None:
+        """Embed video_summaries rows and insert (or replace) them."""
+        rows = [row for row in rows if row.get('id') is not None]
+        if not rows:
+            return
+        vectors = self._normalize(self.embedder.embed([summary_text(row) for row in rows]))
+
+        with self._lock, self._file_lock():
+            self._refresh()
+            for row, vector in zip(rows, vectors):
+                position = self._positions.get(row['id'])
+                if position is None:
+                    if self._count >= self._capacity:
+                        self._grow(self._count + 1)
+                    position = self._count
+                    self._count += 1
+                    self._positions[row['id']] = position
+                self._vectors[position] = vector
+                self._ids[position] = row['id']
+            self._vectors.flush()
+            self._ids.flush()
+            self._write_meta()
+
+    def remove(self, summary_id: int) -> None:
+        with self._lock, self._file_lock():
+            self._refresh()
+            position = self._positions.pop(summary_id, None)
+            if position is None:
+                return
+            # 行は詰めずに空き行として残す
+            self._ids[position] = -1
+            self._vectors[position] = 0
+            self._vectors.flush()
+            self._ids.flush()
+            self._write_meta()
+
+    def clear(self) -> None:
+        with self._lock, self._file_lock():
+            self._reset()
+
+    def vector(self, summary_id: int) -> Optional[np.ndarray]:
+        """Return the stored (unit-length) vector of a summary."""
+        with self._lock:
+            self._refresh()
+            position = self._positions.get(summary_id)
+            return None if position is None else np.array(self._vectors[position])
+
+    def search(self, vector: np.ndarray, k: int = 10,
+               exclude: Iterable[int] = ()) -> List[Tuple[int, float]]:
+        """Return up to ``k`` ``(summary_id, cosine similarity)`` pairs, best first."""
+        query = self._normalize(vector)[0]
+        exclude = set(exclude)
+        with self._lock:
+            self._refresh()
+            count = self._count
+            if not count or k <= 0:
+                return []
+            scores = self._vectors[:count] @ query
+            ids = np.array(self._ids[:count])
+
+        scores[ids < 0] = -np.inf
+        wanted = min(k + len(exclude), count)
+        top = np.argpartition(-scores, wanted - 1)[:wanted]
+        top = top[np.argsort(-scores[top], kind='stable')]
+
+        results = []
+        for position in top.tolist():
+            summary_id = int(ids[position])
+            if summary_id < 0 or summary_id in exclude:
+                continue
+            results.append((summary_id, float(scores[position])))
+            if len(results) == k:
+                break
+        return results
+
+    def search_text(self, text: str, k: int = 10,
+                    exclude: Iterable[int] = ()) -> List[Tuple[int, float]]:
+        """Embed ``text`` and return its nearest summaries."""
+        return self.search(self.embedder.embed([text]), k=k, exclude=exclude)
+
+    def similar(self, summary_id: int, k: int = 10) -> List[Tuple[int, float]]:
+        """Return the summaries nearest to an indexed summary (excluding itself)."""
+        vector = self.vector(summary_id)
+        if vector is None:
+            return []
+        return self.search(vector, k=k, exclude=[summary_id])
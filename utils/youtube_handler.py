@@ -1,12 +1,160 @@
-from typing import Dict, List
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
 import google.api_core.exceptions
 from googleapiclient.discovery import build
-from youtube_transcript_api import YouTubeTranscriptApi
+from googleapiclient.errors import HttpError
+from googleapiclient.http import build_http
+from youtube_transcript_api import TranscriptsDisabled, YouTubeTranscriptApi
+import queue
 import re
+import time
+from . import metrics
+from .cache import SQLiteCache, default_cache_path
+from .single_flight import SingleFlight
+from .transcript import Transcript
+
+# 字幕キャッシュの有効期限（秒）とサイズ上限
+TRANSCRIPT_CACHE_TTL = 7 * 24 * 60 * 60
+TRANSCRIPT_CACHE_MAX_BYTES = 200 * 1024 * 1024
+# 字幕一覧は字幕の追加・自動生成で変わるため、字幕本体より短く保持する
+# （字幕のない動画は後から自動字幕が付くことが多いので、さらに短く）
+TRANSCRIPT_LISTING_TTL = 60 * 60
+TRANSCRIPT_LISTING_EMPTY_TTL = 10 * 60
+
+# 要約言語ごとに一致とみなす字幕の言語コード（優先順）と、YouTubeの自動翻訳で指定するコード
+TRANSCRIPT_LANGUAGE_CODES = {
+    'ja': ['ja'],
+    'en': ['en', 'en-US', 'en-GB'],
+    'zh': ['zh-Hans', 'zh-CN', 'zh-SG', 'zh', 'zh-Hant', 'zh-TW', 'zh-HK'],
+}
+TRANSLATION_LANGUAGE_CODES = {'ja': 'ja', 'en': 'en', 'zh': 'zh-Hans'}
+# 要約言語の字幕も翻訳もない場合に選ぶ字幕の言語（優先順）
+FALLBACK_TRANSCRIPT_LANGUAGES = ['en', 'ja', 'zh']
+
+# videos.list accepts at most 50 comma-separated IDs per request
+VIDEOS_LIST_MAX_IDS = 50
+
+# チャンネルの最新動画（アップロード再生リスト）のキャッシュ
+# CHANNEL_FEED_TTL 秒以内は問い合わせず、それ以降は ETag で再検証する
+CHANNEL_FEED_TTL = 10 * 60
+CHANNEL_FEED_CACHE_TTL = 7 * 24 * 60 * 60
+CHANNEL_FEED_CACHE_MAX_BYTES = 20 * 1024 * 1024
+# 1チャンネルあたりに保持する動画数（playlistItems.list の1ページ分）
+CHANNEL_FEED_SIZE = 10
+
+# 再生リストに残る、再生できない動画のタイトル
+UNAVAILABLE_VIDEO_TITLES = ('Private video', 'Deleted video')
+
+
+def _language_rank(language_code: str, language: str) -> Optional[int]:
+    """Preference of a caption language for ``language`` (lower is better, None if unrelated)."""
+    codes = TRANSCRIPT_LANGUAGE_CODES.get(language, [language])
+    if language_code in codes:
+        return codes.index(language_code)
+    if language_code.split('-')[0] == language:
+        return len(codes)
+    return None
+
+
+def _fallback_rank(track: Dict) -> Tuple[bool, int]:
+    base = track['language_code'].split('-')[0]
+    if base in FALLBACK_TRANSCRIPT_LANGUAGES:
+        return track['is_generated'], FALLBACK_TRANSCRIPT_LANGUAGES.index(base)
+    return track['is_generated'], len(FALLBACK_TRANSCRIPT_LANGUAGES)
+
+
+def choose_transcript(tracks: List[Dict], language: Optional[str]) -> Optional[Dict]:
+    """Pick the caption track to summarise a video in ``language`` from.
+
+    ``tracks`` is a cached listing (``language_code``, ``is_generated``,
+    ``translation_languages`` per track). In order of preference:
+
+    1. manual captions in the target language
+    2. auto-generated captions in the target language
+    3. manual captions translated by YouTube into the target language
+    4. auto-generated captions translated by YouTube
+    5. any track as is, manual before auto-generated
+
+    Returns:
+        Optional[Dict]: ``language_code``, ``is_generated`` and ``translate_to``
+        (None when no translation is needed), or None if there are no tracks
+    """
+    if not tracks:
+        return None
+    fallback_order = sorted(tracks, key=_fallback_rank)
+
+    if language is not None:
+        for generated in (False, True):
+            ranked = [
+                (rank, track) for track in tracks
+                if track['is_generated'] == generated
+                and (rank := _language_rank(track['language_code'], language)) is not None
+            ]
+            if ranked:
+                track = min(ranked, key=lambda item: item[0])[1]
+                return {'language_code': track['language_code'], 'is_generated': generated,
+                        'translate_to': None}
+
+        target = TRANSLATION_LANGUAGE_CODES.get(language, language)
+        for track in fallback_order:
+            if target in track['translation_languages']:
+                return {'language_code': track['language_code'],
+                        'is_generated': track['is_generated'], 'translate_to': target}
+
+    track = fallback_order[0]
+    return {'language_code': track['language_code'], 'is_generated': track['is_generated'],
+            'translate_to': None}
+
 
 class YouTubeHandler:
-    def __init__(self, api_key: str):
-        self.youtube = build('youtube', 'v3', developerKey=api_key)
+    def __init__(self, api_key: str, max_workers: int = 8,
+                 transcript_cache: Optional[SQLiteCache] = None,
+                 youtube=None, transcript_api=None,
+                 channel_cache: Optional[SQLiteCache] = None,
+                 transcript_store=None):
+        # youtube / transcript_api はベンチマーク等で差し替えるためのもの
+        self.youtube = youtube if youtube is not None else build('youtube', 'v3', developerKey=api_key)
+        self.transcript_api = transcript_api if transcript_api is not None else YouTubeTranscriptApi
+        self.max_workers = max_workers
+        self._http_pool: queue.LifoQueue = queue.LifoQueue()
+
+        if transcript_cache is None:
+            transcript_cache = SQLiteCache(
+                default_cache_path('transcripts'),
+                ttl=TRANSCRIPT_CACHE_TTL,
+                max_bytes=TRANSCRIPT_CACHE_MAX_BYTES
+            )
+        self.transcript_cache = transcript_cache
+        # 保存済みの字幕（DatabaseHandler.get_stored_transcript）。ローカルキャッシュにない場合に使う
+        self.transcript_store = transcript_store
+
+        if channel_cache is None:
+            channel_cache = SQLiteCache(
+                default_cache_path('channel_feeds'),
+                ttl=CHANNEL_FEED_CACHE_TTL,
+                max_bytes=CHANNEL_FEED_CACHE_MAX_BYTES
+            )
+        self.channel_cache = channel_cache
+        # 同じチャンネルの同時取得は1回のリクエストにまとめる
+        self._channel_flight = SingleFlight()
+
+    @contextmanager
+    def _http(self) -> Iterator:
+        """Borrow an HTTP client from the pool for one request.
+
+        httplib2.Http is not thread-safe, so concurrent requests must not share
+        a client; pooled clients keep their connections alive between
+        requests, threads and sessions.
+        """
+        try:
+            http = self._http_pool.get_nowait()
+        except queue.Empty:
+            http = build_http()
+        try:
+            yield http
+        finally:
+            self._http_pool.put(http)
 
     def extract_video_id(self, url: str) -> str:
         """Extract video ID from YouTube URL."""
@@ -21,66 +169,288 @@ class YouTubeHandler:
                 return match.group(1)
         raise ValueError("Invalid YouTube URL")
 
+    def source_key(self, urls: List[str], language: str) -> str:
+        """Identify a summary job by language and the (unordered) set of video IDs."""
+        video_ids = set()
+        for url in urls:
+            try:
+                video_ids.add(self.extract_video_id(url))
+            except ValueError:
+                video_ids.add(url)
+        return f"{language}:{','.join(sorted(video_ids))}"
+
     def get_video_details(self, video_id: str) -> Dict:
         """Get video title, description, and thumbnail."""
-        try:
-            response = self.youtube.videos().list(
-                part='snippet',
-                id=video_id
-            ).execute()
+        details = self.get_videos_details([video_id])
+        if video_id not in details:
+            raise ValueError("Video not found")
+        return details[video_id]
 
-            if not response['items']:
-                raise ValueError("Video not found")
+    def get_videos_details(self, video_ids: List[str]) -> Dict[str, Dict]:
+        """Get details for many videos, batching up to 50 IDs per videos.list call.
 
-            snippet = response['items'][0]['snippet']
-            return {
-                'title': snippet['title'],
-                'description': snippet['description'],
-                'channelId': snippet['channelId'],
-                'thumbnail': snippet['thumbnails']['high']['url']  # 高解像度のサムネイルを取得
-            }
+        Returns a mapping of video ID to details; IDs that YouTube does not
+        know about are simply absent from the result.
+        """
+        unique_ids = list(dict.fromkeys(video_ids))
+        batches = [
+            unique_ids[i:i + VIDEOS_LIST_MAX_IDS]
+            for i in range(0, len(unique_ids), VIDEOS_LIST_MAX_IDS)
+        ]
+
+        details: Dict[str, Dict] = {}
+        if len(batches) == 1:
+            details.update(self._fetch_videos_batch(batches[0]))
+        elif batches:
+            with ThreadPoolExecutor(max_workers=min(self.max_workers, len(batches))) as executor:
+                for batch_details in executor.map(metrics.wrap(self._fetch_videos_batch), batches):
+                    details.update(batch_details)
+        return details
+
+    def _fetch_videos_batch(self, video_ids: List[str]) -> Dict[str, Dict]:
+        """Run a single videos.list request for at most 50 IDs."""
+        try:
+            with metrics.span('youtube_videos_list') as span:
+                request = self.youtube.videos().list(
+                    part='snippet',
+                    id=','.join(video_ids)
+                )
+                with self._http() as http:
+                    response = request.execute(http=http)
+                span.set(ids=len(video_ids), items=len(response.get('items', [])))
+
+            details = {}
+            for item in response.get('items', []):
+                snippet = item['snippet']
+                details[item['id']] = {
+                    'title': snippet['title'],
+                    'description': snippet['description'],
+                    'channelId': snippet['channelId'],
+                    'channelTitle': snippet.get('channelTitle'),
+                    'thumbnail': snippet['thumbnails']['high']['url']  # 高解像度のサムネイルを取得
+                }
+            return details
         except google.api_core.exceptions.Error as e:
             raise Exception(f"YouTube API error: {str(e)}")
 
-    def get_transcript(self, video_id: str) -> str:
-        """Get video transcript."""
+    def _list_transcripts(self, video_id: str) -> Tuple[List[Dict], Any]:
+        """Return the caption tracks of a video, from the transcript cache when possible.
+
+        When the listing had to be fetched, the live TranscriptList is
+        returned as well so a track can be downloaded without listing again.
+        Listings are reused for ``TRANSCRIPT_LISTING_TTL`` seconds, and
+        empty ones (no captions yet) for ``TRANSCRIPT_LISTING_EMPTY_TTL``.
+        """
+        listing_key = f"{video_id}:tracks"
+        cached = self.transcript_cache.get(listing_key)
+        if isinstance(cached, dict):
+            ttl = TRANSCRIPT_LISTING_TTL if cached['tracks'] else TRANSCRIPT_LISTING_EMPTY_TTL
+            if time.time() - cached['fetched_at'] < ttl:
+                metrics.count('cache_requests_total', cache='transcript_listings', result='hit')
+                return cached['tracks'], None
+        metrics.count('cache_requests_total', cache='transcript_listings', result='miss')
+
+        with metrics.span('youtube_transcript_list') as span:
+            try:
+                transcript_list = self.transcript_api.list_transcripts(video_id)
+            except TranscriptsDisabled:
+                # 字幕のない動画も短時間だけ記録して、続けて問い合わせないようにする
+                transcript_list = []
+            tracks = [
+                {
+                    'language_code': track.language_code,
+                    'is_generated': track.is_generated,
+                    'translation_languages': [
+                        translation['language_code'] for translation in track.translation_languages
+                    ]
+                }
+                for track in transcript_list
+            ]
+            span.set(tracks=len(tracks))
+
+        self.transcript_cache.set(listing_key, {'tracks': tracks, 'fetched_at': time.time()})
+        return tracks, transcript_list
+
+    def get_transcript(self, video_id: str, language: Optional[str] = None) -> str:
+        """Get the text of the video transcript best suited to ``language``."""
+        return self.get_timed_transcript(video_id, language).text
+
+    def get_timed_transcript(self, video_id: str, language: Optional[str] = None) -> Transcript:
+        """Get the video transcript best suited to a summary in ``language``.
+
+        The segments keep their start times and durations (see
+        ``Transcript``). The caption listing and the downloaded segments are
+        both kept in the local cache, so summaries of the same video in
+        other languages that resolve to the same track do not download it
+        again. See ``choose_transcript`` for the order tracks are preferred in.
+        """
+        return self.get_transcript_track(video_id, language)[1]
+
+    def get_transcript_track(self, video_id: str,
+                             language: Optional[str] = None) -> Tuple[str, Transcript]:
+        """Like ``get_timed_transcript``, also returning the chosen track.
+
+        The track is ``"<language code>:<manual|generated>[><translation>]"``.
+        On a local cache miss the transcript stored with an earlier summary
+        (``transcript_store``) is used before downloading it again.
+        """
         try:
-            transcript_list = YouTubeTranscriptApi.get_transcript(video_id, languages=['en', 'ja', 'zh'])
-            return " ".join([entry['text'] for entry in transcript_list])
+            tracks, transcript_list = self._list_transcripts(video_id)
+            choice = choose_transcript(tracks, language)
+            if choice is None:
+                raise ValueError("No transcripts are available for this video")
+
+            kind = 'generated' if choice['is_generated'] else 'manual'
+            track = f"{choice['language_code']}:{kind}"
+            if choice['translate_to']:
+                track += f">{choice['translate_to']}"
+            cache_key = f"{video_id}:{track}"
+            transcript = self._cached_transcript(cache_key)
+            if transcript is not None:
+                metrics.count('cache_requests_total', cache='transcripts', result='hit')
+                return track, transcript
+            metrics.count('cache_requests_total', cache='transcripts', result='miss')
+
+            transcript = self._stored_transcript(video_id, track)
+            if transcript is None:
+                with metrics.span('youtube_transcript', kind=kind,
+                                  translated=bool(choice['translate_to'])) as span:
+                    if transcript_list is None:
+                        transcript_list = self.transcript_api.list_transcripts(video_id)
+                    if choice['is_generated']:
+                        found = transcript_list.find_generated_transcript([choice['language_code']])
+                    else:
+                        found = transcript_list.find_manually_created_transcript([choice['language_code']])
+                    if choice['translate_to']:
+                        # YouTube側の翻訳を使い、Geminiでの翻訳を減らす
+                        found = found.translate(choice['translate_to'])
+                    transcript = Transcript.from_entries(found.fetch())
+                    span.set(bytes=len(transcript.text.encode('utf-8')), segments=len(transcript))
         except Exception as e:
             raise Exception(f"Could not fetch transcript: {str(e)}")
 
-    def get_channel_latest_videos(self, url: str, max_results: int = 5) -> List[Dict]:
-        """Get latest videos from the same channel."""
+        self.transcript_cache.set_bytes(cache_key, transcript.to_bytes())
+        return track, transcript
+
+    def _stored_transcript(self, video_id: str, track: str) -> Optional[Transcript]:
+        if self.transcript_store is None:
+            return None
+        try:
+            transcript = self.transcript_store.get_stored_transcript(video_id, track)
+        except Exception:
+            # データベースに問題があってもYouTubeから取得できる
+            transcript = None
+        metrics.count('cache_requests_total', cache='stored_transcripts',
+                      result='miss' if transcript is None else 'hit')
+        return transcript
+
+    def _cached_transcript(self, cache_key: str) -> Optional[Transcript]:
+        data = self.transcript_cache.get_bytes(cache_key)
+        if data is None:
+            return None
+        try:
+            return Transcript.from_bytes(data)
+        except ValueError:
+            # 以前の形式（JSON文字列）のエントリは取得し直す
+            return None
+
+    def _uploads_playlist_id(self, channel_id: str) -> str:
+        """Return the ID of the playlist holding every upload of a channel."""
+        # UCxxxx のチャンネルのアップロード再生リストは UUxxxx
+        if channel_id.startswith('UC'):
+            return 'UU' + channel_id[2:]
+        request = self.youtube.channels().list(part='contentDetails', id=channel_id)
+        with self._http() as http:
+            response = request.execute(http=http)
+        items = response.get('items', [])
+        if not items:
+            raise ValueError("Channel not found")
+        return items[0]['contentDetails']['relatedPlaylists']['uploads']
+
+    def _fetch_channel_feed(self, channel_id: str) -> List[Dict]:
+        """Read the newest uploads of a channel through the channel cache.
+
+        A feed younger than ``CHANNEL_FEED_TTL`` is returned without any
+        request. An older one is revalidated with its ETag: playlistItems.list
+        answers 304 Not Modified when nothing was uploaded, and the cached
+        items are kept. playlistItems.list costs 1 quota unit against 100 for
+        search.list.
+        """
+        cached = self.channel_cache.get(channel_id)
+        if cached is not None and time.time() - cached['fetched_at'] < CHANNEL_FEED_TTL:
+            metrics.count('cache_requests_total', cache='channel_feeds', result='hit')
+            return cached['items']
+
+        playlist_id = cached['playlist_id'] if cached else self._uploads_playlist_id(channel_id)
+        with metrics.span('youtube_playlist_items') as span:
+            request = self.youtube.playlistItems().list(
+                part='snippet',
+                playlistId=playlist_id,
+                maxResults=CHANNEL_FEED_SIZE
+            )
+            if cached is not None and cached.get('etag'):
+                request.headers['If-None-Match'] = cached['etag']
+            try:
+                with self._http() as http:
+                    response = request.execute(http=http)
+            except HttpError as e:
+                if cached is None or e.resp.status != 304:
+                    raise
+                response = None
+            span.set(not_modified=int(response is None))
+
+        if response is None:
+            metrics.count('cache_requests_total', cache='channel_feeds', result='revalidated')
+            cached['fetched_at'] = time.time()
+            self.channel_cache.set(channel_id, cached)
+            return cached['items']
+        metrics.count('cache_requests_total', cache='channel_feeds', result='miss')
+
+        items = []
+        for item in response.get('items', []):
+            snippet = item['snippet']
+            thumbnails = snippet.get('thumbnails', {})
+            if snippet['title'] in UNAVAILABLE_VIDEO_TITLES or 'high' not in thumbnails:
+                continue
+            items.append({
+                'id': snippet['resourceId']['videoId'],
+                'title': snippet['title'],
+                'thumbnail': thumbnails['high']['url']  # 高解像度のサムネイルを使用
+            })
+        self.channel_cache.set(channel_id, {
+            'playlist_id': playlist_id,
+            'etag': response.get('etag'),
+            'items': items,
+            'fetched_at': time.time()
+        })
+        return items
+
+    def get_channel_latest_videos(self, url: str, max_results: int = 5,
+                                  channel_id: Optional[str] = None) -> List[Dict]:
+        """Get latest videos from the same channel.
+
+        Pass ``channel_id`` when the video has already been resolved (e.g. by
+        ``process_videos``) to skip the extra videos.list lookup. Feeds are
+        read from the channel's uploads playlist and cached per channel (see
+        ``_fetch_channel_feed``); concurrent lookups of one channel share a
+        single request.
+        """
         try:
-            # まず動画のチャンネルIDを取得
             video_id = self.extract_video_id(url)
-            video_details = self.get_video_details(video_id)
-            channel_id = video_details['channelId']
+            if channel_id is None:
+                # まず動画のチャンネルIDを取得
+                channel_id = self.get_video_details(video_id)['channelId']
 
             # チャンネルの最新動画を取得
-            response = self.youtube.search().list(
-                part='snippet',
-                channelId=channel_id,
-                order='date',  # 日付順で並べ替え
-                type='video',
-                maxResults=max_results + 1  # 現在の動画も含まれる可能性があるため+1
-            ).execute()
+            feed, _ = self._channel_flight.do(
+                channel_id, lambda: self._fetch_channel_feed(channel_id)
+            )
 
-            latest_videos = []
             current_video_id = video_id.lower()  # 大文字小文字を区別しないように
-
-            for item in response.get('items', []):
-                if item['id']['kind'] == 'youtube#video':
-                    # 現在の動画を除外
-                    if item['id']['videoId'].lower() != current_video_id:
-                        latest_videos.append({
-                            'id': item['id']['videoId'],
-                            'title': item['snippet']['title'],
-                            'thumbnail': item['snippet']['thumbnails']['high']['url']  # 高解像度のサムネイルを使用
-                        })
-                        if len(latest_videos) >= max_results:
-                            break
+            # 現在の動画を除外
+            latest_videos = [
+                dict(video) for video in feed if video['id'].lower() != current_video_id
+            ][:max_results]
 
             if not latest_videos:
                 raise Exception("No other videos found in this channel")
@@ -90,26 +460,77 @@ class YouTubeHandler:
         except Exception as e:
             raise Exception(f"Error getting channel videos: {str(e)}")
 
-    def process_videos(self, urls: List[str]) -> List[Dict]:
-        """Process multiple YouTube videos."""
-        results = []
-        for url in urls:
+    def process_videos(self, urls: List[str], max_workers: Optional[int] = None,
+                       on_details: Optional[Callable[[Dict[str, Dict]], None]] = None,
+                       language: Optional[str] = None) -> List[Dict]:
+        """Process multiple YouTube videos concurrently.
+
+        Video details for all URLs are fetched with batched videos.list calls
+        while transcripts are fetched in parallel on a bounded thread pool.
+        Results keep the order of ``urls``; a URL that fails yields
+        ``{'url': ..., 'error': ...}`` instead of raising.
+
+        ``on_details`` is called with the video ID to details mapping as soon
+        as it is available, before the transcripts have finished, so callers
+        can start work that only needs the metadata. Transcripts are chosen
+        for a summary in ``language``.
+        """
+        results: List[Optional[Dict]] = [None] * len(urls)
+        pending = []
+
+        for index, url in enumerate(urls):
             try:
-                video_id = self.extract_video_id(url)
-                details = self.get_video_details(video_id)
-                transcript = self.get_transcript(video_id)
-                
-                results.append({
-                    'url': url,
-                    'video_id': video_id,
-                    'title': details['title'],
-                    'description': details['description'],
-                    'thumbnail': details['thumbnail'],  # サムネイル情報を追加
-                    'transcript': transcript
-                })
+                pending.append((index, url, self.extract_video_id(url)))
             except Exception as e:
-                results.append({
-                    'url': url,
-                    'error': str(e)
-                })
+                results[index] = {'url': url, 'error': str(e)}
+
+        if pending:
+            video_ids = [video_id for _, _, video_id in pending]
+            workers = max(1, min(max_workers or self.max_workers, len(pending) + 1))
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                # メタデータは1回のバッチ取得、字幕は動画ごとに並列取得
+                details_future = executor.submit(metrics.wrap(self.get_videos_details), video_ids)
+                get_transcript = metrics.wrap(self.get_transcript_track)
+                transcript_futures = [
+                    executor.submit(get_transcript, video_id, language)
+                    for video_id in video_ids
+                ]
+
+                try:
+                    all_details = details_future.result()
+                    details_error = None
+                except Exception as e:
+                    all_details = {}
+                    details_error = str(e)
+
+                if on_details is not None and details_error is None:
+                    on_details(all_details)
+
+                for (index, url, video_id), transcript_future in zip(pending, transcript_futures):
+                    try:
+                        if details_error is not None:
+                            raise Exception(details_error)
+                        if video_id not in all_details:
+                            raise ValueError("Video not found")
+                        details = all_details[video_id]
+                        track, transcript = transcript_future.result()
+
+                        results[index] = {
+                            'url': url,
+                            'video_id': video_id,
+                            'title': details['title'],
+                            'description': details['description'],
+                            'channel_id': details['channelId'],
+                            'channel_title': details.get('channelTitle'),
+                            'thumbnail': details['thumbnail'],  # サムネイル情報を追加
+                            'transcript': transcript.text,
+                            # 保存用（タイムスタンプ付きの字幕とその字幕トラック）
+                            'timed_transcript': transcript,
+                            'transcript_track': track
+                        }
+                    except Exception as e:
+                        results[index] = {
+                            'url': url,
+                            'error': str(e)
+                        }
         return results